@@ -0,0 +1,173 @@
+"""
+Dependency-ordered, concurrent builds of the [eups_packages] in a
+version file, and a cache of their build outputs.
+"""
+from __future__ import print_function, absolute_import
+import os
+import re
+import glob
+import json
+import hashlib
+import tarfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from fetch import download_and_extract
+
+_setup_pattern = re.compile(r'^\s*setup(?:Required|Optional)\(\s*["\']?([\w.-]+)',
+                            re.MULTILINE)
+
+
+def read_table(package_dir):
+    """
+    Return the EUPS product name of the package unpacked in
+    `package_dir` (which may be a glob pattern) and the names of the
+    products its ups table file sets up.  A package without a table
+    file has no product name and no dependencies.
+    """
+    tables = glob.glob(os.path.join(package_dir, 'ups', '*.table'))
+    if not tables:
+        return None, []
+    with open(tables[0]) as infile:
+        requires = _setup_pattern.findall(infile.read())
+    return os.path.basename(tables[0]).split('.')[0], requires
+
+
+def build_in_order(packages, fetch, build, table, jobs=1):
+    """
+    Fetch and build `packages`, a list of package names.
+
+    fetch(package) is called for all of the packages at once, using up
+    to `jobs` download workers.  Once a package is fetched, table(package)
+    returns its product name and the products it requires, as
+    read_table does.  build(package) is then called, using up to `jobs`
+    build workers, as soon as every other package in the list that
+    provides one of those products has been built, so downloads overlap
+    with builds and independent packages build concurrently.  Until it
+    is fetched, a package is taken to provide the product with its own
+    name.  Products from outside the list, e.g., from the DM stack, are
+    taken to be there already.  The first exception raised by fetch or build
+    cancels the queued calls and is re-raised.
+    """
+    products = {}
+    requires = {}
+    built = set()
+
+    def is_ready(package):
+        return all(other in built or
+                   products.get(other, other) not in requires[package]
+                   for other in packages if other != package)
+
+    with ThreadPoolExecutor(max_workers=max(jobs, 1)) as downloads, \
+         ThreadPoolExecutor(max_workers=max(jobs, 1)) as builds:
+        fetching = dict((downloads.submit(fetch, x), x) for x in packages)
+        building = {}
+        waiting = []
+        try:
+            while fetching or building or waiting:
+                for package in [x for x in waiting if is_ready(x)]:
+                    waiting.remove(package)
+                    building[builds.submit(build, package)] = package
+                if not fetching and not building:
+                    raise RuntimeError('circular dependencies among EUPS '
+                                       'packages: ' + ', '.join(waiting))
+                done, _ = wait(list(fetching) + list(building),
+                               return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future in fetching:
+                        package = fetching.pop(future)
+                        future.result()
+                        products[package], requires[package] = table(package)
+                        waiting.append(package)
+                    else:
+                        package = building.pop(future)
+                        future.result()
+                        built.add(package)
+        except BaseException:
+            for future in list(fetching) + list(building):
+                future.cancel()
+            raise
+
+
+class StackSession(object):
+    """
+    A DM stack set up once for all of the EUPS work of an install.
+    Sourcing loadLSST.bash activates the stack's conda environment,
+    which takes several seconds, so it is done once, on first use, and
+    the resulting environment is captured.  Each command then runs in
+    a bash started with that environment, which only needs EUPS'
+    setups.sh to define the setup function again.  Unlike a single
+    long-running shell, this lets independent builds run concurrently.
+    """
+    def __init__(self, stack_dir, eups_path, executable='/bin/bash'):
+        self.stack_dir = stack_dir.rstrip(os.path.sep)
+        self.eups_path = eups_path
+        self.executable = executable
+        self._env = None
+        self._lock = threading.Lock()
+
+    @property
+    def env(self):
+        with self._lock:
+            if self._env is None:
+                command = ('source %s/loadLSST.bash; '
+                           'export EUPS_PATH=%s:${EUPS_PATH}; env -0'
+                           % (self.stack_dir, self.eups_path))
+                output = subprocess.check_output(command, shell=True,
+                                                 executable=self.executable)
+                self._env = dict(item.split('=', 1) for item in
+                                 output.decode().split('\0') if '=' in item)
+        return self._env
+
+    def run(self, commands):
+        """Run `commands` in bash with the stack set up."""
+        env = self.env
+        prefix = ('source "${EUPS_DIR}/bin/setups.sh"; export EUPS_PATH="%s"; '
+                  % env['EUPS_PATH'])
+        subprocess.check_call(prefix + commands, shell=True,
+                              executable=self.executable, env=env)
+
+
+def build_key(package, version, digest, stack_dir, targets, requires=None):
+    """
+    Return the ArchiveCache key of the built tree of an EUPS package,
+    or None if the source has no digest, e.g., for a git clone.  The
+    key covers the package version, the sha256 of its source archive,
+    the DM stack it was built against, the scons targets and the
+    {package: digest} of the listed packages it `requires`, which must
+    all be known.
+    """
+    if digest is None or None in (requires or {}).values():
+        return None
+    build = [stack_dir.rstrip(os.path.sep), targets]
+    if requires:
+        build.append(sorted(requires.items()))
+    build = json.dumps(build)
+    return ('eups-build', package, str(version), digest,
+            hashlib.sha256(build.encode()).hexdigest())
+
+
+def store_build(cache, key, package_dir):
+    """Store the built tree in `package_dir` in the cache under `key`."""
+    filename = cache.tempfile()
+    try:
+        with tarfile.open(filename, 'w:gz') as tar:
+            tar.add(package_dir, os.path.basename(package_dir.rstrip('/')))
+        cache.put(key, filename)
+    finally:
+        if os.path.exists(filename):
+            os.remove(filename)
+
+
+def restore_build(cache, key, dest_dir='.'):
+    """
+    Unpack the built tree cached under `key` into `dest_dir`, replacing
+    the source tree there.  Returns False if there is none.
+    """
+    if cache is None or key is None:
+        return False
+    path = cache.get(key)
+    if path is None:
+        return False
+    download_and_extract('file://' + path, dest_dir)
+    return True
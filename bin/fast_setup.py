@@ -0,0 +1,118 @@
+"""
+Generation of setup-fast.sh, a frozen copy of the environment that an
+install's setup.sh produces.
+"""
+from __future__ import print_function, absolute_import
+import os
+import shlex
+import subprocess
+
+# Variables that describe the shell rather than the install.
+_skip_vars = ('_', 'PWD', 'OLDPWD', 'SHLVL', 'PS1')
+
+_separator = '--- setup.sh ---'
+
+# Search paths that setup.sh extends rather than sets.
+_inherited_vars = ('PYTHONPATH', 'LD_LIBRARY_PATH', 'LCATR_SCHEMA_PATH',
+                   'MANPATH')
+
+
+def _read_env(output):
+    return dict(item.split('=', 1) for item in output.split('\0')
+                if '=' in item)
+
+
+def resolve_env(setup_script, executable='/bin/bash'):
+    """
+    Source `setup_script` in a clean bash and return the environments
+    before and after as dicts.  Search path variables are set to
+    placeholders beforehand, so that references to their inherited
+    values can be found.
+    """
+    base_env = dict((key, os.environ[key]) for key in ('HOME', 'USER', 'LANG')
+                    if key in os.environ)
+    base_env['PATH'] = '/usr/bin:/bin'
+    for name in _inherited_vars:
+        base_env[name] = '/nonexistent/inherited-' + name
+    command = ('env -0; printf "\\0%s\\0"; source %s > /dev/null; env -0'
+               % (_separator, shlex.quote(setup_script)))
+    output = subprocess.check_output(command, shell=True,
+                                     executable=executable,
+                                     env=base_env).decode()
+    before, after = output.split('\0%s\0' % _separator)
+    return _read_env(before), _read_env(after)
+
+
+def _export(name, value, old_value):
+    # Keep values that extend an inherited variable, like PATH,
+    # relative to it, so the file still works from another shell.
+    if old_value and old_value in value and value != old_value:
+        prefix, suffix = value.split(old_value, 1)
+        return 'export %s=%s"${%s}"%s' % (name, shlex.quote(prefix), name,
+                                          shlex.quote(suffix))
+    return 'export %s=%s' % (name, shlex.quote(value))
+
+
+def watch_paths(env, extra_paths=()):
+    """
+    Return the paths whose modification means the frozen environment
+    may be stale: `extra_paths` plus the EUPS databases on EUPS_PATH
+    and the ups_db entries of the products that are set up.
+    """
+    paths = list(extra_paths)
+    products = [value.split()[0] for key, value in sorted(env.items())
+                if key.startswith('SETUP_') and value.strip()]
+    for eups_dir in env.get('EUPS_PATH', '').split(':'):
+        ups_db = os.path.join(eups_dir, 'ups_db')
+        if not eups_dir or not os.path.isdir(ups_db):
+            continue
+        paths.append(ups_db)
+        paths.extend(os.path.join(ups_db, x) for x in products
+                     if os.path.isdir(os.path.join(ups_db, x)))
+    return paths
+
+
+def write_fast_setup(inst_dir, extra_paths=(), executable='/bin/bash'):
+    """
+    Resolve the environment set up by <inst_dir>/setup.sh and write
+    <inst_dir>/setup-fast.sh, which exports it directly.  If any of the
+    watched paths (see watch_paths) has changed since setup-fast.sh
+    was written, setup-fast.sh sources setup.sh instead.  Returns the
+    path of the new file.
+    """
+    setup_script = os.path.join(inst_dir, 'setup.sh')
+    fast_script = os.path.join(inst_dir, 'setup-fast.sh')
+    before, after = resolve_env(setup_script, executable=executable)
+    paths = watch_paths(after, [setup_script] + list(extra_paths))
+
+    lines = ['# Generated from setup.sh by the installer; do not edit.',
+             'if [ -n "$(find %s -maxdepth 0 -newer %s 2>/dev/null)" ]; then'
+             % (' '.join(shlex.quote(x) for x in paths),
+                shlex.quote(fast_script)),
+             '    echo "setup-fast.sh is out of date; using setup.sh" >&2',
+             '    source %s' % shlex.quote(setup_script),
+             'else']
+    for name in sorted(set(before) - set(after)):
+        if name not in _skip_vars:
+            lines.append('unset %s' % name)
+    for name, value in sorted(after.items()):
+        if name in _skip_vars or before.get(name) == value:
+            continue
+        lines.append(_export(name, value, before.get(name)))
+    if 'EUPS_DIR' in after:
+        # The setup and unsetup functions are not in the environment,
+        # so have EUPS define them again, keeping the frozen search
+        # paths.
+        lines.extend(['_PATH="${PATH}" _EUPS_PATH="${EUPS_PATH}"',
+                      'source "${EUPS_DIR}/bin/setups.sh"',
+                      'export PATH="${_PATH}" EUPS_PATH="${_EUPS_PATH}"',
+                      'unset _PATH _EUPS_PATH'])
+    if 'MODULESHOME' in after:
+        lines.append('source "${MODULESHOME}/init/bash"')
+    lines.extend(['PS1="[jh]$ "', 'fi'])
+
+    tmp_script = fast_script + '.tmp'
+    with open(tmp_script, 'w') as output:
+        output.write('\n'.join(lines) + '\n')
+    os.rename(tmp_script, fast_script)
+    return fast_script
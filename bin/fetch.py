@@ -0,0 +1,480 @@
+"""
+Helpers for fetching and unpacking package archives, shared by
+install.py and jh_install.py.
+"""
+from __future__ import print_function, absolute_import
+import os
+import stat
+import errno
+import shutil
+import struct
+import hashlib
+import tarfile
+import tempfile
+import time
+import zlib
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from urllib.request import Request, urlopen
+from urllib.parse import urlparse
+
+_chunk_size = 1 << 16
+
+DEFAULT_CACHE_DIR = os.path.join('~', '.cache', 'lsst-release')
+
+# Bytes downloaded by each thread, for tracing installs.
+_downloads = threading.local()
+
+
+def bytes_downloaded():
+    """Return the number of bytes downloaded so far by this thread."""
+    return getattr(_downloads, 'nbytes', 0)
+
+
+def run_parallel(func, items, jobs=1):
+    """
+    Call func(*item) for each item using at most `jobs` worker threads
+    and return the results in the order of `items`.  If any call
+    raises, the remaining queued calls are cancelled and the first
+    exception is re-raised.
+    """
+    items = [tuple(item) for item in items]
+    if jobs <= 1 or len(items) <= 1:
+        return [func(*item) for item in items]
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(func, *item) for item in items]
+        try:
+            return [future.result() for future in futures]
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+
+
+class HostLimiter(object):
+    """Limit the number of concurrent downloads from each host."""
+    def __init__(self, max_per_host=4):
+        self.max_per_host = max_per_host
+        self._lock = threading.Lock()
+        self._semaphores = {}
+
+    @contextmanager
+    def slot(self, url):
+        host = urlparse(url).netloc
+        with self._lock:
+            semaphore = self._semaphores.setdefault(
+                host, threading.BoundedSemaphore(self.max_per_host))
+        with semaphore:
+            yield
+
+
+def sha256sum(path, blocksize=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as infile:
+        for block in iter(lambda: infile.read(blocksize), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def open_url(url, headers=None, timeout=60, method=None):
+    """Open `url` for streaming, following redirects."""
+    request = Request(url, headers=dict(headers or {}), method=method)
+    request.add_header('User-Agent', 'lsst-camera-dh-release')
+    return urlopen(request, timeout=timeout)
+
+
+def remote_size(url, timeout=30):
+    """
+    Return the size in bytes reported by the server for `url`, or None
+    if it cannot be determined.
+    """
+    try:
+        with open_url(url, timeout=timeout, method='HEAD') as response:
+            length = response.headers.get('Content-Length')
+    except (IOError, ValueError):
+        return None
+    return int(length) if length is not None else None
+
+
+class TeeReader(object):
+    """
+    File-like wrapper that copies everything read from `fileobj` to
+    `outfile` (if given) while computing its sha256 and size.
+    """
+    def __init__(self, fileobj, outfile=None):
+        self.fileobj = fileobj
+        self.outfile = outfile
+        self.sha256 = hashlib.sha256()
+        self.nbytes = 0
+
+    def read(self, size=-1):
+        data = self.fileobj.read(size)
+        self.sha256.update(data)
+        self.nbytes += len(data)
+        if self.outfile is not None:
+            self.outfile.write(data)
+        return data
+
+    def drain(self):
+        """Read the remainder of the stream, e.g., trailing padding."""
+        while self.read(_chunk_size):
+            pass
+
+
+class ArchiveCache(object):
+    """
+    Content-addressed store of downloaded archives shared by all
+    install directories on a host.  Each archive is stored once as
+    blobs/<sha256>, and refs/<key...> files map an (org, package,
+    version) key to the digest of its archive.  When the blobs exceed
+    max_bytes, the least recently used ones are evicted, except for
+    blobs used in the last `min_age` seconds, which may still be in use
+    by a running install.
+    """
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=10*1024**3,
+                 min_age=3600):
+        self.cache_dir = os.path.abspath(os.path.expanduser(cache_dir))
+        self.max_bytes = max_bytes
+        self.min_age = min_age
+        self.blob_dir = os.path.join(self.cache_dir, 'blobs')
+        self.ref_dir = os.path.join(self.cache_dir, 'refs')
+        self.tmp_dir = os.path.join(self.cache_dir, 'tmp')
+        for path in (self.blob_dir, self.ref_dir, self.tmp_dir):
+            if not os.path.isdir(path):
+                os.makedirs(path)
+
+    def _ref_path(self, key):
+        return os.path.join(self.ref_dir, *[str(x) for x in key])
+
+    def blob_path(self, digest):
+        return os.path.join(self.blob_dir, digest)
+
+    def digest(self, key):
+        """Return the sha256 recorded for `key`, or None."""
+        try:
+            with open(self._ref_path(key)) as ref:
+                return ref.read().strip()
+        except IOError:
+            return None
+
+    def get(self, key):
+        """
+        Return the path of the cached archive for `key`, or None if it
+        is not cached.  A hit marks the blob as recently used.
+        """
+        digest = self.digest(key)
+        if digest is None:
+            return None
+        path = self.blob_path(digest)
+        try:
+            os.utime(path, None)
+        except OSError:
+            # Evicted since the ref was written.
+            return None
+        return path
+
+    def put(self, key, filename, digest=None):
+        """
+        Move `filename` into the cache under `key` and return the path
+        of the stored blob.  `digest` is the sha256 of the file, if
+        already known.
+        """
+        if digest is None:
+            digest = sha256sum(filename)
+        path = self.blob_path(digest)
+        os.chmod(filename, 0o644)
+        os.rename(filename, path)
+        ref_path = self._ref_path(key)
+        if not os.path.isdir(os.path.dirname(ref_path)):
+            try:
+                os.makedirs(os.path.dirname(ref_path))
+            except OSError as eobj:
+                if eobj.errno != errno.EEXIST:
+                    raise
+        tmp_ref = self.tempfile()
+        with open(tmp_ref, 'w') as ref:
+            ref.write(digest + '\n')
+        os.rename(tmp_ref, ref_path)
+        self.evict(keep=path)
+        return path
+
+    def tempfile(self):
+        """Return the name of a new, unique file in the cache."""
+        fd, filename = tempfile.mkstemp(dir=self.tmp_dir)
+        os.close(fd)
+        return filename
+
+    def evict(self, keep=None):
+        """Remove least recently used blobs until under max_bytes."""
+        cutoff = time.time() - self.min_age
+        blobs = []
+        for name in os.listdir(self.blob_dir):
+            path = os.path.join(self.blob_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            blobs.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in blobs)
+        for mtime, size, path in sorted(blobs):
+            if total <= self.max_bytes:
+                break
+            if path == keep or mtime > cutoff:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+
+
+def _safe_path(dest_dir, name):
+    path = os.path.normpath(os.path.join(dest_dir, name))
+    if os.path.isabs(name) or not path.startswith(dest_dir + os.path.sep):
+        raise RuntimeError("archive member outside of target directory: "
+                           + name)
+    return path
+
+
+def extract_tar(fileobj, dest_dir):
+    """Unpack a gzipped tar stream read sequentially from `fileobj`."""
+    with tarfile.open(fileobj=fileobj, mode='r|gz') as tar:
+        if hasattr(tarfile, 'data_filter'):
+            tar.extractall(dest_dir, filter='data')
+        else:
+            for member in tar:
+                _safe_path(dest_dir, member.name)
+                tar.extract(member, dest_dir)
+
+
+class _ZipStream(object):
+    """Sequential reader for a zip stream with one chunk of look-ahead."""
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.buffer = b''
+
+    def read(self, size):
+        """Read up to `size` bytes."""
+        if not self.buffer:
+            self.buffer = self.fileobj.read(max(size, _chunk_size))
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+    def read_exact(self, size):
+        data = b''
+        while len(data) < size:
+            chunk = self.read(size - len(data))
+            if not chunk:
+                raise RuntimeError("truncated zip stream")
+            data += chunk
+        return data
+
+    def unread(self, data):
+        self.buffer = data + self.buffer
+
+
+_zip_local_header = struct.Struct('<4sHHHHHIIIHH')
+_zip_central_header = struct.Struct('<4sHHHHHHIIIHHHHHII')
+
+
+def _zip64_extra(extra):
+    # Return whether the extra field holds zip64 size information.
+    while len(extra) >= 4:
+        tag, length = struct.unpack('<HH', extra[:4])
+        if tag == 1:
+            return True
+        extra = extra[4 + length:]
+    return False
+
+
+def _zip_sizes(extra, csize, usize):
+    # Replace 32-bit sizes flagged as 0xffffffff with their zip64 values.
+    while len(extra) >= 4:
+        tag, length = struct.unpack('<HH', extra[:4])
+        if tag == 1:
+            values = list(struct.unpack('<%dQ' % (length//8),
+                                        extra[4:4 + length]))
+            if usize == 0xffffffff:
+                usize = values.pop(0)
+            if csize == 0xffffffff:
+                csize = values.pop(0)
+            break
+        extra = extra[4 + length:]
+    return csize, usize
+
+
+def extract_zip(fileobj, dest_dir):
+    """
+    Unpack a zip stream read sequentially from `fileobj`, using the
+    local file headers, so that memory use does not depend on the
+    archive size.  Unix permissions and symlinks, which are only
+    recorded in the central directory at the end of the archive, are
+    applied once it has been reached.
+    """
+    stream = _ZipStream(fileobj)
+    while True:
+        signature = stream.read_exact(4)
+        stream.unread(signature)
+        if signature != b'PK\x03\x04':
+            break
+        (_, _, flags, method, _, _, crc, csize, usize, name_len,
+         extra_len) = _zip_local_header.unpack(
+             stream.read_exact(_zip_local_header.size))
+        name = stream.read_exact(name_len).decode('utf-8')
+        extra = stream.read_exact(extra_len)
+        csize, usize = _zip_sizes(extra, csize, usize)
+        has_descriptor = flags & 0x08
+        if flags & 0x01:
+            raise RuntimeError("encrypted zip member: " + name)
+        if method not in (0, 8) or (method == 0 and has_descriptor
+                                    and not name.endswith('/')):
+            raise RuntimeError("unsupported zip member: " + name)
+        path = _safe_path(dest_dir, name)
+        if name.endswith('/'):
+            if not os.path.isdir(path):
+                os.makedirs(path)
+            output = None
+        else:
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            output = open(path, 'wb')
+        try:
+            actual_crc = 0
+            if method == 0:
+                remaining = csize
+                while remaining:
+                    data = stream.read(min(remaining, _chunk_size))
+                    if not data:
+                        raise RuntimeError("truncated zip stream")
+                    remaining -= len(data)
+                    actual_crc = zlib.crc32(data, actual_crc)
+                    if output is not None:
+                        output.write(data)
+            else:
+                decompressor = zlib.decompressobj(-15)
+                while not decompressor.eof:
+                    data = decompressor.unconsumed_tail \
+                        or stream.read(_chunk_size)
+                    if not data:
+                        raise RuntimeError("truncated zip stream")
+                    data = decompressor.decompress(data, _chunk_size)
+                    actual_crc = zlib.crc32(data, actual_crc)
+                    if output is not None:
+                        output.write(data)
+                stream.unread(decompressor.unused_data)
+        finally:
+            if output is not None:
+                output.close()
+        if has_descriptor:
+            descriptor = stream.read_exact(4)
+            if descriptor == b'PK\x07\x08':
+                descriptor = stream.read_exact(4)
+            crc = struct.unpack('<I', descriptor)[0]
+            # The sizes are 4 bytes each, or 8 bytes each for zip64.
+            stream.read_exact(16 if _zip64_extra(extra) else 8)
+        if actual_crc & 0xffffffff != crc:
+            raise RuntimeError("CRC mismatch for zip member: " + name)
+
+    # Central directory: restore Unix modes and symlinks.
+    while stream.read_exact(4) == b'PK\x01\x02':
+        fields = _zip_central_header.unpack(
+            b'PK\x01\x02' + stream.read_exact(_zip_central_header.size - 4))
+        version_made, name_len, extra_len, comment_len = \
+            fields[1], fields[10], fields[11], fields[12]
+        mode = fields[15] >> 16
+        name = stream.read_exact(name_len).decode('utf-8')
+        stream.read_exact(extra_len + comment_len)
+        if version_made >> 8 != 3 or not mode:
+            continue
+        path = _safe_path(dest_dir, name)
+        if stat.S_ISLNK(mode):
+            with open(path) as link:
+                target = link.read()
+            os.remove(path)
+            os.symlink(target, path)
+        else:
+            os.chmod(path, stat.S_IMODE(mode))
+    while stream.read(_chunk_size):
+        pass
+
+
+@contextmanager
+def _no_limit():
+    yield
+
+
+def _replace(src, dest):
+    if os.path.islink(dest) or os.path.isfile(dest):
+        os.remove(dest)
+    elif os.path.isdir(dest):
+        shutil.rmtree(dest)
+    os.rename(src, dest)
+
+
+def download_and_extract(url, dest_dir='.', cache=None, key=None,
+                         archive_format='tar', limiter=None, sha256=None):
+    """
+    Stream the archive at `url` straight into `dest_dir` without
+    writing it to disk first.  `archive_format` is 'tar' for gzipped
+    tarballs or 'zip'.  The archive is unpacked in a staging directory
+    and its top-level entries then replace any existing ones, so a
+    failed download never leaves a half-unpacked tree behind.  If an
+    ArchiveCache is given, the archive is read from the cache under
+    `key`, or stored there while it is being unpacked.  A HostLimiter
+    may be given to bound the number of concurrent downloads from the
+    server.  If the expected `sha256` of the archive is given, e.g.,
+    from a lockfile, a cached blob with that digest is used whatever its
+    key, and an archive with a different digest is neither cached nor
+    unpacked into `dest_dir`.  Returns the sha256 of the archive.
+    """
+    dest_dir = os.path.abspath(dest_dir)
+    extract = extract_tar if archive_format == 'tar' else extract_zip
+    staging_dir = tempfile.mkdtemp(prefix='.partial-', dir=dest_dir)
+    try:
+        cached = None
+        if cache is not None:
+            digest = cache.digest(key)
+            cached = cache.get(key)
+            if sha256 is not None and digest != sha256:
+                digest = sha256
+                cached = cache.blob_path(sha256)
+                try:
+                    os.utime(cached, None)
+                except OSError:
+                    cached = None
+        if cached is not None:
+            with open(cached, 'rb') as archive:
+                extract(archive, staging_dir)
+        else:
+            filename = cache.tempfile() if cache is not None else None
+            try:
+                with (limiter.slot(url) if limiter is not None
+                      else _no_limit()), open_url(url) as response:
+                    output = None if filename is None \
+                        else open(filename, 'wb')
+                    try:
+                        reader = TeeReader(response, output)
+                        extract(reader, staging_dir)
+                        reader.drain()
+                        if urlparse(url).scheme != 'file':
+                            _downloads.nbytes = (bytes_downloaded()
+                                                 + reader.nbytes)
+                    finally:
+                        if output is not None:
+                            output.close()
+                digest = reader.sha256.hexdigest()
+                if sha256 is not None and digest != sha256:
+                    raise RuntimeError("sha256 of %s is %s, expected %s"
+                                       % (url, digest, sha256))
+                if filename is not None:
+                    cache.put(key, filename, digest)
+            finally:
+                if filename is not None and os.path.exists(filename):
+                    os.remove(filename)
+        for name in os.listdir(staging_dir):
+            _replace(os.path.join(staging_dir, name),
+                     os.path.join(dest_dir, name))
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+    return digest
@@ -0,0 +1,79 @@
+"""
+Consolidation of the Python directories of an install into a single
+import root, so that PYTHONPATH needs one entry instead of one per
+package.
+"""
+from __future__ import print_function, absolute_import
+import os
+import shutil
+from importlib.machinery import all_suffixes
+
+IMPORT_ROOT = 'python-root'
+
+
+def _importable(path):
+    name = os.path.basename(path)
+    if name == '__pycache__' or name.startswith('.'):
+        return False
+    if os.path.isdir(path):
+        return True
+    return any(name.endswith(x) for x in all_suffixes())
+
+
+def _is_namespace(path):
+    return (os.path.isdir(path) and
+            not os.path.exists(os.path.join(path, '__init__.py')))
+
+
+def _link_tree(root, sources, collisions, prefix=''):
+    """
+    Link the importable entries of the `sources` directories into
+    `root`.  Entries earlier in `sources` shadow later ones, as on
+    PYTHONPATH, and namespace packages found in several sources are
+    merged into a directory of their own.
+    """
+    entries = {}
+    for source in sources:
+        for name in sorted(os.listdir(source)):
+            path = os.path.join(source, name)
+            if _importable(path):
+                entries.setdefault(name, []).append(path)
+    for name, paths in sorted(entries.items()):
+        target = os.path.join(root, name)
+        # A regular package anywhere on the path wins over namespace
+        # package portions.
+        regular = [x for x in paths if not _is_namespace(x)]
+        if not regular and len(paths) > 1:
+            os.mkdir(target)
+            _link_tree(target, paths, collisions, prefix + name + '/')
+            continue
+        used = regular[0] if regular else paths[0]
+        os.symlink(used, target)
+        collisions.extend((prefix + name, used, x) for x in paths
+                          if x != used)
+
+
+def build_import_root(root, python_dirs):
+    """
+    Replace `root` with a symlink farm of the modules and packages in
+    `python_dirs`, in PYTHONPATH order.  Returns the collisions as
+    (name, used path, shadowed path) tuples.
+    """
+    root = os.path.abspath(root)
+    staging = '%s.tmp-%d' % (root, os.getpid())
+    if os.path.lexists(staging):
+        shutil.rmtree(staging)
+    os.mkdir(staging)
+    collisions = []
+    _link_tree(staging, [os.path.abspath(x) for x in python_dirs
+                         if os.path.isdir(x)], collisions)
+    if os.path.isdir(root):
+        shutil.rmtree(root)
+    os.rename(staging, root)
+    return collisions
+
+
+def format_collisions(collisions):
+    lines = ['%s: using %s, shadowing %s' % x for x in collisions]
+    lines.append('%d name collisions in the import root' % len(collisions))
+    return '\n'.join(lines)
@@ -1,140 +1,376 @@
 #!/usr/bin/env python
 from __future__ import print_function, absolute_import
 import os
+import sys
 import glob
+import json
 import shutil
 import subprocess
-import warnings
+import time
+import argparse
+from collections import OrderedDict
+from fetch import run_parallel, download_and_extract, open_url
+from installer_base import InstallerBase, add_arguments, installer_args
+from upgrade_plan import format_plan, changed, LINK_TOKENS
+from eups_build import read_table, build_key, store_build, restore_build
+from import_root import IMPORT_ROOT
+from precompile import compile_tree
+from preflight import PROBE_JOBS, probe_url, probe_git, link_problems, \
+    run_probes, format_problems
+from lockfile import compile_lock, archive_digest
+from version_file import Parfile, load_version_files
+from package_store import PackageStore, LINK_MODES
+from install_gc import remove_paths
+from modules_build import modules_url, modules_prefix, build_modules, \
+    link_modules
 try:
     import ConfigParser as configparser
 except ImportError:
     import configparser
 
-class Parfile(dict):
-    def __init__(self, infile, section):
-        super(Parfile, self).__init__()
-        parser = configparser.ConfigParser()
-        parser.optionxform = str
-        result = parser.read(infile)
-        if not result:
-            raise RuntimeError("invalid or empty config file: {f}".format(f=infile))
-        for key, value in parser.items(section):
-            self[key] = self._cast(value)
-    def _cast(self, value):
-        if value == 'None':
-            return None
-        try:
-            if value.find('.') == -1 and value.find('e') == -1:
-                return int(value)
-            else:
-                return float(value)
-        except ValueError:
-            # Cannot cast as either int or float so just return the
-            # value as-is (presumably a string).
-            return value
-
-class Installer(object):
-    _executable = '/bin/bash'
-    _github_org = 'https://github.com/lsst-camera-dh'
-    _github_elec_org = 'https://github.com/lsst-camera-electronics'
-    def __init__(self, version_file, inst_dir='.', python_exec='python',
-                 hj_folders=('BNL_T03',), site='BNL'):
-        self.version_file = os.path.abspath(version_file)
-        if inst_dir is not None:
-            self.inst_dir = os.path.abspath(inst_dir)
-            shutil.copy(self.version_file,
-                        os.path.join(self.inst_dir, 'installed_versions.txt'))
-        self.python_exec = python_exec
-        self.hj_folders = hj_folders
-        self.site = site
-        self._package_dirs = None
-        self._stack_dir = None
+class Installer(InstallerBase):
+    _nexus_url = 'http://repo-nexus.lsst.org/nexus/service/rest/v1/search/assets/download?repository=ccs-maven2-public&maven.groupId=org.lsst&maven.classifier=dist&maven.extension=zip&sort=version'
+    def __init__(self, version_file, *args, **kwds):
+        store = kwds.pop('store', None)
+        super(Installer, self).__init__(version_file, *args, **kwds)
+        self.store = store
         self._datacat_pars = None
-        self.curdir = os.path.abspath('.')
-        try:
-            self.pars = Parfile(self.version_file, 'jh')
-        except configparser.NoSectionError:
-            pass
 
     def modules_install(self):
-        url = 'http://sourceforge.net/projects/modules/files/Modules/modules-3.2.10/modules-3.2.10.tar.gz'
+        if self.cache is not None:
+            # Build Modules once in the cache directory and link to it.
+            modules_home = build_modules(
+                modules_prefix(self.cache.cache_dir, '3.2.10'), '3.2.10',
+                cache=self.cache, build_jobs=self.build_jobs,
+                executable=self._executable)
+            link_modules(modules_home, self.inst_dir, '3.2.10')
+            return
+        url = modules_url('3.2.10')
         inst_dir = self.inst_dir
+        build_jobs = self.build_jobs
         commands = ";".join(["curl -L -O %(url)s",
                              "tar xzf modules-3.2.10.tar.gz",
                              "cd modules-3.2.10",
                              "./configure --prefix=%(inst_dir)s",
-                             "make",
+                             "make -j %(build_jobs)d",
                              "make install",
                              "cd %(inst_dir)s"]) % locals()
         subprocess.check_call(commands, shell=True, executable=self._executable)
 
-    @staticmethod
-    def github_download(package_name, version):
-        if  not package_name.startswith('REB_'):
-            url = '/'.join((Installer._github_org, package_name, 'archive',
-                        version + '.tar.gz'))
-        else:
-            url = '/'.join((Installer._github_elec_org, package_name, 'archive',
-                        version + '.tar.gz'))
-        commands = ["curl -L -O " + url,
-                    "tar xzf %(version)s.tar.gz" % locals()]
-        for command in commands:
-            subprocess.check_call(command, shell=True,
-                            executable=Installer._executable)
+    def _install_modules(self):
+        modules_dir = os.path.join(self.inst_dir, 'Modules', '3.2.10')
+        modules_inputs = dict(version='3.2.10',
+                              shared=self.cache is not None)
+        if not self.state.is_current('modules', modules_inputs):
+            with self.state.step('modules', modules_inputs,
+                                 outputs=[modules_dir]), \
+                 self.tracer.span('build', 'modules', '3.2.10',
+                                  outputs=[modules_dir]):
+                self.modules_install()
+
+    def _github_fetch(self, package_name, version):
+        entry = self._locked(package_name)
+        with self.tracer.span('fetch', package_name, version,
+                              outputs=['%s-%s' % (package_name, version)]):
+            section = self._jh_section(package_name)
+            if section == 'eups_packages':
+                shared = self._stored_build(package_name, version)
+            else:
+                shared = self._store_tree(section, package_name, version)
+            if shared is not None:
+                self.store.link(shared[0], os.path.join(
+                    self.inst_dir, '%s-%s' % (package_name, version)))
+                return shared[1]
+            if entry is not None:
+                _, key = self.github_archive(package_name, version)
+                return download_and_extract(entry.url, cache=self.cache,
+                                            key=key, sha256=entry.sha256)
+            return self.github_download(package_name, version,
+                                        cache=self.cache)
+
+    def _archive_url(self, section, package_name, version):
+        entry = self.lock.get((section, package_name))
+        if entry is not None and entry.sha256 is not None:
+            key = self._source_url(section, package_name, version)[1]
+            return entry.url, key
+        return self._source_url(section, package_name, version)
+
+    def _jh_section(self, package_name):
+        """Return the section of the version file listing a package."""
+        for section in ('jh', 'eups_packages', 'packages'):
+            if section in self.versions and package_name in \
+               self.versions[section]:
+                return section
+        return None
+
+    def _shared(self, section, version):
+        """
+        Return whether a package version is shared through the package
+        store: branches and SNAPSHOTs change upstream, and EUPS packages
+        are built in their trees (the built trees are shared by
+        _eups_build).
+        """
+        version = str(version)
+        return not (self.store is None or
+                    section in (None, 'eups_packages') or
+                    version == 'master' or 'SNAPSHOT' in version)
+
+    def _gc_store(self, removed, dry_run=False):
+        if self.store is None:
+            return 0
+        return remove_paths(self.store.store_dir,
+                            self.store.unused(removed=removed),
+                            dry_run=dry_run, jobs=self.jobs)
+
+    def _store_tree(self, section, package_name, version):
+        """
+        Return the (path, digest) of the tree of a package in the package
+        store, unpacking or cloning it there first if needed, or None if
+        the package is not shared.  Stored trees are never modified, so
+        their Python code is byte-compiled before they are stored.
+        """
+        version = str(version)
+        if not self._shared(section, version):
+            return None
+        entry = self.lock.get((section, package_name))
+        archive = self._archive_url(section, package_name, version)
+        if archive is None:
+            # A CCS package cloned from GitHub.
+            package_name = package_name.replace('github.', '')
+            commit = getattr(entry, 'commit', None)
+            key = ('git', package_name, version) + ((commit,) if commit
+                                                     else ())
+
+            def clone(dest_dir):
+                self.github_clone(package_name, version, commit=commit,
+                                  parent_dir=dest_dir)
+            return self.store.ensure(key, clone)
+        url, key = archive
+        sha256 = getattr(entry, 'sha256', None)
+        if sha256 is not None:
+            key += (sha256,)
+
+        def unpack(dest_dir):
+            digest = download_and_extract(
+                url, dest_dir, cache=self.cache, key=archive[1],
+                archive_format='zip' if section == 'ccs' else 'tar',
+                limiter=self.limiter, sha256=sha256)
+            if self.precompile and section != 'ccs':
+                for python_dir in glob.glob(os.path.join(dest_dir, '*',
+                                                         'python')):
+                    compile_tree(python_dir, self.python_exec)
+            return digest
+        return self.store.ensure(key, unpack)
+
+    def _eups_build_key(self, package, version, digest):
+        return build_key(package, version, digest,
+                         self.stack_dir.rstrip(os.path.sep),
+                         self._scons_targets(package),
+                         requires=self._eups_requires(package))
+
+    def _stored_build(self, package, version):
+        """
+        Return the (path, digest) of the build of an EUPS package that
+        another install stored in the package store, or None.  This
+        only needs the digest of the source archive, from the lockfile
+        or the archive cache, and the ups tables of the stored sources,
+        so the package need not be unpacked.
+        """
+        if self.store is None or self.stack_dir is None:
+            return None
+        digest = self._source_digest('eups', package, version)
+        key = self._eups_build_key(package, version, digest)
+        tree = self.store.tree(key) if key is not None else None
+        return (tree, digest) if tree is not None else None
+
+    def _eups_table(self, package, version):
+        package_dir = '%s-%s' % (package, version)
+        if self.store is None or os.path.isdir(package_dir):
+            return read_table(package_dir)
+        # A package linked from the store later: the tables of the same
+        # sources, stored with their build.
+        digest = self._source_digest('eups', package, version)
+        tables = (self.store.tree(('eups-tables', package, str(version),
+                                   digest)) if digest is not None else None)
+        return read_table(os.path.dirname(tables) if tables is not None
+                          else package_dir)
+
+    def _store_build(self, key, package, version, digest):
+        """
+        Move the build of an EUPS package into the package store, with a
+        copy of its ups tables under its source digest for _eups_table.
+        """
+        stored = self.store.adopt(key, os.path.join(
+            self.inst_dir, '%s-%s' % (package, version)))
+        ups_dir = os.path.join(stored, 'ups')
+        if digest is None or not os.path.isdir(ups_dir):
+            return
+
+        def copy_tables(dest_dir):
+            shutil.copytree(ups_dir, os.path.join(dest_dir, 'ups'))
+        self.store.ensure(('eups-tables', package, str(version), digest),
+                          copy_tables)
+
+    def packages(self):
+        """
+        Return the (section, package, version string) of every package
+        that jh() and ccs() install from the version file.
+        """
+        packages = []
+        if hasattr(self, 'pars'):
+            packages.extend((self._step_sections[kind], package, str(version))
+                            for kind, package, version in self._jh_steps())
+        packages.extend(('ccs', name, str(version)) for name, version
+                        in self._ccs_pars().items()
+                        if not name.startswith(LINK_TOKENS))
+        return packages
+
+    def prefetch(self, section, package_name, version):
+        """
+        Fetch a package into the package store, or an EUPS package into
+        the archive cache, without installing it.
+        """
+        if section == 'eups_packages':
+            if self.cache is not None:
+                url, key = self._archive_url(section, package_name, version)
+                archive_digest(url, self.cache, key, self.limiter)
+            return
+        self._store_tree(section, package_name, version)
+
+    def _source_url(self, section, package_name, version):
+        if section != 'ccs':
+            return self.github_archive(package_name, version)
+        if package_name.startswith('github.') or not (
+                package_name.startswith('nexus.') or
+                package_name.startswith('org-lsst')):
+            return None
+        package_name = package_name.replace('nexus.', '')
+        return (self.nexus_url(package_name, version),
+                ('nexus', package_name, version))
+
+    def preflight_probes(self, sections=('jh', 'ccs')):
+        """
+        Return the (description, probe, args) of each archive and git
+        repository that installing `sections` of the version file
+        would fetch.
+        """
+        probes = []
+        if 'jh' in sections and hasattr(self, 'pars'):
+            for kind, package, version in self._jh_steps():
+                url, _ = self.github_archive(package, version)
+                probes.append(('[%s] %s %s' % (self._step_sections[kind],
+                                               package, version),
+                               probe_url, (url,)))
+        if 'ccs' in sections:
+            for name, version in self._ccs_pars().items():
+                if name.startswith(('symlink.', 'executable.')):
+                    continue
+                version = str(version)
+                description = '[ccs] %s %s' % (name, version)
+                archive = self._archive_url('ccs', name, version)
+                if archive is None:
+                    url = '/'.join((self._github_org,
+                                    name.replace('github.', '')))
+                    probes.append((description, probe_git, (url, version)))
+                else:
+                    probes.append((description, probe_url, (archive[0],)))
+        return probes
+
+    def _ccs_pars(self, section='ccs'):
+        try:
+            return self._section(section)
+        except configparser.NoSectionError:
+            return {}
+
+    def ccs_link_problems(self, section='ccs'):
+        """
+        Check that the symlink. and executable. entries of the [ccs]
+        section point at packages that the section installs.
+        """
+        pars = self._ccs_pars(section)
+        names = set(['bin'])
+        links = []
+        for name, value in pars.items():
+            if name.startswith('symlink.'):
+                names.add(name.replace('symlink.', ''))
+                links.append(('[%s] %s' % (section, name), str(value)))
+            elif name.startswith('executable.'):
+                links.append(('[%s] %s' % (section, name),
+                              '../%s/bin/CCSbootstrap.sh' % value))
+            else:
+                package = name.replace('github.', '').replace('nexus.', '')
+                names.update((package, '%s-%s' % (package, value)))
+        return link_problems(links, names)
+
+    def check(self, sections=('jh', 'ccs')):
+        """
+        Probe everything that installing `sections` would fetch and
+        check the CCS links, without downloading anything.  Returns a
+        list of (description, problem).
+        """
+        problems = run_probes(self.preflight_probes(sections),
+                              jobs=max(self.jobs, PROBE_JOBS))
+        if 'jh' in sections and not hasattr(self, 'pars'):
+            problems.append(('[jh]', 'no [jh] section in the package list'))
+        if 'ccs' in sections:
+            problems.extend(self.ccs_link_problems())
+        return problems
+
+    def _lock_source(self, section, package_name, version):
+        """Return where a package is fetched from, for lock_entry."""
+        archive = self._source_url(section, package_name, version)
+        if archive is None:
+            url = '/'.join((self._github_org,
+                            package_name.replace('github.', '')))
+            return ('git', url, version)
+        if 'SNAPSHOT' in version:
+            # Lock the SNAPSHOT build that is current now.
+            asset = self.nexus_asset(archive[1][1], version)
+            if asset is not None:
+                return ('archive', asset[0], None)
+            return ('archive', archive[0], None)
+        return ('archive',) + archive
+
+    def write_lock(self, lockfile):
+        """
+        Compile the version file into a lockfile, resolving the URL,
+        size and sha256 of every archive and the commit of every git
+        repository.  The archives are added to the cache on the way.
+        """
+        return compile_lock(self.version_file, lockfile, self._lock_source,
+                            cache=self.cache, limiter=self.limiter,
+                            jobs=self.jobs)
 
     @staticmethod
-    def github_clone(package_name, version):
+    def github_clone(package_name, version, commit=None, parent_dir='.'):
         if not version:
             version = 'master'
 
         dir_name = package_name+'-'+version
-        if os.path.exists(dir_name):
-            commands = ["cd " + dir_name, "git pull", "cd .."]
+        if commit is not None:
+            # Check out the commit recorded in a lockfile.
+            if os.path.exists(os.path.join(parent_dir, dir_name)):
+                command = "cd " + dir_name + "; git fetch -q origin"
+            else:
+                command = 'git clone --branch '+version+' '+'/'.join((Installer._github_org, package_name))+' '+dir_name+'; cd '+dir_name
+            command += ' && git checkout -q ' + commit
+        elif os.path.exists(os.path.join(parent_dir, dir_name)):
+            # Only a branch can be pulled; a tag checkout stays as it is.
+            command = ("cd " + dir_name + "; if git symbolic-ref -q HEAD "
+                       ">/dev/null; then git pull; fi")
         else:
-            commands = ['git clone --branch '+version+' '+'/'.join((Installer._github_org, package_name))+' '+dir_name]
-
-        subprocess.check_call(commands, shell=True,
-                            executable=Installer._executable)
-
-        Installer.ccs_symlink(package_name, dir_name)
-
-    def lcatr_install(self, package_name):
-        version = self.pars[package_name]
-        self.github_download(package_name, version)
-        inst_dir = self.inst_dir
-        python_exec = self.python_exec
-        command = "cd %(package_name)s-%(version)s/; %(python_exec)s setup.py install --prefix=%(inst_dir)s" % locals()
-        subprocess.check_call(command, shell=True, executable=self._executable)
+            command = 'git clone --branch '+version+' '+'/'.join((Installer._github_org, package_name))+' '+dir_name
 
-    @property
-    def package_dirs(self):
-        if self._package_dirs is None:
-            self._package_dirs = {}
-            try:
-                pars = Parfile(self.version_file, 'packages')
-                for package, version in pars.items():
-                    package_dir = "%(package)s-%(version)s" % locals()
-                    self._package_dirs[package] = os.path.join(self.inst_dir,
-                                                               package_dir)
-            except configparser.NoSectionError:
-                pass
-        return self._package_dirs
-
-    @property
-    def stack_dir(self):
-        if self._stack_dir is None:
-            try:
-                pars = Parfile(self.version_file, 'dmstack')
-                self._stack_dir = pars['stack_dir']
-            except configparser.NoSectionError:
-                pass
-        return self._stack_dir
+        subprocess.check_call(command, shell=True,
+                              executable=Installer._executable,
+                              cwd=parent_dir)
+        return dir_name
 
     @property
     def datacat_pars(self):
         if self._datacat_pars is None:
             try:
-                self._datacat_pars = Parfile(self.version_file, 'datacat')
+                self._datacat_pars = self.versions['datacat']
             except configparser.NoSectionError:
                 pass
         return self._datacat_pars
@@ -163,7 +399,7 @@ setup obs_lsst
 
     def _eups_config(self):
         try:
-            pars = Parfile(self.version_file, 'eups_packages')
+            pars = self._section('eups_packages')
         except configparser.NoSectionError:
             return ''
         return '\n'.join(['setup %s' % package for package in pars]) + '\n'
@@ -178,41 +414,11 @@ setup obs_lsst
         return """export HARNESSEDJOBSDIR=${INST_DIR}/harnessed-jobs-%(hj_version)s
 export VIRTUAL_ENV=${INST_DIR}
 source ${INST_DIR}/Modules/3.2.10/init/bash
+export MODULEPATH=${INST_DIR}/Modules/modulefiles
 export PATH=%(bin_path)s
 export SITENAME=%(site)s
 """ % locals()
 
-    def _schema_paths(self):
-        paths = []
-        for package, package_dir in self.package_dirs.items():
-            if not os.path.isdir(os.path.join(package_dir, 'schemas')):
-                continue
-            paths.append("${%s}/schemas" % self._env_var(package))
-        paths.extend(['${HARNESSEDJOBSDIR}/schemas', '${LCATR_SCHEMA_PATH}'])
-        return 'export LCATR_SCHEMA_PATH=' + ':'.join(paths) + '\n'
-
-    def _package_env_vars(self):
-        contents = ""
-        for package, package_dir in self.package_dirs.items():
-            subdir = os.path.split(package_dir.rstrip(os.path.sep))[-1]
-            env_var = self._env_var(package)
-            contents += ("export %s=${INST_DIR}/%s\n" % (env_var, subdir))
-        return contents
-
-    @staticmethod
-    def _env_var(package_name):
-        return package_name.replace('-', '').upper() + 'DIR'
-
-    def _module_path(self):
-        try:
-            module_path = glob.glob('%s/lib/python*/site-packages'
-                                    % self.inst_dir)[0][len(self.inst_dir):]
-            return os.path.join('${INST_DIR}', module_path.lstrip(os.path.sep))
-        except IndexError:
-            message = "%s/lib/python*/site-packages not found." % self.inst_dir
-            warnings.warn(message)
-            return ''
-
     def _python_configs(self):
         python_dirs = [os.path.join('${'+self._env_var(x)+'}', 'python')
                        for x in self.package_dirs]
@@ -226,70 +432,128 @@ export SITENAME=%(site)s
             python_configs += """export DATACATDIR=%s/lib
 export DATACAT_CONFIG=%s
 """ % (os.path.join(datacat_pars['datacatdir']), datacat_pars['datacat_config'])
+        if self.import_root:
+            python_dirs = ['${INST_DIR}/' + IMPORT_ROOT, '${PYTHONPATH}']
         python_configs += "export PYTHONPATH=%s\n" % ":".join(python_dirs)
         return python_configs
 
-    def jh(self):
-        os.chdir(self.inst_dir)
-        self.modules_install()
-        self.lcatr_install('lcatr-harness')
-        self.lcatr_install('lcatr-schema')
-        self.lcatr_install('lcatr-modulefiles')
-        inst_dir = self.inst_dir
-        subprocess.check_call('ln -sf %(inst_dir)s/share/modulefiles %(inst_dir)s/Modules' % locals(), shell=True, executable=self._executable)
-        subprocess.check_call('touch `ls -d %(inst_dir)s/lib/python*/site-packages/lcatr`/__init__.py' % locals(), shell=True, executable=self._executable)
-        hj_version = self.pars['harnessed-jobs']
-        self.github_download('harnessed-jobs', hj_version)
-        for folder in self.hj_folders:
-            subprocess.check_call('ln -sf %(inst_dir)s/harnessed-jobs-%(hj_version)s/%(folder)s/* %(inst_dir)s/share' % locals(), shell=True, executable=self._executable)
-        self.eups_package_installer()
-        self.package_installer()
-        self.write_setup()
-        os.chdir(self.curdir)
+    def _python_dirs(self):
+        """
+        Return the directories that _python_configs would put on
+        PYTHONPATH, in order.
+        """
+        python_dirs = [os.path.join(x, 'python')
+                       for x in self.package_dirs.values()]
+        if self.datacat_pars is not None:
+            python_dirs.append(os.path.join(self.datacat_pars['datacatdir'],
+                                            'lib'))
+        python_dirs.append(os.path.join(self.inst_dir, 'harnessed-jobs-%s'
+                                        % self.pars['harnessed-jobs'],
+                                        'python'))
+        python_dirs.extend(glob.glob('%s/lib/python*/site-packages'
+                                     % self.inst_dir)[:1])
+        return python_dirs
 
-    def eups_package_installer(self):
-        try:
-            pars = Parfile(self.version_file, 'eups_packages')
-        except configparser.NoSectionError:
-            return
-        inst_dir = self.inst_dir
-        stack_dir = self.stack_dir.rstrip(os.path.sep)
-        ups_db_dir = '%(inst_dir)s/eups/ups_db' % locals()
-        if not os.path.isdir(ups_db_dir):
-            os.makedirs(ups_db_dir)
-        for package, version in pars.items():
-            self.github_download(package, version)
-            commands = """source %(stack_dir)s/loadLSST.bash; export EUPS_PATH=%(inst_dir)s/eups:${EUPS_PATH}; cd %(package)s-%(version)s/; eups declare %(package)s %(version)s -r . -c; setup %(package)s; scons opt=3""" % locals()
-            subprocess.check_call(commands, shell=True, executable=self._executable)
-
-    def package_installer(self):
-        try:
-            pars = Parfile(self.version_file, 'packages')
-        except configparser.NoSectionError:
-            return
-        inst_dir = self.inst_dir
-        for package, version in pars.items():
-            self.github_download(package, version)
-            package_dir = "%(package)s-%(version)s" % locals()
-            hj_dir = "%(inst_dir)s/%(package_dir)s/harnessed_jobs" % locals()
-            if os.path.isdir(hj_dir):
-                command = 'ln -sf %(hj_dir)s/* %(inst_dir)s/share' % locals()
-                subprocess.check_call(command, executable=self._executable,
-                                shell=True)
-
-    def jh_test(self):
-        os.chdir(self.inst_dir)
+    @staticmethod
+    def _scons_targets(package):
+        return 'opt=3'
+
+    def _eups_build(self, package, version):
+        build_jobs = self.build_jobs
+        targets = self._scons_targets(package)
+        package_dir = '%(package)s-%(version)s' % locals()
+        digest = self._fetched.get((package, version))
+        key = self._eups_build_key(package, version, digest)
+        shared = None
+        if self.store is not None and key is not None:
+            shared = self.store.tree(key)
+        if shared is not None:
+            # Another install on this server built the same tree.
+            self.store.link(shared, os.path.join(self.inst_dir, package_dir))
+            print("Linked the {} {} build from the package store."
+                  .format(package, version))
+            restored = True
+        else:
+            restored = restore_build(self.cache, key)
+            if restored:
+                print("Restored the {} {} build from the cache."
+                      .format(package, version))
+        commands = """cd %(package_dir)s/; eups declare %(package)s %(version)s -r . -c""" % locals()
+        if not restored:
+            commands += """; setup %(package)s; scons -j %(build_jobs)d %(targets)s""" % locals()
+        self.stack_session.run(commands)
+        if not restored and key is not None and self.cache is not None:
+            store_build(self.cache, key, package_dir)
+        if shared is None and self.store is not None and key is not None:
+            self._store_build(key, package, version, digest)
+
+    @staticmethod
+    def nexus_url(package_name, package_version):
+        return '%s&maven.artifactId=%s&maven.baseVersion=%s' % \
+            (Installer._nexus_url, package_name, package_version)
+
+    @staticmethod
+    def nexus_asset(package_name, package_version):
+        """
+        Look up the dist zip of a CCS package with the Nexus search API
+        and return its download URL and sha1, or None if the search
+        fails.
+        """
+        url = Installer.nexus_url(package_name, package_version).replace(
+            '/search/assets/download?', '/search/assets?')
         try:
-            pars = Parfile(self.version_file, 'eups_packages')
-            pars['eotest']
-            hj_version = self.pars['harnessed-jobs']
-            command = 'source ./setup.sh; python harnessed-jobs-%(hj_version)s/tests/setup_test.py' % locals()
-            subprocess.check_call(command, shell=True, executable=self._executable)
-            os.chdir(self.curdir)
-        except (configparser.NoSectionError, KeyError):
-            pass
+            with open_url(url) as response:
+                items = json.loads(response.read().decode('utf-8'))['items']
+            return items[0]['downloadUrl'], items[0]['checksum']['sha1']
+        except (IOError, ValueError, KeyError, IndexError):
+            return None
 
-    def _ccs_download(self, package_name, package_version):
+    # Checksums of the SNAPSHOT packages installed in a CCS install
+    # directory, used to skip refreshing them when they are unchanged.
+    # Each package maps the name of the hash (the sha1 from Nexus or the
+    # sha256 from a lockfile) to the digest of the archive installed.
+    _snapshot_file = '.snapshot_checksums.json'
+
+    def _snapshot_checksums(self):
+        try:
+            with open(self._snapshot_file) as infile:
+                checksums = json.load(infile)
+        except (IOError, ValueError):
+            return {}
+        # Older files only recorded the sha1.
+        return dict((subdir, value if isinstance(value, dict)
+                     else dict(sha1=value))
+                    for subdir, value in checksums.items())
+
+    def _record_snapshot_checksum(self, subdir, hash_name, digest):
+        with self._lock:
+            checksums = self._snapshot_checksums()
+            checksums[subdir] = {hash_name: digest}
+            with open(self._snapshot_file + '.tmp', 'w') as output:
+                json.dump(checksums, output, indent=2, sort_keys=True)
+            os.rename(self._snapshot_file + '.tmp', self._snapshot_file)
+
+    def _ccs_download(self, package_name, package_version, generation=None):
+        """
+        Download and unpack a CCS package and return the (name, target)
+        of the symlink to make for it.  Several packages may be
+        downloaded concurrently, so the links are left to the caller.
+        If a generation directory is given, SNAPSHOT versions are not
+        replaced in place but unpacked in a new directory.
+        """
+
+        entry = self.lock.get(('ccs', package_name))
+
+        # Link released packages to the package store, if there is one.
+        name = package_name.replace('github.', '').replace('nexus.', '')
+        subdir = '-'.join((name, package_version))
+        if self.store is not None and not os.path.exists(subdir):
+            with self.tracer.span('fetch', name, package_version):
+                shared = self._store_tree('ccs', package_name,
+                                          package_version)
+            if shared is not None:
+                self.store.link(shared[0], subdir)
+                return name, subdir
 
         # Determine the protocol to fetch the package by the prefix
         github_clone = package_name.startswith('github.')
@@ -302,49 +566,149 @@ export DATACAT_CONFIG=%s
         # If from github, clone the project
         if github_clone:
             package_name = package_name.replace('github.', '')
-            self.github_clone(package_name,package_version)
+            with self.tracer.span('fetch', package_name, package_version,
+                                  outputs=['-'.join((package_name,
+                                                     package_version))]):
+                return package_name, self.github_clone(
+                    package_name, package_version,
+                    commit=entry.commit if entry is not None else None)
         else :
             package_name = package_name.replace('nexus.', '')
             subdir = '-'.join((package_name, package_version))
             is_released_version = 'SNAPSHOT' not in package_version
 
+            # For SNAPSHOT versions, compare the checksum of the
+            # current upstream artifact with the one last installed.
+            asset = None
+            if entry is not None and entry.sha256 is not None:
+                # The lockfile gives the exact build to install.
+                if not is_released_version:
+                    asset = (entry.url, entry.sha256, 'sha256')
+            elif not is_released_version:
+                asset = self.nexus_asset(package_name, package_version)
+                if asset is not None:
+                    asset += ('sha1',)
+
+            dest_dir = '.'
+            if generation is not None and not is_released_version:
+                # Trees used by a generation are never modified, so each
+                # SNAPSHOT build is unpacked in a directory named for its
+                # checksum (or in the new generation if that is unknown).
+                dest_dir = (os.path.join('snapshots', asset[1][:12])
+                            if asset is not None else generation)
+            target = os.path.normpath(os.path.join(dest_dir, subdir))
+
             if is_released_version and os.path.exists(subdir):
                 print("Skipping download of released package {} since it already exists.".format(subdir))
+            elif (asset is not None and os.path.isdir(target) and
+                  (dest_dir != '.' or
+                   self._snapshot_checksums().get(subdir, {}).get(asset[2])
+                   == asset[1])):
+                print("Skipping download of {} since it is unchanged.".format(subdir))
             else:
                 # Download the CCS package only when necessary:
-                # - if it is a SNAPSHOT version
+                # - if it is a SNAPSHOT version that changed upstream
                 # - if it is a released version and it does not exist in the ccs install directory
 
-                base_url = "http://repo-nexus.lsst.org/nexus/service/rest/v1/search/assets/download?repository=ccs-maven2-public&maven.groupId=org.lsst&maven.classifier=dist&maven.extension=zip&sort=version"
-                command = 'wget --progress=dot:mega "%(base_url)s&maven.artifactId=%(package_name)s&maven.baseVersion=%(package_version)s" -O temp.zip' % locals()
-                subprocess.check_call(command, shell=True, executable=self._executable)
-                if os.path.isdir(subdir):
-                    subprocess.check_call('rm -r %(subdir)s' % locals(), shell=True, executable=self._executable)
-                subprocess.check_call('unzip -uoqq temp.zip', shell=True, executable=self._executable)
-                subprocess.check_call('rm temp.zip', shell=True, executable=self._executable)
-                self.ccs_symlink(package_name, subdir)
+                sha256 = None
+                if entry is not None and entry.sha256 is not None:
+                    url, sha256 = entry.url, entry.sha256
+                elif asset is not None:
+                    url = asset[0]
+                else:
+                    url = self.nexus_url(package_name, package_version)
+                print("Downloading {}".format(subdir))
+                # Released artifacts never change, so they can be
+                # shared with other CCS install directories.
+                cache = self.cache if is_released_version else None
+                if not os.path.isdir(dest_dir):
+                    os.makedirs(dest_dir)
+                with self.tracer.span('fetch', package_name, package_version,
+                                      outputs=[target]):
+                    download_and_extract(url, dest_dir, cache=cache,
+                                         key=('nexus', package_name,
+                                              package_version),
+                                         archive_format='zip',
+                                         limiter=self.limiter,
+                                         sha256=sha256)
+                if asset is not None and dest_dir == '.':
+                    self._record_snapshot_checksum(subdir, asset[2],
+                                                   asset[1])
+            return package_name, target
 
     @staticmethod
     def ccs_symlink(symlinkName, symlinkTarget):
-        createSymlink = False
-        if not os.path.exists(symlinkName):
+        # A relative target is relative to the directory of the link.
+        targetPath = os.path.join(os.path.dirname(symlinkName), symlinkTarget)
+        if not os.path.lexists(symlinkName):
             #If the symlink does not exist, create it
             print("Creating symlink {} ---> {}".format(symlinkName,
                                                        symlinkTarget))
-            createSymlink = True
+        elif os.path.realpath(symlinkName) != os.path.realpath(targetPath):
+            #If the symlink exists, but it points to a different version of
+            #the package, then replace it.
+            print("Updating symlink {} ---> {}".format(symlinkName,
+                                                       symlinkTarget))
         else:
-            if os.path.realpath(symlinkName) != os.path.realpath(symlinkTarget):
-                #If the symlink exists, but it points to a different version of
-                #the package, then remove it and then re-create it.
-                print("Updating symlink {} ---> {}".format(symlinkName,
-                                                           symlinkTarget))
-                createSymlink = True
-                subprocess.check_call('rm %(symlinkName)s' % locals(), shell=True,
-                                executable=Installer._executable)
-
-        if createSymlink:
-            subprocess.check_call('ln -sf %(symlinkTarget)s %(symlinkName)s'
-                            % locals(), shell=True, executable=Installer._executable)
+            return
+
+        # Make the new link under a temporary name and rename it over
+        # the old one so that the name always resolves.
+        tmpName = '{}.tmp-{}'.format(symlinkName, os.getpid())
+        if os.path.lexists(tmpName):
+            os.remove(tmpName)
+        os.symlink(symlinkTarget, tmpName)
+        os.replace(tmpName, symlinkName)
+
+    # Generations of CCS links, used with --generations.  The top-level
+    # names of the install directory point into 'current', which in
+    # turn points to one generation; 'previous' is kept for rollbacks.
+    _generations_dir = 'generations'
+
+    def _new_generation(self):
+        """
+        Return the path of a new, not yet existing generation directory,
+        named for the current time.
+        """
+        stamp = time.strftime('%Y%m%dT%H%M%S')
+        generation = os.path.join(self._generations_dir, stamp)
+        count = 0
+        while os.path.lexists(generation):
+            count += 1
+            generation = os.path.join(self._generations_dir,
+                                      '%s-%d' % (stamp, count))
+        return generation
+
+    def _switch_generation(self, generation):
+        """
+        Make `generation` the current one with a single rename of the
+        'current' link, after pointing every top-level name it provides
+        at current/<name>.  The top-level links of names that it does not
+        provide are then removed.
+        """
+        names = sorted(os.listdir(generation))
+        for name in names:
+            if os.path.isdir(name) and not os.path.islink(name):
+                # A directory made by a non-generation install, e.g., bin.
+                print("Moving {0} to {0}.orig".format(name))
+                os.rename(name, name + '.orig')
+            self.ccs_symlink(name, os.path.join('current', name))
+        if os.path.lexists('current'):
+            self.ccs_symlink('previous', os.readlink('current'))
+        self.ccs_symlink('current', generation)
+        for name in os.listdir('.'):
+            if (name not in names and os.path.islink(name) and
+                    os.readlink(name) == os.path.join('current', name)):
+                os.remove(name)
+
+    def ccs_rollback(self, ccs_inst_dir):
+        """Swap the 'current' and 'previous' CCS generations."""
+        os.chdir(ccs_inst_dir)
+        if not os.path.lexists('previous'):
+            raise RuntimeError("no previous CCS generation in %s"
+                               % ccs_inst_dir)
+        self._switch_generation(os.readlink('previous'))
+        os.chdir(self.curdir)
 
     def ccs(self, args, section='ccs'):
 
@@ -373,6 +737,8 @@ export DATACAT_CONFIG=%s
             ccs_arguments.append("--site")
             ccs_arguments.append(args.site)
             ccs_arguments.append("--dev")
+            if args.generations:
+                ccs_arguments.append("--generations")
             ccs_arguments.append(self.version_file)
 
             install_file_name = ".installArgs"
@@ -386,7 +752,7 @@ export DATACAT_CONFIG=%s
             # Create a symbolic link to the install script used to create this installation directory
             self.ccs_symlink("update.py", os.path.abspath(os.path.join(self.curdir,__file__)))
         try:
-            pars = Parfile(self.version_file, section)
+            pars = self._section(section)
         except configparser.NoSectionError:
             return
 
@@ -399,6 +765,7 @@ export DATACAT_CONFIG=%s
         symlink_token = "symlink."
         executable_map = {}
         executable_token = "executable."
+        downloads = []
         for x in pars:
             # Executables
             if x.startswith(executable_token):
@@ -406,40 +773,160 @@ export DATACAT_CONFIG=%s
             # Symlinks
             elif x.startswith(symlink_token):
                 symlink_map.update({x.replace(symlink_token, ''): pars[x]})
-            else:
-                self._ccs_download(x, str(pars[x]))
-
-        # Now create the executable symlinks in the distribution bin directory
-        try:
+            elif (args.generations or self.plan is None or
+                  (section, x) in self.plan):
+                # A new generation needs links to every package.
+                downloads.append((x, str(pars[x])))
+
+        generation = None
+        if args.generations:
+            generation = self._new_generation()
+            print("Staging CCS generation {}".format(generation))
+            os.makedirs(os.path.join(generation, 'bin'))
+
+        # Download and unpack the packages concurrently, then make all
+        # of the links once the packages are in place.
+        links = run_parallel(
+            lambda name, version: self._ccs_download(name, version,
+                                                     generation),
+            downloads, jobs=self.jobs)
+        if generation is not None:
+            # Package links in the generation point back up to the trees.
+            links = [(name, os.path.relpath(target, generation))
+                     for name, target in links]
+
+        # The executable symlinks in the distribution bin directory
+        if generation is None and not os.path.isdir('bin'):
             os.mkdir('bin')
-        except OSError:
-            # bin directory already exists(?)
-            pass
-        os.chdir('bin')
-
         for executable_name in executable_map:
-            self.ccs_symlink(executable_name, "../{}/bin/CCSbootstrap.sh".format(executable_map[executable_name]))
+            links.append((os.path.join('bin', executable_name),
+                          "../{}/bin/CCSbootstrap.sh".format(executable_map[executable_name])))
 
-        # Now create the symlinks from the top level of the distribution directory
-        os.chdir('..')
-        for symlink_name in symlink_map:
-            self.ccs_symlink(symlink_name, symlink_map[symlink_name])
+        # The symlinks from the top level of the distribution directory
+        if generation is None:
+            links.extend(symlink_map.items())
+        else:
+            # Targets that are not links of the generation, e.g.,
+            # config_files-0.0.7/data, are relative to the install
+            # directory.
+            names = set([name.split(os.path.sep)[0] for name, _ in links] +
+                        list(symlink_map))
+            for name, target in symlink_map.items():
+                target = str(target)
+                if (not os.path.isabs(target) and
+                        target.split('/')[0] not in names):
+                    target = os.path.relpath(target, generation)
+                links.append((name, target))
+
+        with self.tracer.span('link', 'ccs symlinks'):
+            if generation is None:
+                for symlink_name, symlink_target in links:
+                    self.ccs_symlink(symlink_name, symlink_target)
+            else:
+                for symlink_name, symlink_target in links:
+                    self.ccs_symlink(os.path.join(generation, symlink_name),
+                                     symlink_target)
+                self._switch_generation(generation)
+        shutil.copy(self.version_file,
+                    os.path.join(inst_dir_full_path, 'installed_versions.txt'))
         os.chdir(self.curdir)
 
-if __name__ == '__main__':
-    import argparse
+def stand_name(version_file):
+    """Return the stand of a package list, e.g., BNL_TS8_1."""
+    name = os.path.splitext(os.path.basename(version_file))[0]
+    for suffix in ('_versions', 'versions'):
+        if name.endswith(suffix) and len(name) > len(suffix):
+            return name[:-len(suffix)]
+    return name
+
+
+def install_batch(version_files, batch_dir, generations=False, **kwds):
+    """
+    Install the package lists of several stands into
+    batch_dir/<stand>/jh and batch_dir/<stand>/ccs.  Every (package,
+    version) used by any of the stands is first fetched once into the
+    package store given as `store`, or the archive cache for EUPS
+    packages, and
+    each stand's install then links to the store's trees.  EUPS
+    packages are built by the first stand that needs them and linked
+    by the others.  The keyword arguments are passed to the Installers.
+    Returns {stand: error} for the package lists that could not be read
+    or installed.
+    """
+    batch_dir = os.path.abspath(batch_dir)
+    versions, errors = load_version_files(version_files,
+                                          jobs=kwds.get('jobs', 1))
+    errors = OrderedDict((stand_name(path), error)
+                         for path, error in errors.items())
+    installers = OrderedDict()
+    for path in versions:
+        stand_dir = os.path.join(batch_dir, stand_name(path))
+        installers[stand_name(path)] = Installer(
+            path, inst_dir=os.path.join(stand_dir, 'jh'), **kwds)
+
+    # The union of the packages of all of the stands, each fetched
+    # with the installer of the first stand that uses it.
+    packages = OrderedDict()
+    for installer in installers.values():
+        for package in installer.packages():
+            packages.setdefault(package, installer)
+    print("{} stands use {} distinct package versions.".format(
+        len(installers), len(packages)))
+    run_parallel(lambda package, installer: installer.prefetch(*package),
+                 list(packages.items()), jobs=kwds.get('jobs', 1))
+
+    curdir = os.path.abspath('.')
+    for stand, installer in installers.items():
+        print("Installing {}".format(stand))
+        try:
+            if 'jh' in installer.versions:
+                if not os.path.isdir(installer.inst_dir):
+                    os.makedirs(installer.inst_dir)
+                installer.jh()
+            if 'ccs' in installer.versions:
+                installer.ccs(argparse.Namespace(
+                    ccs_inst_dir=os.path.join(batch_dir, stand, 'ccs'),
+                    dev=False, site=installer.site, generations=generations))
+        except Exception as eobj:
+            errors[stand] = repr(eobj)
+            print("Installing {} failed: {!r}".format(stand, eobj))
+        finally:
+            os.chdir(curdir)
+    return errors
 
+
+if __name__ == '__main__':
     parser = argparse.ArgumentParser(description="Job Harness Installer",
                                      fromfile_prefix_chars="@")
-    parser.add_argument("version_file", help='software version file')
-    parser.add_argument('--inst_dir', type=str, default=None,
-                        help='installation directory')
-    parser.add_argument('--site', type=str, default='SLAC',
-                        help='Site (SLAC, BNL, etc.)')
-    parser.add_argument('--hj_folders', type=str, default="SLAC")
-    parser.add_argument('--python_exec', type=str, default='python')
+    add_arguments(parser)
+    parser.add_argument("more_version_files", nargs='*',
+                        help='with --batch_dir, the package lists of more '
+                        'stands')
     parser.add_argument('--ccs_inst_dir', type=str, default=None)
-    parser.add_argument('--dev', action='store_true')
+    parser.add_argument('--host_connections', type=int, default=4,
+                        help='maximum concurrent downloads from one server')
+    parser.add_argument('--generations', action='store_true',
+                        help='stage the CCS links in a new generation and '
+                        'switch to it atomically')
+    parser.add_argument('--rollback', action='store_true',
+                        help='switch the CCS install back to the previous '
+                        'generation and exit')
+    parser.add_argument('--check', action='store_true',
+                        help='check that every package in the list can be '
+                        'downloaded and that the CCS links have targets, '
+                        'then exit')
+    parser.add_argument('--batch_dir', type=str, default=None,
+                        help='install the package list of each stand into '
+                        'BATCH_DIR/<stand>/jh and BATCH_DIR/<stand>/ccs, '
+                        'fetching and building each package version once')
+    parser.add_argument('--store_dir', type=str, default=None,
+                        help='directory of the package trees shared by '
+                        'install directories (default with --batch_dir: '
+                        'BATCH_DIR/.store)')
+    parser.add_argument('--link_mode', choices=LINK_MODES,
+                        default='symlink',
+                        help='link install directories to the package '
+                        'store with symlinks or with trees of hard links')
 
     installerArguments = None
     # Check if there is a previously written installation arguments file
@@ -451,13 +938,83 @@ if __name__ == '__main__':
 
     args = parser.parse_args(installerArguments)
 
-    installer = Installer(args.version_file, inst_dir=args.inst_dir,
-                          python_exec=args.python_exec,
-                          hj_folders=args.hj_folders.split(), site=args.site)
-
-    if args.inst_dir is not None:
-        installer.jh()
-        #installer.jh_test()
-
-    if args.ccs_inst_dir is not None:
-        installer.ccs(args)
+    store_dir = args.store_dir
+    if store_dir is None and args.batch_dir is not None:
+        store_dir = os.path.join(args.batch_dir, '.store')
+    kwds = installer_args(args)
+    kwds.update(host_connections=args.host_connections,
+                store=(PackageStore(store_dir, args.link_mode)
+                       if store_dir is not None else None))
+
+    if args.batch_dir is not None:
+        errors = install_batch([args.version_file] + args.more_version_files,
+                               args.batch_dir,
+                               generations=args.generations, **kwds)
+        for stand, error in errors.items():
+            print("{}: {}".format(stand, error))
+        sys.exit(1 if errors else 0)
+    elif args.more_version_files:
+        parser.error('more than one version file needs --batch_dir')
+
+    if args.rollback and args.ccs_inst_dir is None:
+        parser.error('--rollback needs --ccs_inst_dir')
+
+    installer = Installer(args.version_file, inst_dir=args.inst_dir, **kwds)
+
+    if args.rollback:
+        installer.ccs_rollback(args.ccs_inst_dir)
+        sys.exit(0)
+
+    if args.lock is not None:
+        installer.write_lock(args.lock)
+        print("Wrote", args.lock)
+        sys.exit(0)
+
+    if args.check:
+        sections = []
+        if args.inst_dir is not None:
+            sections.append('jh')
+        if args.ccs_inst_dir is not None:
+            sections.append('ccs')
+        if not sections:
+            # Without install directories, check the whole package list.
+            sections = [x for x in ('jh', 'ccs') if x in installer.versions]
+        problems = installer.check(sections)
+        print(format_problems(problems))
+        sys.exit(1 if problems else 0)
+
+    if args.gc:
+        for inst_dir in (args.inst_dir, args.ccs_inst_dir):
+            if inst_dir is not None:
+                installer.gc(inst_dir, args.keep_generations, args.dry_run)
+        sys.exit(0)
+
+    plans = OrderedDict()
+    if args.plan or args.upgrade:
+        if args.inst_dir is not None:
+            plans[args.inst_dir] = installer.upgrade_plan(args.inst_dir)
+        if args.ccs_inst_dir is not None:
+            plans[args.ccs_inst_dir] = installer.upgrade_plan(
+                args.ccs_inst_dir, ('ccs',))
+        plan = sum(plans.values(), [])
+        print(format_plan(plan))
+        if args.plan:
+            sys.exit(0)
+        installer.plan = changed(plan)
+
+    try:
+        if args.inst_dir is not None:
+            installer.jh()
+            #installer.jh_test()
+
+        if args.ccs_inst_dir is not None:
+            installer.ccs(args)
+
+        # Only now that the upgrade is in place are the packages it
+        # drops deleted.
+        for inst_dir, plan in plans.items():
+            installer.remove_dropped(inst_dir, plan, dry_run=args.dry_run)
+    finally:
+        if args.trace is not None:
+            installer.tracer.write(args.trace)
+            print(installer.tracer.summary())
@@ -0,0 +1,236 @@
+"""
+Garbage collection of package trees and leftover files in JH and CCS
+install directories.
+"""
+from __future__ import print_function, absolute_import
+import os
+import re
+import glob
+import time
+import shutil
+from fetch import run_parallel
+from upgrade_plan import PACKAGE_SECTIONS, LINK_TOKENS
+
+# Top-level entries that look like unpacked or cloned package trees.
+_tree_pattern = re.compile(r'-(v?\d[\w.+-]*|master)$')
+
+# Leftover archives, staging directories and temporary links.
+_leftover_pattern = re.compile(r'(\.tar\.gz|\.zip|\.tmp)$|^\.partial-|\.tmp-\d+$')
+
+
+def _tree_name(package, version):
+    for prefix in ('github.', 'nexus.'):
+        if package.startswith(prefix):
+            package = package[len(prefix):]
+    return '%s-%s' % (package, version)
+
+
+def tree_names(versions):
+    """
+    Return the <package>-<version> directory names of the packages in a
+    package list, as returned by upgrade_plan.read_versions.
+    """
+    names = set()
+    for section in PACKAGE_SECTIONS:
+        for package, version in versions.get(section, {}).items():
+            if section == 'ccs' and package.startswith(LINK_TOKENS):
+                continue
+            names.add(_tree_name(package, version))
+    return names
+
+
+def tree_size(path):
+    """Return the number of bytes used by a file or directory tree."""
+    if not os.path.isdir(path) or os.path.islink(path):
+        return os.lstat(path).st_size
+    total = 0
+    for root, dirs, files in os.walk(path):
+        for name in dirs + files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def _link_targets(top, recursive=False):
+    targets = set()
+    for root, dirs, files in os.walk(top):
+        for name in dirs + files:
+            path = os.path.join(root, name)
+            if os.path.islink(path):
+                targets.add(os.path.realpath(path))
+                # The link itself may be the target, e.g., a link to a
+                # package store tree.
+                targets.add(os.path.normpath(os.path.join(
+                    root, os.readlink(path))))
+        if not recursive:
+            break
+    return targets
+
+
+def find_garbage(inst_dir, keep_names=(), keep_generations=2,
+                 min_age=3600):
+    """
+    Return the paths in `inst_dir` that nothing references any more:
+
+    - package trees, and links to package store trees, whose names are
+      not in `keep_names` and that no symlink in the top level, bin,
+      share or a kept generation points into,
+    - stray archives, staging directories and temporary links not
+      changed in the last `min_age` seconds, which a running install
+      may still be using,
+    - generations other than 'current', 'previous' and the newest
+      `keep_generations`, and SNAPSHOT trees only they used.
+    """
+    inst_dir = os.path.realpath(inst_dir)
+    cutoff = time.time() - min_age
+    generations_dir = os.path.join(inst_dir, 'generations')
+    snapshots_dir = os.path.join(inst_dir, 'snapshots')
+
+    garbage = []
+    kept = set()
+    if os.path.isdir(generations_dir):
+        generations = sorted(os.path.join(generations_dir, x)
+                             for x in os.listdir(generations_dir))
+        kept.update(generations[-keep_generations:]
+                    if keep_generations > 0 else [])
+        for name in ('current', 'previous'):
+            link = os.path.join(inst_dir, name)
+            if os.path.islink(link):
+                kept.add(os.path.realpath(link))
+        garbage.extend(x for x in generations if x not in kept)
+
+    referenced = set()
+    for top in (inst_dir, os.path.join(inst_dir, 'bin'),
+                os.path.join(inst_dir, 'share')):
+        if os.path.isdir(top):
+            referenced.update(_link_targets(top))
+    for generation in kept:
+        referenced.update(_link_targets(generation, recursive=True))
+
+    def is_referenced(path):
+        return any(x == path or x.startswith(path + os.path.sep)
+                   for x in referenced)
+
+    for name in sorted(os.listdir(inst_dir)):
+        path = os.path.join(inst_dir, name)
+        if _leftover_pattern.search(name):
+            if os.lstat(path).st_mtime <= cutoff:
+                garbage.append(path)
+        elif ((os.path.isdir(path) or os.path.islink(path))
+              and _tree_pattern.search(name)
+              and name not in keep_names and not is_referenced(path)):
+            garbage.append(path)
+    if os.path.isdir(snapshots_dir):
+        garbage.extend(path for path in
+                       (os.path.join(snapshots_dir, x)
+                        for x in sorted(os.listdir(snapshots_dir)))
+                       if not is_referenced(path))
+    return garbage
+
+
+def _remove(path):
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path)
+    else:
+        os.remove(path)
+
+
+def dropped_paths(inst_dir, actions):
+    """
+    Return the paths in `inst_dir` of what the 'remove' actions of an
+    upgrade plan (see upgrade_plan.plan_upgrade) drop:
+
+    - the <package>-<version> tree of each dropped package, the links
+      to it in the top level, bin and share, and its EUPS version and
+      tag files in eups/ups_db,
+    - the links made for dropped symlink. and executable. entries.
+
+    Trees that a generation still links to are kept.
+    """
+    inst_dir = os.path.realpath(inst_dir)
+    links = []
+    trees = []
+    for action in actions:
+        if action.action != 'remove' or action.section not in \
+           PACKAGE_SECTIONS:
+            continue
+        if action.section == 'ccs' and action.package.startswith('symlink.'):
+            links.append(os.path.join(inst_dir,
+                                      action.package[len('symlink.'):]))
+        elif (action.section == 'ccs' and
+              action.package.startswith('executable.')):
+            links.append(os.path.join(inst_dir, 'bin',
+                                      action.package[len('executable.'):]))
+        else:
+            tree = os.path.join(inst_dir, _tree_name(action.package,
+                                                     action.old))
+            if os.path.isdir(tree) and not os.path.islink(tree):
+                trees.append(tree)
+    # A tree that a generation still uses is left for collect_garbage,
+    # so that a rollback keeps working.
+    generations_dir = os.path.join(inst_dir, 'generations')
+    if os.path.isdir(generations_dir):
+        referenced = _link_targets(generations_dir, recursive=True)
+        trees = [x for x in trees
+                 if not any(y == x or y.startswith(x + os.path.sep)
+                            for y in referenced)]
+
+    def in_trees(path):
+        path = os.path.realpath(path)
+        return any(path == x or path.startswith(x + os.path.sep)
+                   for x in trees)
+
+    for top in (inst_dir, os.path.join(inst_dir, 'bin'),
+                os.path.join(inst_dir, 'share')):
+        if os.path.isdir(top):
+            links.extend(os.path.join(top, x) for x in sorted(os.listdir(top))
+                         if os.path.islink(os.path.join(top, x)) and
+                         in_trees(os.path.join(top, x)))
+    declarations = []
+    for version_file in sorted(glob.glob(os.path.join(
+            inst_dir, 'eups', 'ups_db', '*', '*.version'))):
+        with open(version_file) as infile:
+            prod_dirs = [line.split('=', 1)[1].strip() for line in infile
+                         if line.strip().startswith('PROD_DIR')]
+        if not any(in_trees(os.path.join(inst_dir, x)) for x in prod_dirs):
+            continue
+        declarations.append(version_file)
+        version = os.path.basename(version_file)[:-len('.version')]
+        for chain_file in sorted(glob.glob(os.path.join(
+                os.path.dirname(version_file), '*.chain'))):
+            with open(chain_file) as infile:
+                if ('VERSION = %s' % version) in (x.strip() for x in infile):
+                    declarations.append(chain_file)
+    links = [x for x in dict.fromkeys(links) if os.path.islink(x)]
+    return links + declarations + trees
+
+
+def remove_paths(inst_dir, paths, dry_run=False, jobs=1):
+    """
+    Report `paths` in `inst_dir` and their sizes, and remove them unless
+    `dry_run` is set.  Returns the number of bytes reclaimed (or
+    reclaimable, for a dry run).
+    """
+    sizes = run_parallel(tree_size, [(x,) for x in paths], jobs=jobs)
+    for path, size in zip(paths, sizes):
+        print('%10.1f MB  %s' % (size/1024.**2, path))
+    total = sum(sizes)
+    if dry_run:
+        print('%.1f MB reclaimable in %s' % (total/1024.**2, inst_dir))
+    else:
+        run_parallel(_remove, [(x,) for x in paths], jobs=jobs)
+        print('%.1f MB reclaimed in %s' % (total/1024.**2, inst_dir))
+    return total
+
+
+def collect_garbage(inst_dir, keep_names=(), keep_generations=2,
+                    dry_run=False, jobs=1, min_age=3600):
+    """
+    Report the reclaimable paths in `inst_dir` and their sizes, and
+    remove them unless `dry_run` is set.  Returns the number of bytes
+    reclaimed (or reclaimable, for a dry run).
+    """
+    garbage = find_garbage(inst_dir, keep_names, keep_generations, min_age)
+    return remove_paths(inst_dir, garbage, dry_run=dry_run, jobs=jobs)
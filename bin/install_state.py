@@ -0,0 +1,77 @@
+"""
+Manifest of completed install steps, used to make re-installs
+incremental.
+"""
+from __future__ import print_function, absolute_import
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+
+class InstallState(object):
+    """
+    Record of the install steps run in an install directory, stored as
+    JSON in <inst_dir>/install_state.json.  Each step is keyed by name
+    (e.g., 'eups:eotest') and records its inputs (package version,
+    interpreter, stack directory, ...), the sha256 of the source
+    archive, its outputs and its completion status.  A step is current,
+    and can be skipped, if it completed with the same inputs and source
+    digest and all of its outputs still exist.
+    """
+    filename = 'install_state.json'
+
+    def __init__(self, inst_dir, reset=False):
+        self.path = os.path.join(inst_dir, self.filename)
+        self._lock = threading.Lock()
+        self.steps = {}
+        if not reset and os.path.isfile(self.path):
+            with open(self.path) as infile:
+                self.steps = json.load(infile).get('steps', {})
+
+    def is_current(self, name, inputs, digest=None):
+        """
+        Return whether the step `name` completed with `inputs` and its
+        outputs still exist.  If the `digest` of the source archive the
+        step would use now is known, it must also be the one recorded,
+        so that a re-tagged archive is installed again.  A step whose
+        body recorded ok=False, e.g., a partly failed byte-compilation,
+        is not current.
+        """
+        entry = self.steps.get(name)
+        return (entry is not None and entry['status'] == 'complete'
+                and entry.get('ok', True)
+                and entry['inputs'] == inputs
+                and (digest is None or entry.get('digest') == digest)
+                and all(os.path.exists(x) for x in entry['outputs']))
+
+    @contextmanager
+    def step(self, name, inputs, outputs=()):
+        """
+        Context manager that records the step `name` as failed if the
+        body raises and as complete otherwise.  It yields the step's
+        entry so that the body can add to it, e.g., the source digest.
+        """
+        entry = dict(inputs=inputs, outputs=list(outputs), digest=None,
+                     status='running', start=time.time())
+        self._update(name, entry)
+        try:
+            yield entry
+        except BaseException:
+            entry['status'] = 'failed'
+            raise
+        else:
+            entry['status'] = 'complete'
+        finally:
+            entry['end'] = time.time()
+            self._update(name, entry)
+
+    def _update(self, name, entry):
+        with self._lock:
+            self.steps[name] = entry
+            tmp_path = '%s.%d.tmp' % (self.path, os.getpid())
+            with open(tmp_path, 'w') as output:
+                json.dump(dict(steps=self.steps), output, indent=2,
+                          sort_keys=True)
+            os.rename(tmp_path, self.path)
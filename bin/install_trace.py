@@ -0,0 +1,163 @@
+"""
+Tracing of the steps of an install: the wall time, bytes downloaded,
+bytes written and exit status of each step, per package and per phase,
+exported in the Chrome trace event format (chrome://tracing, Perfetto).
+"""
+from __future__ import print_function, absolute_import
+import os
+import json
+import time
+import threading
+import subprocess
+from contextlib import contextmanager
+from fetch import bytes_downloaded
+from install_gc import tree_size
+
+
+def _exit_status(eobj):
+    if eobj is None:
+        return 0
+    if isinstance(eobj, subprocess.CalledProcessError):
+        return eobj.returncode
+    return 1
+
+
+class Tracer(object):
+    """
+    Records a span for each install step, with its phase (fetch, build,
+    link, compile or setup), package and version.  Bytes downloaded are
+    those read by fetch.download_and_extract in the step's thread.  With
+    `sizes`, bytes written are the size of the step's `outputs` paths
+    once it ends; they are None otherwise and for steps that write into
+    shared directories.
+    """
+    def __init__(self, sizes=False):
+        self.sizes = sizes
+        self.events = []
+        self._start = time.time()
+        self._threads = {}
+        self._lock = threading.Lock()
+
+    def _thread_id(self):
+        thread = threading.current_thread()
+        with self._lock:
+            if thread.ident not in self._threads:
+                self._threads[thread.ident] = (len(self._threads) + 1,
+                                               thread.name)
+            return self._threads[thread.ident][0]
+
+    @contextmanager
+    def span(self, phase, package, version=None, outputs=None):
+        """Trace the enclosed code as one step of an install."""
+        downloaded = bytes_downloaded()
+        start = time.time()
+        error = None
+        try:
+            yield
+        except BaseException as eobj:
+            error = eobj
+            raise
+        finally:
+            event = dict(phase=phase, package=package,
+                         version=None if version is None else str(version),
+                         start=start - self._start,
+                         seconds=time.time() - start,
+                         thread=self._thread_id(),
+                         bytes_downloaded=bytes_downloaded() - downloaded,
+                         bytes_written=self._size(outputs),
+                         exit_status=_exit_status(error))
+            if error is not None:
+                event['error'] = repr(error)
+            with self._lock:
+                self.events.append(event)
+
+    def _size(self, outputs):
+        if not self.sizes or outputs is None:
+            return None
+        return sum(tree_size(x) for x in outputs if os.path.lexists(x))
+
+    def chrome_trace(self):
+        """Return the spans as a Chrome trace event dictionary."""
+        pid = os.getpid()
+        trace_events = [dict(name='thread_name', ph='M', pid=pid, tid=tid,
+                             args=dict(name=name))
+                        for tid, name in sorted(self._threads.values())]
+        for event in self.events:
+            name = event['package']
+            if event['version'] is not None:
+                name += ' ' + event['version']
+            args = dict((key, event[key]) for key in
+                        ('package', 'version', 'bytes_downloaded',
+                         'bytes_written', 'exit_status', 'error')
+                        if event.get(key) is not None)
+            trace_events.append(dict(name=name, cat=event['phase'], ph='X',
+                                     ts=int(event['start']*1e6),
+                                     dur=int(event['seconds']*1e6),
+                                     pid=pid, tid=event['thread'],
+                                     args=args))
+        return dict(traceEvents=trace_events, displayTimeUnit='ms',
+                    otherData=dict(phases=self.phase_totals()))
+
+    def write(self, filename):
+        """Write the Chrome trace to `filename`."""
+        with open(filename, 'w') as output:
+            json.dump(self.chrome_trace(), output, indent=1)
+
+    def phase_totals(self):
+        """
+        Return {phase: totals} where the totals are the number of steps,
+        the failures, the wall time covered by the phase's steps, the
+        sum of their times (larger than the wall time when steps ran
+        concurrently), and the bytes downloaded and written.
+        """
+        totals = {}
+        for phase in sorted(set(x['phase'] for x in self.events)):
+            events = [x for x in self.events if x['phase'] == phase]
+            intervals = sorted((x['start'], x['start'] + x['seconds'])
+                               for x in events)
+            wall = 0
+            end = None
+            for begin, finish in intervals:
+                if end is None or begin > end:
+                    wall += finish - begin
+                    end = finish
+                elif finish > end:
+                    wall += finish - end
+                    end = finish
+            totals[phase] = dict(
+                steps=len(events),
+                failed=sum(1 for x in events if x['exit_status'] != 0),
+                wall=wall, busy=sum(x['seconds'] for x in events),
+                bytes_downloaded=sum(x['bytes_downloaded'] for x in events),
+                bytes_written=sum(x['bytes_written'] or 0 for x in events))
+        return totals
+
+    def summary(self, slowest=10):
+        """Return a table of the phase totals and the slowest steps."""
+        lines = ['%-8s %5s %6s %9s %9s %12s %12s'
+                 % ('phase', 'steps', 'failed', 'wall (s)', 'busy (s)',
+                    'downloaded', 'written')]
+        for phase, total in sorted(self.phase_totals().items(),
+                                   key=lambda x: -x[1]['wall']):
+            lines.append('%-8s %5d %6d %9.2f %9.2f %12d %12d'
+                         % (phase, total['steps'], total['failed'],
+                            total['wall'], total['busy'],
+                            total['bytes_downloaded'],
+                            total['bytes_written']))
+        events = sorted(self.events, key=lambda x: -x['seconds'])[:slowest]
+        if events:
+            lines.append('')
+            lines.append('%-8s %-36s %9s %12s %12s %4s'
+                         % ('phase', 'package', 'time (s)', 'downloaded',
+                            'written', 'exit'))
+            for event in events:
+                name = event['package']
+                if event['version'] is not None:
+                    name += ' ' + event['version']
+                written = event['bytes_written']
+                lines.append('%-8s %-36s %9.2f %12d %12s %4d'
+                             % (event['phase'], name, event['seconds'],
+                                event['bytes_downloaded'],
+                                '-' if written is None else written,
+                                event['exit_status']))
+        return '\n'.join(lines)
@@ -0,0 +1,659 @@
+"""
+The parts of the job harness installers that install.py and
+jh_install.py share: fetching the [jh], [eups_packages] and [packages]
+of a version file, the install state, the lcatr builds and the steps
+that follow them, and the command line options common to both.
+"""
+from __future__ import print_function, absolute_import
+import os
+import glob
+import shutil
+import tempfile
+import subprocess
+import threading
+import warnings
+from contextlib import contextmanager
+from fetch import run_parallel, download_and_extract, ArchiveCache, \
+    DEFAULT_CACHE_DIR, HostLimiter
+from install_state import InstallState
+from upgrade_plan import read_versions, plan_upgrade, estimate_sizes
+from install_gc import tree_names, find_garbage, dropped_paths, \
+    remove_paths
+from eups_build import build_in_order, read_table, StackSession
+from fast_setup import write_fast_setup
+from import_root import IMPORT_ROOT, build_import_root, format_collisions
+from precompile import compile_trees
+from wheel_cache import WheelCache
+from install_trace import Tracer
+from lockfile import read_lock
+from version_file import read_version_file
+try:
+    import ConfigParser as configparser
+except ImportError:
+    import configparser
+
+
+class InstallerBase(object):
+    """
+    Base class of the Installer classes of install.py and jh_install.py.
+    Subclasses provide how packages are fetched (_github_fetch), built
+    (_eups_build) and set up (write_setup).
+    """
+    _executable = '/bin/bash'
+    _github_org = 'https://github.com/lsst-camera-dh'
+    _github_elec_org = 'https://github.com/lsst-camera-electronics'
+    def __init__(self, version_file, inst_dir='.', python_exec='python',
+                 hj_folders=('BNL_T03',), site='BNL', jobs=1,
+                 cache=None, reinstall=False, build_jobs=None,
+                 fast_setup=False, import_root=False,
+                 precompile=True, host_connections=4, trace=False):
+        self.version_file = os.path.abspath(version_file)
+        if inst_dir is not None:
+            self.inst_dir = os.path.abspath(inst_dir)
+            self.state = InstallState(self.inst_dir, reset=reinstall)
+        self.python_exec = python_exec
+        self.hj_folders = hj_folders
+        self.site = site
+        self.jobs = jobs
+        if build_jobs is None:
+            build_jobs = max(1, (os.cpu_count() or 1)//max(jobs, 1))
+        self.build_jobs = build_jobs
+        self.cache = cache
+        self.wheels = None
+        if cache is not None:
+            self.wheels = WheelCache(os.path.join(cache.cache_dir, 'wheels'),
+                                     python_exec)
+        self.fast_setup = fast_setup
+        self.import_root = import_root
+        self.precompile = precompile
+        self.limiter = HostLimiter(host_connections)
+        self.tracer = Tracer(sizes=trace)
+        self._lock = threading.Lock()
+        self.plan = None
+        self._fetched = dict()
+        self._package_dirs = None
+        self._stack_dir = None
+        self.stack_session = None
+        self.curdir = os.path.abspath('.')
+        self.versions = read_version_file(self.version_file)
+        self.lock = read_lock(self.versions)
+        try:
+            self.pars = self._section('jh')
+        except configparser.NoSectionError:
+            pass
+
+    def _section(self, section):
+        """
+        Return the typed view of a section of the version file.  The
+        packages of a lockfile keep their exact version strings.
+        """
+        return self.versions.section(section, exact=[
+            package for locked, package in self.lock if locked == section])
+
+    def _locked(self, package_name,
+                sections=('jh', 'eups_packages', 'packages')):
+        """Return the LockEntry of a package, or None."""
+        for section in sections:
+            if (section, package_name) in self.lock:
+                return self.lock[(section, package_name)]
+        return None
+
+    @classmethod
+    def github_url(cls, package_name, version):
+        if not package_name.startswith('REB_'):
+            org = cls._github_org
+        else:
+            org = cls._github_elec_org
+        return '/'.join((org, package_name, 'archive', str(version) + '.tar.gz'))
+
+    @classmethod
+    def github_archive(cls, package_name, version):
+        """Return the archive URL and cache key of a GitHub package."""
+        url = cls.github_url(package_name, version)
+        key = ('github',) + tuple(url.split('/')[-4:-2]) + (str(version),)
+        return url, key
+
+    @classmethod
+    def github_download(cls, package_name, version, cache=None):
+        url, key = cls.github_archive(package_name, version)
+        return download_and_extract(url, cache=cache, key=key)
+
+    def _github_fetch(self, package_name, version):
+        """
+        Download and unpack a package into the install directory and
+        return the sha256 of its archive, or None for a git clone.
+        """
+        raise NotImplementedError
+
+    def fetch(self, package_name, version):
+        """
+        Download and unpack a package unless fetch_all already did, and
+        return the sha256 of its archive.
+        """
+        if (package_name, version) not in self._fetched:
+            self._fetched[(package_name, version)] \
+                = self._github_fetch(package_name, version)
+        return self._fetched[(package_name, version)]
+
+    def fetch_all(self, packages):
+        """
+        Download and unpack the (package_name, version) pairs in
+        `packages` concurrently, using up to self.jobs workers.
+        """
+        packages = [x for x in dict.fromkeys(packages)
+                    if x not in self._fetched]
+        # Start the largest archives first, if the lockfile gives sizes.
+        packages.sort(key=lambda x: -(getattr(self._locked(x[0]), 'size',
+                                              None) or 0))
+        digests = run_parallel(self._github_fetch, packages, jobs=self.jobs)
+        self._fetched.update(zip(packages, digests))
+
+    def _step_inputs(self, kind, package_name, version):
+        inputs = dict(version=str(version))
+        if kind == 'lcatr':
+            inputs['python_exec'] = self.python_exec
+        elif kind == 'harnessed-jobs':
+            inputs['hj_folders'] = list(self.hj_folders)
+        elif kind == 'eups':
+            inputs['stack_dir'] = self.stack_dir
+            inputs['requires'] = self._eups_requires(package_name)
+        return inputs
+
+    def _source_digest(self, kind, package_name, version):
+        """
+        Return the sha256 of the archive that a step would install from,
+        if it is known without downloading it: the archive fetched by
+        this run, the one in the lockfile or the one in the archive
+        cache.  Returns None otherwise, e.g., for git clones.
+        """
+        if (package_name, version) in self._fetched:
+            return self._fetched[(package_name, version)]
+        section = self._step_sections[kind]
+        entry = self._locked(package_name, (section,))
+        if entry is not None and entry.sha256 is not None:
+            return entry.sha256
+        if self.cache is None:
+            return None
+        target = self._archive_url(section, package_name, version)
+        return self.cache.digest(target[1]) if target is not None else None
+
+    def _eups_requires(self, package_name):
+        """
+        Return the {package: source digest} of the [eups_packages] that
+        a package requires, directly or through other packages of the
+        section, so that rebuilding a package also rebuilds the packages
+        built against it.  The ups tables are read from the unpacked
+        trees in the current directory.
+        """
+        pars = self._section('eups_packages')
+        tables = dict((package, self._eups_table(package, version))
+                      for package, version in pars.items())
+        providers = dict((product, package) for package, (product, _)
+                         in tables.items() if product is not None)
+        requires = {}
+        pending = [package_name]
+        while pending:
+            for product in tables[pending.pop()][1]:
+                package = providers.get(product)
+                if package in (None, package_name) or package in requires:
+                    continue
+                requires[package] = (
+                    self._source_digest('eups', package, pars[package]) or
+                    self.state.steps.get('eups:' + package, {}).get('digest'))
+                pending.append(package)
+        return requires
+
+    def _jh_steps(self):
+        """
+        Return the (kind, package, version) of each step of jh() that
+        installs a downloaded package, in install order.
+        """
+        steps = [('lcatr', package, self.pars[package]) for package in
+                 ('lcatr-harness', 'lcatr-schema', 'lcatr-modulefiles')]
+        steps.append(('harnessed-jobs', 'harnessed-jobs',
+                      self.pars['harnessed-jobs']))
+        for kind, section in (('eups', 'eups_packages'),
+                              ('package', 'packages')):
+            try:
+                steps.extend((kind, package, version) for package, version
+                             in self._section(section).items())
+            except configparser.NoSectionError:
+                pass
+        return steps
+
+    _step_sections = {'lcatr': 'jh', 'harnessed-jobs': 'jh',
+                      'eups': 'eups_packages', 'package': 'packages'}
+
+    _step_phases = {'lcatr': 'build', 'harnessed-jobs': 'link',
+                    'eups': 'build', 'package': 'link'}
+
+    def _is_current(self, kind, package_name, version):
+        if (self.plan is not None and
+                (self._step_sections[kind], package_name) not in self.plan):
+            return True
+        return (version != 'master' and
+                self.state.is_current(
+                    ':'.join((kind, package_name)),
+                    self._step_inputs(kind, package_name, version),
+                    digest=self._source_digest(kind, package_name, version)))
+
+    def _jh_archives(self, kinds=('lcatr', 'harnessed-jobs', 'eups',
+                                  'package')):
+        return [(package, version) for kind, package, version
+                in self._jh_steps()
+                if kind in kinds and
+                not self._is_current(kind, package, version)]
+
+    def _archive_url(self, section, package_name, version):
+        """
+        Return the archive URL and cache key of a package, or None if
+        it is not downloaded as an archive.
+        """
+        raise NotImplementedError
+
+    def upgrade_plan(self, inst_dir, sections=('jh', 'eups_packages',
+                                               'packages')):
+        """
+        Return the Actions that upgrade the install in `inst_dir` from
+        its installed_versions.txt to this version file.
+        """
+        installed_file = os.path.join(inst_dir, 'installed_versions.txt')
+        installed = (read_versions(installed_file)
+                     if os.path.isfile(installed_file) else {})
+        plan = plan_upgrade(installed, self.versions.as_dict(),
+                            sections)
+        return estimate_sizes(plan, self._archive_url, cache=self.cache,
+                              jobs=self.jobs)
+
+    def gc(self, inst_dir, keep_generations=2, dry_run=False):
+        """
+        Remove the package trees and leftover files in `inst_dir` that
+        neither this version file, the install's installed_versions.txt,
+        an active symlink nor a kept generation refers to.
+        """
+        keep_names = tree_names(self.versions.as_dict())
+        installed_file = os.path.join(inst_dir, 'installed_versions.txt')
+        if os.path.isfile(installed_file):
+            keep_names |= tree_names(read_versions(installed_file))
+        garbage = find_garbage(inst_dir, keep_names, keep_generations)
+        total = remove_paths(inst_dir, garbage, dry_run=dry_run,
+                             jobs=self.jobs)
+        return total + self._gc_store(garbage, dry_run=dry_run)
+
+    def _gc_store(self, removed, dry_run=False):
+        """
+        Remove the trees of the package store, if there is one, that no
+        install directory uses once the `removed` paths are gone.
+        """
+        return 0
+
+    def remove_dropped(self, inst_dir, plan, dry_run=False):
+        """
+        Remove from `inst_dir` the package trees and links that the
+        'remove' actions of an upgrade plan drop.  Call this only after
+        the upgrade has been installed.
+        """
+        paths = dropped_paths(inst_dir, plan)
+        if not paths:
+            return 0
+        return remove_paths(inst_dir, paths, dry_run=dry_run, jobs=self.jobs)
+
+    def _run_step(self, kind, package_name, version, install):
+        """
+        Fetch a package and call install(package_name, version), unless
+        the install state shows this was already done with the same
+        inputs.
+        """
+        if self._is_current(kind, package_name, version):
+            print("Skipping {} {}: already installed.".format(package_name,
+                                                              version))
+            return
+        package_dir = os.path.join(self.inst_dir, '%s-%s' % (package_name,
+                                                             version))
+        with self.state.step(':'.join((kind, package_name)),
+                             self._step_inputs(kind, package_name, version),
+                             outputs=[package_dir]) as entry:
+            entry['digest'] = self.fetch(package_name, version)
+            # The lcatr packages install into the shared prefix, and
+            # the links do not add to the package trees.
+            with self.tracer.span(self._step_phases[kind], package_name,
+                                  version, outputs=([package_dir]
+                                                    if kind == 'eups'
+                                                    else None)):
+                install(package_name, version)
+
+    def lcatr_install(self, package_name):
+        self._run_step('lcatr', package_name, self.pars[package_name],
+                       self._lcatr_build)
+
+    def _shared(self, section, version):
+        """
+        Return whether the tree of a package version in inst_dir is
+        shared with other install directories, and so must not be
+        modified.
+        """
+        return False
+
+    @contextmanager
+    def _build_dir(self, package_name, version):
+        """
+        Yield the directory to build a [jh] package in: its tree in
+        inst_dir, or a private copy of the tree if that is shared.
+        """
+        source_dir = '%s-%s' % (package_name, version)
+        if not self._shared('jh', version):
+            yield source_dir
+            return
+        tmp_dir = tempfile.mkdtemp(prefix='.partial-', dir=self.inst_dir)
+        try:
+            build_dir = os.path.join(tmp_dir, source_dir)
+            shutil.copytree(source_dir, build_dir, symlinks=True)
+            yield build_dir
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def _lcatr_build(self, package_name, version):
+        with self._build_dir(package_name, version) as source_dir:
+            self._lcatr_install(package_name, version, source_dir)
+
+    def _lcatr_install(self, package_name, version, source_dir):
+        if self.wheels is not None:
+            try:
+                wheel = self.wheels.wheel(package_name, version, source_dir)
+            except subprocess.CalledProcessError:
+                warnings.warn('Could not build a wheel for %s; running '
+                              'setup.py install instead.' % source_dir)
+            else:
+                self.wheels.install(wheel, self.inst_dir)
+                return
+        inst_dir = self.inst_dir
+        python_exec = self.python_exec
+        command = "cd %(source_dir)s/; %(python_exec)s setup.py install --prefix=%(inst_dir)s" % locals()
+        # setup.py install rewrites shared files in the prefix, e.g.,
+        # easy-install.pth, so only one runs at a time.
+        with self._lock:
+            subprocess.check_call(command, shell=True,
+                                  executable=self._executable)
+
+    @property
+    def package_dirs(self):
+        if self._package_dirs is None:
+            self._package_dirs = {}
+            try:
+                pars = self._section('packages')
+                for package, version in pars.items():
+                    package_dir = "%(package)s-%(version)s" % locals()
+                    self._package_dirs[package] = os.path.join(self.inst_dir,
+                                                               package_dir)
+            except configparser.NoSectionError:
+                pass
+        return self._package_dirs
+
+    @property
+    def stack_dir(self):
+        if self._stack_dir is None:
+            try:
+                pars = self.versions['dmstack']
+                self._stack_dir = pars['stack_dir']
+            except configparser.NoSectionError:
+                pass
+        return self._stack_dir
+
+    def write_setup(self):
+        raise NotImplementedError
+
+    def _schema_paths(self):
+        paths = []
+        for package, package_dir in self.package_dirs.items():
+            if not os.path.isdir(os.path.join(package_dir, 'schemas')):
+                continue
+            paths.append("${%s}/schemas" % self._env_var(package))
+        paths.extend(['${HARNESSEDJOBSDIR}/schemas', '${LCATR_SCHEMA_PATH}'])
+        return 'export LCATR_SCHEMA_PATH=' + ':'.join(paths) + '\n'
+
+    def _package_env_vars(self):
+        contents = ""
+        for package, package_dir in self.package_dirs.items():
+            subdir = os.path.split(package_dir.rstrip(os.path.sep))[-1]
+            env_var = self._env_var(package)
+            contents += ("export %s=${INST_DIR}/%s\n" % (env_var, subdir))
+        return contents
+
+    @staticmethod
+    def _env_var(package_name):
+        return package_name.replace('-', '').upper() + 'DIR'
+
+    def _module_path(self):
+        try:
+            module_path = glob.glob('%s/lib/python*/site-packages'
+                                    % self.inst_dir)[0][len(self.inst_dir):]
+            return os.path.join('${INST_DIR}', module_path.lstrip(os.path.sep))
+        except IndexError:
+            message = "%s/lib/python*/site-packages not found." % self.inst_dir
+            warnings.warn(message)
+            return ''
+
+    def _python_dirs(self):
+        """
+        Return the directories that _python_configs would put on
+        PYTHONPATH, in order.
+        """
+        raise NotImplementedError
+
+    def _install_modules(self):
+        """
+        Install Environment Modules in the install directory, for
+        installers that do not use a site-wide one.
+        """
+
+    def jh(self):
+        os.chdir(self.inst_dir)
+        self._install_modules()
+        self.fetch_all(self._jh_archives(('lcatr', 'harnessed-jobs',
+                                          'package')))
+        # Wheels install without touching the other packages in the
+        # prefix, so only they are installed concurrently.
+        run_parallel(self.lcatr_install, [('lcatr-harness',),
+                                          ('lcatr-schema',),
+                                          ('lcatr-modulefiles',)],
+                     jobs=self.jobs if self.wheels is not None else 1)
+        inst_dir = self.inst_dir
+        with self.tracer.span('link', 'modulefiles'):
+            subprocess.check_call('ln -sf %(inst_dir)s/share/modulefiles %(inst_dir)s/Modules' % locals(), shell=True, executable=self._executable)
+            subprocess.check_call('touch `ls -d %(inst_dir)s/lib/python*/site-packages/lcatr`/__init__.py' % locals(), shell=True, executable=self._executable)
+        self._run_step('harnessed-jobs', 'harnessed-jobs',
+                       self.pars['harnessed-jobs'], self._hj_link)
+        self.eups_package_installer()
+        self.package_installer()
+        if self.import_root:
+            with self.tracer.span('link', IMPORT_ROOT):
+                self.build_import_root()
+        if self.precompile:
+            self.precompile_python()
+        with self.tracer.span('setup', 'setup.sh'):
+            self.write_setup()
+        shutil.copy(self.version_file,
+                    os.path.join(self.inst_dir, 'installed_versions.txt'))
+        if self.fast_setup:
+            with self.tracer.span('setup', 'setup-fast.sh'):
+                self.write_fast_setup()
+        os.chdir(self.curdir)
+
+    def write_fast_setup(self):
+        """
+        Write setup-fast.sh, which exports the environment resolved from
+        setup.sh and falls back to setup.sh if the stack or the EUPS
+        packages change.
+        """
+        extra_paths = []
+        if self.stack_dir is not None:
+            extra_paths.append(os.path.join(self.stack_dir, 'loadLSST.bash'))
+        return write_fast_setup(self.inst_dir, extra_paths,
+                                executable=self._executable)
+
+    def build_import_root(self):
+        """
+        Link the installed Python packages and modules into a single
+        import root directory and report any name collisions.
+        """
+        collisions = build_import_root(os.path.join(self.inst_dir,
+                                                    IMPORT_ROOT),
+                                       self._python_dirs())
+        report = format_collisions(collisions)
+        with open(os.path.join(self.inst_dir, IMPORT_ROOT + '-collisions.txt'),
+                  'w') as output:
+            output.write(report + '\n')
+        print(report)
+        return collisions
+
+    def precompile_python(self):
+        """
+        Byte-compile the Python trees installed in inst_dir.  Trees
+        linked from the package store were compiled before they were
+        stored.
+        """
+        inst_dir = os.path.realpath(self.inst_dir) + os.path.sep
+        trees = [x for x in self._python_dirs()
+                 if x.startswith(self.inst_dir + os.path.sep) and
+                 os.path.realpath(x).startswith(inst_dir)]
+        with self.tracer.span('compile', 'python', outputs=trees):
+            return compile_trees(trees, self.python_exec, state=self.state,
+                                 jobs=self.jobs)
+
+    def _hj_link(self, package_name, hj_version):
+        inst_dir = self.inst_dir
+        for folder in self.hj_folders:
+            subprocess.check_call('ln -sf %(inst_dir)s/harnessed-jobs-%(hj_version)s/%(folder)s/* %(inst_dir)s/share' % locals(), shell=True, executable=self._executable)
+
+    def _eups_table(self, package, version):
+        """Return the product name and requirements of an EUPS package."""
+        return read_table('%s-%s' % (package, version))
+
+    def eups_package_installer(self):
+        try:
+            pars = self._section('eups_packages')
+        except configparser.NoSectionError:
+            return
+        ups_db_dir = '%s/eups/ups_db' % self.inst_dir
+        if not os.path.isdir(ups_db_dir):
+            os.makedirs(ups_db_dir)
+        self.stack_session = StackSession(self.stack_dir,
+                                          '%s/eups' % self.inst_dir,
+                                          executable=self._executable)
+        packages = []
+        for package, version in pars.items():
+            if self._is_current('eups', package, version):
+                print("Skipping {} {}: already installed.".format(package,
+                                                                  version))
+            else:
+                packages.append(package)
+        build_in_order(packages,
+                       lambda package: self.fetch(package, pars[package]),
+                       lambda package: self._run_step('eups', package,
+                                                      pars[package],
+                                                      self._eups_build),
+                       lambda package: self._eups_table(package,
+                                                        pars[package]),
+                       jobs=self.jobs)
+
+    def _eups_build(self, package, version):
+        raise NotImplementedError
+
+    def package_installer(self):
+        try:
+            pars = self._section('packages')
+        except configparser.NoSectionError:
+            return
+        for package, version in pars.items():
+            self._run_step('package', package, version, self._package_link)
+
+    def _package_link(self, package, version):
+        inst_dir = self.inst_dir
+        package_dir = "%(package)s-%(version)s" % locals()
+        hj_dir = "%(inst_dir)s/%(package_dir)s/harnessed_jobs" % locals()
+        if os.path.isdir(hj_dir):
+            command = 'ln -sf %(hj_dir)s/* %(inst_dir)s/share' % locals()
+            subprocess.check_call(command, executable=self._executable,
+                                  shell=True)
+
+    def jh_test(self):
+        os.chdir(self.inst_dir)
+        try:
+            pars = self._section('eups_packages')
+            pars['eotest']
+            hj_version = self.pars['harnessed-jobs']
+            command = 'source ./setup.sh; python harnessed-jobs-%(hj_version)s/tests/setup_test.py' % locals()
+            subprocess.check_call(command, shell=True, executable=self._executable)
+            os.chdir(self.curdir)
+        except (configparser.NoSectionError, KeyError):
+            pass
+
+
+def add_arguments(parser):
+    """Add the command line options common to both installers."""
+    parser.add_argument("version_file", help='software version file')
+    parser.add_argument('--inst_dir', type=str, default=None,
+                        help='installation directory')
+    parser.add_argument('--site', type=str, default='SLAC',
+                        help='Site (SLAC, BNL, etc.)')
+    parser.add_argument('--hj_folders', type=str, default="SLAC")
+    parser.add_argument('--python_exec', type=str, default='python')
+    parser.add_argument('--dev', action='store_true')
+    parser.add_argument('--jobs', type=int, default=4,
+                        help='number of concurrent downloads')
+    parser.add_argument('--build_jobs', type=int, default=None,
+                        help='number of parallel scons jobs for each EUPS '
+                        'package build (default: CPUs/jobs)')
+    parser.add_argument('--fast_setup', action='store_true',
+                        help='also write setup-fast.sh with the environment '
+                        'of setup.sh resolved at install time')
+    parser.add_argument('--import_root', action='store_true',
+                        help='link the installed Python packages into one '
+                        'directory and put only that on PYTHONPATH')
+    parser.add_argument('--no_precompile', action='store_true',
+                        help='do not byte-compile the installed Python code')
+    parser.add_argument('--cache_dir', type=str, default=DEFAULT_CACHE_DIR,
+                        help='directory for cached package archives')
+    parser.add_argument('--cache_size', type=float, default=10,
+                        help='maximum size of the archive cache in GB')
+    parser.add_argument('--no_cache', action='store_true',
+                        help='download every archive and build every '
+                        'package without the cache in --cache_dir')
+    parser.add_argument('--reinstall', action='store_true',
+                        help='ignore the install state and redo every step')
+    parser.add_argument('--gc', action='store_true',
+                        help='remove unused package trees and files from '
+                        'the install directories and exit')
+    parser.add_argument('--dry_run', action='store_true',
+                        help='with --gc or --upgrade, only list what would '
+                        'be removed')
+    parser.add_argument('--keep_generations', type=int, default=2,
+                        help='with --gc, number of CCS generations to keep')
+    parser.add_argument('--plan', action='store_true',
+                        help='print the upgrade plan relative to the '
+                        'installed_versions.txt of the install and exit')
+    parser.add_argument('--upgrade', action='store_true',
+                        help='only install the packages whose versions '
+                        'changed since the last install')
+    parser.add_argument('--lock', type=str, default=None,
+                        help='compile the version file into this lockfile, '
+                        'with the URL, size and sha256 of every package, '
+                        'and exit')
+    parser.add_argument('--trace', type=str, default=None,
+                        help='write a Chrome trace of the install steps to '
+                        'this file and print a summary of them')
+
+
+def installer_args(args):
+    """Return the Installer keyword arguments of the common options."""
+    return dict(python_exec=args.python_exec,
+                hj_folders=args.hj_folders.split(), site=args.site,
+                jobs=args.jobs,
+                cache=(None if args.no_cache else
+                       ArchiveCache(args.cache_dir, args.cache_size*1024**3)),
+                reinstall=args.reinstall,
+                build_jobs=args.build_jobs,
+                fast_setup=args.fast_setup,
+                import_root=args.import_root,
+                precompile=not args.no_precompile,
+                trace=args.trace is not None)
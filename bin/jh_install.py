@@ -1,136 +1,109 @@
 #!/usr/bin/env python
 import os
+import sys
 import glob
-import shutil
+import argparse
 import subprocess
-import warnings
 import configparser
-
-class Parfile(dict):
-    def __init__(self, infile, section):
-        super(Parfile, self).__init__()
-        parser = configparser.ConfigParser()
-        parser.optionxform = str
-        result = parser.read(infile)
-        if not result:
-            raise RuntimeError("invalid or empty config file: {f}".format(f=infile))
-        for key, value in parser.items(section):
-            self[key] = self._cast(value)
-    def _cast(self, value):
-        if value == 'None':
-            return None
-        try:
-            if value.find('.') == -1 and value.find('e') == -1:
-                return int(value)
-            else:
-                return float(value)
-        except ValueError:
-            # Cannot cast as either int or float so just return the
-            # value as-is (presumably a string).
-            return value
-
+from fetch import download_and_extract
+from installer_base import InstallerBase, add_arguments, installer_args
+from upgrade_plan import format_plan, changed
+from eups_build import read_table, build_key, store_build, restore_build
+from import_root import IMPORT_ROOT
+from preflight import PROBE_JOBS, probe_url, probe_git, run_probes, \
+    format_problems
+from lockfile import compile_lock
 
 def get_package_name(package):
     pattern = os.path.join(package + '*', 'ups', '*.table')
     return os.path.basename(glob.glob(pattern)[0]).split('.')[0]
 
 
-class Installer(object):
-    _executable = '/bin/bash'
-    _github_org = 'https://github.com/lsst-camera-dh'
-    _github_elec_org = 'https://github.com/lsst-camera-electronics'
-    def __init__(self, version_file, inst_dir='.', python_exec='python',
-                 hj_folders=('BNL_T03',), site='BNL'):
-        self.version_file = os.path.abspath(version_file)
-        if inst_dir is not None:
-            self.inst_dir = os.path.abspath(inst_dir)
-            shutil.copy(self.version_file,
-                        os.path.join(self.inst_dir, 'installed_versions.txt'))
-        self.python_exec = python_exec
-        self.hj_folders = hj_folders
-        self.site = site
-        self._package_dirs = None
-        self._stack_dir = None
+class Installer(InstallerBase):
+    def __init__(self, *args, **kwds):
+        super(Installer, self).__init__(*args, **kwds)
         self._third_party_pars = None
-        self.curdir = os.path.abspath('.')
-        try:
-            self.pars = Parfile(self.version_file, 'jh')
-        except configparser.NoSectionError:
-            pass
-
-    def modules_install(self):
-        url = 'http://sourceforge.net/projects/modules/files/Modules/modules-3.2.10/modules-3.2.10.tar.gz'
-        inst_dir = self.inst_dir
-        commands = ";".join(["curl -L -O %(url)s",
-                             "tar xzf modules-3.2.10.tar.gz",
-                             "cd modules-3.2.10",
-                             "./configure --prefix=%(inst_dir)s",
-                             "make",
-                             "make install",
-                             "cd %(inst_dir)s"]) % locals()
-        subprocess.check_call(commands, shell=True, executable=self._executable)
-
-    @staticmethod
-    def github_download(package_name, version):
-        if not package_name.startswith('REB_'):
-            url = '/'.join((Installer._github_org, package_name, 'archive',
-                        version + '.tar.gz'))
-        else:
-            url = '/'.join((Installer._github_elec_org, package_name, 'archive',
-                        version + '.tar.gz'))
-        commands = ["curl -L -O " + url,
-                    "tar xzf %(version)s.tar.gz" % locals()]
-        for command in commands:
-            subprocess.check_call(command, shell=True,
-                                  executable=Installer._executable)
 
     @staticmethod
-    def github_clone(package_name, version):
+    def github_clone(package_name, version, commit=None):
         if not version:
             version = 'master'
         url = '/'.join((Installer._github_org, package_name + '.git'))
-        command = f'git clone {url}; cd {package_name}; git checkout {version}'
+        # Check out the commit recorded in a lockfile, if there is one.
+        command = f'git clone {url}; cd {package_name}; git checkout {commit or version}'
         subprocess.check_call(command, shell=True,
                               executable=Installer._executable)
 
-    def lcatr_install(self, package_name):
-        version = self.pars[package_name]
-        self.github_download(package_name, version)
-        inst_dir = self.inst_dir
-        python_exec = self.python_exec
-        command = "cd %(package_name)s-%(version)s/; %(python_exec)s setup.py install --prefix=%(inst_dir)s" % locals()
-        subprocess.check_call(command, shell=True, executable=self._executable)
+    def _github_fetch(self, package_name, version):
+        entry = self._locked(package_name)
+        with self.tracer.span('fetch', package_name, version):
+            if version == 'master':
+                self.github_clone(package_name, version,
+                                  commit=getattr(entry, 'commit', None))
+            elif entry is not None:
+                _, key = self.github_archive(package_name, version)
+                return download_and_extract(entry.url, cache=self.cache,
+                                            key=key, sha256=entry.sha256)
+            else:
+                return self.github_download(package_name, version,
+                                            cache=self.cache)
 
-    @property
-    def package_dirs(self):
-        if self._package_dirs is None:
-            self._package_dirs = {}
-            try:
-                pars = Parfile(self.version_file, 'packages')
-                for package, version in pars.items():
-                    package_dir = "%(package)s-%(version)s" % locals()
-                    self._package_dirs[package] = os.path.join(self.inst_dir,
-                                                               package_dir)
-            except configparser.NoSectionError:
-                pass
-        return self._package_dirs
+    def _archive_url(self, section, package_name, version):
+        if version == 'master':
+            return None
+        url, key = self.github_archive(package_name, version)
+        entry = self.lock.get((section, package_name))
+        return (entry.url if entry is not None else url), key
 
-    @property
-    def stack_dir(self):
-        if self._stack_dir is None:
-            try:
-                pars = Parfile(self.version_file, 'dmstack')
-                self._stack_dir = pars['stack_dir']
-            except configparser.NoSectionError:
-                pass
-        return self._stack_dir
+    def _lock_source(self, section, package_name, version):
+        """Return where a package is fetched from, for lock_entry."""
+        if version == 'master':
+            return ('git', '/'.join((self._github_org, package_name + '.git')),
+                    version)
+        return ('archive',) + self.github_archive(package_name, version)
+
+    def write_lock(self, lockfile):
+        """
+        Compile the version file into a lockfile, resolving the URL,
+        size and sha256 of every archive and the commit of every git
+        repository.  The archives are added to the cache on the way.
+        """
+        return compile_lock(self.version_file, lockfile, self._lock_source,
+                            sections=('jh', 'eups_packages', 'packages'),
+                            cache=self.cache, jobs=self.jobs)
+
+    def preflight_probes(self):
+        """
+        Return the (description, probe, args) of each archive and git
+        repository that jh() would fetch.
+        """
+        probes = []
+        for kind, package, version in self._jh_steps():
+            description = '[%s] %s %s' % (self._step_sections[kind], package,
+                                          version)
+            if version == 'master':
+                url = '/'.join((self._github_org, package + '.git'))
+                probes.append((description, probe_git, (url, version)))
+            else:
+                url, _ = self.github_archive(package, version)
+                probes.append((description, probe_url, (url,)))
+        return probes
+
+    def check(self):
+        """
+        Probe everything that jh() would fetch, without downloading
+        anything, and return a list of (description, problem).
+        """
+        if not hasattr(self, 'pars'):
+            return [('[jh]', 'no [jh] section in the package list')]
+        return run_probes(self.preflight_probes(),
+                          jobs=max(self.jobs, PROBE_JOBS))
 
     @property
     def third_party_pars(self):
         if self._third_party_pars is None:
             try:
-                self._third_party_pars = Parfile(self.version_file,
-                                                 'third_party')
+                self._third_party_pars = self.versions['third_party']
             except configparser.NoSectionError:
                 self._third_party_pars = dict()
         return self._third_party_pars
@@ -161,7 +134,7 @@ export EUPS_PATH=${INST_DIR}/eups:${EUPS_PATH}
 
     def _eups_config(self):
         try:
-            pars = Parfile(self.version_file, 'eups_packages')
+            pars = self._section('eups_packages')
         except configparser.NoSectionError:
             return ''
         return '\n'.join(['setup lsst_distrib'] +
@@ -183,37 +156,6 @@ export PATH=%(bin_path)s
 export SITENAME=%(site)s
 """ % locals()
 
-    def _schema_paths(self):
-        paths = []
-        for package, package_dir in self.package_dirs.items():
-            if not os.path.isdir(os.path.join(package_dir, 'schemas')):
-                continue
-            paths.append("${%s}/schemas" % self._env_var(package))
-        paths.extend(['${HARNESSEDJOBSDIR}/schemas', '${LCATR_SCHEMA_PATH}'])
-        return 'export LCATR_SCHEMA_PATH=' + ':'.join(paths) + '\n'
-
-    def _package_env_vars(self):
-        contents = ""
-        for package, package_dir in self.package_dirs.items():
-            subdir = os.path.split(package_dir.rstrip(os.path.sep))[-1]
-            env_var = self._env_var(package)
-            contents += ("export %s=${INST_DIR}/%s\n" % (env_var, subdir))
-        return contents
-
-    @staticmethod
-    def _env_var(package_name):
-        return package_name.replace('-', '').upper() + 'DIR'
-
-    def _module_path(self):
-        try:
-            module_path = glob.glob('%s/lib/python*/site-packages'
-                                    % self.inst_dir)[0][len(self.inst_dir):]
-            return os.path.join('${INST_DIR}', module_path.lstrip(os.path.sep))
-        except IndexError:
-            message = "%s/lib/python*/site-packages not found." % self.inst_dir
-            warnings.warn(message)
-            return ''
-
     def _python_configs(self):
         python_dirs = [os.path.join('${'+self._env_var(x)+'}', 'python')
                        for x in self.package_dirs]
@@ -223,97 +165,103 @@ export SITENAME=%(site)s
             python_dirs.append(path)
         python_dirs.extend(['${HARNESSEDJOBSDIR}/python', self._module_path(),
                             '${PYTHONPATH}'])
+        if self.import_root:
+            python_dirs = ['${INST_DIR}/' + IMPORT_ROOT, '${PYTHONPATH}']
         python_configs = "export PYTHONPATH=%s\n" % ":".join(python_dirs)
         return python_configs
 
-    def jh(self):
-        os.chdir(self.inst_dir)
-        #self.modules_install()
-        self.lcatr_install('lcatr-harness')
-        self.lcatr_install('lcatr-schema')
-        self.lcatr_install('lcatr-modulefiles')
-        inst_dir = self.inst_dir
-        subprocess.check_call('ln -sf %(inst_dir)s/share/modulefiles %(inst_dir)s/Modules' % locals(), shell=True, executable=self._executable)
-        subprocess.check_call('touch `ls -d %(inst_dir)s/lib/python*/site-packages/lcatr`/__init__.py' % locals(), shell=True, executable=self._executable)
-        hj_version = self.pars['harnessed-jobs']
-        self.github_download('harnessed-jobs', hj_version)
-        for folder in self.hj_folders:
-            subprocess.check_call('ln -sf %(inst_dir)s/harnessed-jobs-%(hj_version)s/%(folder)s/* %(inst_dir)s/share' % locals(), shell=True, executable=self._executable)
-        self.eups_package_installer()
-        self.package_installer()
-        self.write_setup()
-        os.chdir(self.curdir)
+    def _python_dirs(self):
+        """
+        Return the directories that _python_configs would put on
+        PYTHONPATH, in order.
+        """
+        python_dirs = [os.path.join(x, 'python')
+                       for x in self.package_dirs.values()]
+        for package_dir, path in self.third_party_pars.items():
+            if package_dir in ('modules_dir', 'eo_utilities_dir'):
+                continue
+            python_dirs.append(path)
+        python_dirs.append(os.path.join(self.inst_dir, 'harnessed-jobs-%s'
+                                        % self.pars['harnessed-jobs'],
+                                        'python'))
+        python_dirs.extend(glob.glob('%s/lib/python*/site-packages'
+                                     % self.inst_dir)[:1])
+        return python_dirs
 
-    def eups_package_installer(self):
-        try:
-            pars = Parfile(self.version_file, 'eups_packages')
-        except configparser.NoSectionError:
-            return
-        inst_dir = self.inst_dir
-        stack_dir = self.stack_dir.rstrip(os.path.sep)
-        ups_db_dir = '%(inst_dir)s/eups/ups_db' % locals()
-        if not os.path.isdir(ups_db_dir):
-            os.makedirs(ups_db_dir)
-        for package, version in pars.items():
-            if package == 'obs_lsst':
-                scons_command = 'scons lib python shebang examples doc policy python/lsst/obs/lsst/version.py'
-            else:
-                scons_command = 'scons'
-            if version == 'master':
-                self.github_clone(package, version)
-            else:
-                self.github_download(package, version)
-            package_name = get_package_name(package)
-            commands = """source %(stack_dir)s/loadLSST.bash; export EUPS_PATH=%(inst_dir)s/eups:${EUPS_PATH}; cd %(package)s*; eups declare %(package_name)s %(version)s -r . -c; setup %(package_name)s; %(scons_command)s""" % locals()
-            subprocess.check_call(commands, shell=True,
-                                  executable=self._executable)
+    def _eups_table(self, package, version):
+        return read_table(package + '*')
 
-    def package_installer(self):
-        try:
-            pars = Parfile(self.version_file, 'packages')
-        except configparser.NoSectionError:
-            return
-        inst_dir = self.inst_dir
-        for package, version in pars.items():
-            self.github_download(package, version)
-            package_dir = "%(package)s-%(version)s" % locals()
-            hj_dir = "%(inst_dir)s/%(package_dir)s/harnessed_jobs" % locals()
-            if os.path.isdir(hj_dir):
-                command = 'ln -sf %(hj_dir)s/* %(inst_dir)s/share' % locals()
-                subprocess.check_call(command, executable=self._executable,
-                                shell=True)
+    @staticmethod
+    def _scons_targets(package):
+        if package == 'obs_lsst':
+            return 'lib python shebang examples doc policy python/lsst/obs/lsst/version.py'
+        return ''
 
-    def jh_test(self):
-        os.chdir(self.inst_dir)
-        try:
-            pars = Parfile(self.version_file, 'eups_packages')
-            pars['eotest']
-            hj_version = self.pars['harnessed-jobs']
-            command = 'source ./setup.sh; python harnessed-jobs-%(hj_version)s/tests/setup_test.py' % locals()
-            subprocess.check_call(command, shell=True, executable=self._executable)
-            os.chdir(self.curdir)
-        except (configparser.NoSectionError, KeyError):
-            pass
+    def _eups_build(self, package, version):
+        stack_dir = self.stack_dir.rstrip(os.path.sep)
+        scons_command = 'scons -j %d %s' % (self.build_jobs,
+                                            self._scons_targets(package))
+        key = build_key(package, version,
+                        self._fetched.get((package, version)), stack_dir,
+                        self._scons_targets(package),
+                        requires=self._eups_requires(package))
+        restored = restore_build(self.cache, key)
+        package_name = get_package_name(package)
+        commands = """cd %(package)s*; eups declare %(package_name)s %(version)s -r . -c""" % locals()
+        if restored:
+            print("Restored the {} {} build from the cache.".format(package,
+                                                                    version))
+        else:
+            commands += """; setup %(package_name)s; %(scons_command)s""" % locals()
+        self.stack_session.run(commands)
+        if not restored and key is not None and self.cache is not None:
+            package_dir = glob.glob(package + '*')[0]
+            store_build(self.cache, key, package_dir)
 
 if __name__ == '__main__':
-    import argparse
-
     parser = argparse.ArgumentParser(description="Job Harness Installer",
                                      fromfile_prefix_chars="@")
-    parser.add_argument("version_file", help='software version file')
-    parser.add_argument('--inst_dir', type=str, default=None,
-                        help='installation directory')
-    parser.add_argument('--site', type=str, default='SLAC',
-                        help='Site (SLAC, BNL, etc.)')
-    parser.add_argument('--hj_folders', type=str, default="SLAC")
-    parser.add_argument('--python_exec', type=str, default='python')
-    parser.add_argument('--dev', action='store_true')
+    add_arguments(parser)
+    parser.add_argument('--check', action='store_true',
+                        help='check that every package in the list can be '
+                        'downloaded, then exit')
 
     args = parser.parse_args()
 
+    for option in ('gc', 'plan', 'upgrade'):
+        if getattr(args, option) and args.inst_dir is None:
+            parser.error('--%s needs --inst_dir' % option)
+
     installer = Installer(args.version_file, inst_dir=args.inst_dir,
-                          python_exec=args.python_exec,
-                          hj_folders=args.hj_folders.split(), site=args.site)
+                          **installer_args(args))
+
+    if args.lock is not None:
+        installer.write_lock(args.lock)
+        print("Wrote", args.lock)
+        sys.exit(0)
+
+    if args.check:
+        problems = installer.check()
+        print(format_problems(problems))
+        sys.exit(1 if problems else 0)
+
+    if args.gc:
+        installer.gc(args.inst_dir, args.keep_generations, args.dry_run)
+        sys.exit(0)
+
+    plan = []
+    if args.plan or args.upgrade:
+        plan = installer.upgrade_plan(args.inst_dir)
+        print(format_plan(plan))
+        if args.plan:
+            sys.exit(0)
+        installer.plan = changed(plan)
 
-    if args.inst_dir is not None:
-        installer.jh()
+    try:
+        if args.inst_dir is not None:
+            installer.jh()
+            installer.remove_dropped(args.inst_dir, plan, dry_run=args.dry_run)
+    finally:
+        if args.trace is not None:
+            installer.tracer.write(args.trace)
+            print(installer.tracer.summary())
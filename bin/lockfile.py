@@ -0,0 +1,159 @@
+"""
+Lockfiles: package lists compiled with the exact version string,
+download URL, size and sha256 of each archive (or the commit of each
+git clone), so that installs are reproducible and every fetch can be
+verified against a known digest.
+"""
+from __future__ import print_function, absolute_import
+import os
+import warnings
+import subprocess
+from collections import namedtuple, OrderedDict
+from fetch import run_parallel, open_url, TeeReader, _no_limit
+from upgrade_plan import read_versions, PACKAGE_SECTIONS, LINK_TOKENS
+from version_file import VersionFile, read_version_file
+
+LOCK_PREFIX = 'lock:'
+
+LockEntry = namedtuple('LockEntry', 'version url size sha256 commit')
+
+
+def lock_section(section, package):
+    return '%s%s:%s' % (LOCK_PREFIX, section, package)
+
+
+def read_lock(version_file):
+    """
+    Return the {(section, package): LockEntry} of the lock sections of
+    a package list, given as a path or a VersionFile, which is empty if
+    it is not a lockfile.  Entries whose version is no longer the one
+    in the package list are stale, and are dropped with a warning.
+    """
+    if not isinstance(version_file, VersionFile):
+        version_file = read_version_file(version_file)
+    lock = OrderedDict()
+    for name in version_file.sections():
+        if not name.startswith(LOCK_PREFIX):
+            continue
+        section, package = name[len(LOCK_PREFIX):].split(':', 1)
+        items = version_file.versions(name)
+        if (section not in version_file or
+                version_file.versions(section).get(package)
+                != items['version']):
+            warnings.warn('%s: [%s] %s is not at the locked version %s; '
+                          'recompile the lockfile'
+                          % (version_file.path, section, package,
+                             items['version']))
+            continue
+        lock[(section, package)] = LockEntry(
+            items['version'], items['url'],
+            int(items['size']) if items.get('size') else None,
+            items.get('sha256') or None, items.get('commit') or None)
+    return lock
+
+
+def archive_digest(url, cache=None, key=None, limiter=None):
+    """
+    Return the size and sha256 of the archive at `url`.  The archive is
+    read from the cache if it is there, and otherwise downloaded into
+    it, so that compiling a lockfile also warms the cache.  Archives
+    without a cache key, e.g., SNAPSHOT builds, are not cached.
+    """
+    if key is None:
+        cache = None
+    if cache is not None:
+        blob = cache.get(key)
+        if blob is not None:
+            return os.path.getsize(blob), cache.digest(key)
+    filename = cache.tempfile() if cache is not None else None
+    try:
+        with (limiter.slot(url) if limiter is not None
+              else _no_limit()), open_url(url) as response:
+            output = open(filename, 'wb') if filename is not None else None
+            try:
+                reader = TeeReader(response, output)
+                reader.drain()
+            finally:
+                if output is not None:
+                    output.close()
+        digest = reader.sha256.hexdigest()
+        if filename is not None:
+            cache.put(key, filename, digest)
+    finally:
+        if filename is not None and os.path.exists(filename):
+            os.remove(filename)
+    return reader.nbytes, digest
+
+
+def git_commit(url, ref):
+    """Return the commit that branch or tag `ref` of a repository is at."""
+    env = dict(os.environ, GIT_TERMINAL_PROMPT='0')
+    output = subprocess.check_output(
+        ['git', 'ls-remote', '--exit-code', url, 'refs/heads/%s' % ref,
+         'refs/tags/%s' % ref, 'refs/tags/%s^{}' % ref],
+        env=env).decode('utf-8')
+    refs = dict(line.split('\t')[::-1] for line in output.splitlines())
+    # An annotated tag is followed by the commit it points to.
+    for name in ('refs/tags/%s^{}' % ref, 'refs/heads/%s' % ref,
+                 'refs/tags/%s' % ref):
+        if name in refs:
+            return refs[name]
+
+
+def lock_entry(source, version, cache=None, limiter=None):
+    """
+    Resolve one package given its source, ('archive', url, cache key)
+    or ('git', url, ref).
+    """
+    if source[0] == 'git':
+        return LockEntry(version, source[1], None, None,
+                         git_commit(source[1], source[2]))
+    size, sha256 = archive_digest(source[1], cache=cache, key=source[2],
+                                  limiter=limiter)
+    return LockEntry(version, source[1], size, sha256, None)
+
+
+def compile_lock(version_file, lockfile, source_for, sections=PACKAGE_SECTIONS,
+                 cache=None, limiter=None, jobs=1):
+    """
+    Write `lockfile`: the package list in `version_file` followed by a
+    lock section for each package of `sections`, with the download
+    URL, size and sha256 of its archive, or the commit of its git
+    repository.  source_for(section, package, version) returns the
+    source to pass to lock_entry.  Returns the {(section, package):
+    LockEntry} written.
+    """
+    versions = read_versions(version_file)
+    packages = [(section, package, version)
+                for section in sections
+                for package, version in versions.get(section, {}).items()
+                if not (section == 'ccs' and package.startswith(LINK_TOKENS))]
+    entries = run_parallel(
+        lambda section, package, version: lock_entry(
+            source_for(section, package, version), version, cache=cache,
+            limiter=limiter),
+        packages, jobs=jobs)
+    lock = OrderedDict(((section, package), entry) for
+                       (section, package, _), entry in zip(packages, entries))
+
+    with open(version_file) as infile:
+        lines = infile.read().rstrip('\n').split('\n')
+    # Drop the lock sections of a lockfile that is being recompiled.
+    contents = []
+    in_lock = False
+    for line in lines:
+        if line.startswith('['):
+            in_lock = line.startswith('[' + LOCK_PREFIX)
+        if not in_lock:
+            contents.append(line)
+    while contents and not contents[-1].strip():
+        contents.pop()
+    for (section, package), entry in lock.items():
+        contents.extend(['', '[%s]' % lock_section(section, package)])
+        contents.extend('%s = %s' % (field, value) for field, value
+                        in zip(LockEntry._fields, entry) if value is not None)
+    tmp_file = '%s.tmp-%d' % (lockfile, os.getpid())
+    with open(tmp_file, 'w') as output:
+        output.write('\n'.join(contents) + '\n')
+    os.replace(tmp_file, lockfile)
+    return lock
@@ -0,0 +1,91 @@
+"""
+Shared build of Environment Modules, made once per host and linked into
+each install directory.
+"""
+from __future__ import print_function, absolute_import
+import os
+import fcntl
+import shutil
+import platform
+import tempfile
+import subprocess
+from contextlib import contextmanager
+from fetch import download_and_extract
+
+
+def modules_url(version):
+    return ('http://sourceforge.net/projects/modules/files/Modules/'
+            'modules-%(version)s/modules-%(version)s.tar.gz' % locals())
+
+
+def modules_prefix(cache_dir, version):
+    """
+    Return the install prefix of the shared Modules build in
+    `cache_dir`.  The name includes the OS, architecture and C library,
+    since a home directory cache may be shared by different hosts.
+    """
+    libc = '-'.join(x for x in platform.libc_ver() if x)
+    name = '-'.join(x for x in ('modules', version, platform.system(),
+                                platform.machine(), libc) if x)
+    return os.path.join(os.path.abspath(os.path.expanduser(cache_dir)),
+                        'modules', name)
+
+
+@contextmanager
+def _file_lock(path):
+    with open(path, 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def build_modules(prefix, version, cache=None, build_jobs=1,
+                  executable='/bin/bash'):
+    """
+    Build and install Modules `version` in `prefix`, unless a complete
+    build is already there, and return the Modules home directory,
+    <prefix>/Modules/<version>.  Concurrent installs wait for one
+    another, and a build that was interrupted is redone from scratch.
+    """
+    modules_home = os.path.join(prefix, 'Modules', version)
+    marker = os.path.join(prefix, '.complete')
+    parent = os.path.dirname(prefix)
+    if not os.path.isdir(parent):
+        os.makedirs(parent)
+    with _file_lock(prefix + '.lock'):
+        if os.path.exists(marker):
+            return modules_home
+        if os.path.isdir(prefix):
+            shutil.rmtree(prefix)
+        src_dir = tempfile.mkdtemp(prefix='.partial-', dir=parent)
+        try:
+            download_and_extract(modules_url(version), src_dir, cache=cache,
+                                 key=('sourceforge', 'modules', version))
+            command = ('cd %s/modules-%s; ./configure --prefix=%s && '
+                       'make -j %d && make install'
+                       % (src_dir, version, prefix, build_jobs))
+            subprocess.check_call(command, shell=True, executable=executable)
+        finally:
+            shutil.rmtree(src_dir, ignore_errors=True)
+        open(marker, 'w').close()
+    return modules_home
+
+
+def link_modules(modules_home, inst_dir, version):
+    """
+    Point <inst_dir>/Modules/<version> at a shared Modules build.
+    <inst_dir>/Modules itself stays a directory of the install, since
+    the installer links the install's modulefiles into it.
+    """
+    link = os.path.join(inst_dir, 'Modules', version)
+    if not os.path.isdir(os.path.dirname(link)):
+        os.makedirs(os.path.dirname(link))
+    if os.path.isdir(link) and not os.path.islink(link):
+        # A Modules build of the install's own.
+        shutil.rmtree(link)
+    tmp_link = '%s.tmp-%d' % (link, os.getpid())
+    os.symlink(modules_home, tmp_link)
+    os.replace(tmp_link, link)
+    return link
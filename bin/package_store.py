@@ -0,0 +1,248 @@
+"""
+Shared store of unpacked and built package trees.  Install directories
+on the same server that use the same package version link to one tree
+in the store instead of each unpacking (and building) their own copy.
+"""
+from __future__ import print_function, absolute_import
+import os
+import time
+import errno
+import shutil
+import hashlib
+import tempfile
+import threading
+
+LINK_MODES = ('symlink', 'hardlink')
+
+
+def _link_or_copy(src, dest):
+    try:
+        os.link(src, dest)
+    except OSError as eobj:
+        # Across file systems, or where hard links are not allowed.
+        if eobj.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+            raise
+        shutil.copy2(src, dest)
+
+
+def _remove(path):
+    if os.path.islink(path) or os.path.isfile(path):
+        os.remove(path)
+    elif os.path.isdir(path):
+        shutil.rmtree(path)
+
+
+class PackageStore(object):
+    """
+    Trees are stored as trees/<key...>/<name>, where the key identifies
+    the package tree, e.g., the ArchiveCache key of its archive or the
+    build key of an EUPS build, and <name> is the <package>-<version>
+    directory the tree has in an install.  Trees are made in a staging
+    directory and renamed into place, so a tree in the store is always
+    complete, and they are never modified once stored.
+
+    `link_mode` is 'symlink' to link each install directory's
+    <package>-<version> to the stored tree, or 'hardlink' to give each
+    install directory its own tree of hard links to the stored files,
+    which also works for tools that resolve paths or are confused by
+    symlinks.  Each link is recorded in links/, so that unused() can
+    tell which stored trees no install directory links to any more.
+    """
+    def __init__(self, store_dir, link_mode='symlink'):
+        if link_mode not in LINK_MODES:
+            raise ValueError('link_mode must be one of %s'
+                             % ', '.join(LINK_MODES))
+        self.store_dir = os.path.abspath(os.path.expanduser(store_dir))
+        self.link_mode = link_mode
+        self.tree_dir = os.path.join(self.store_dir, 'trees')
+        self.link_dir = os.path.join(self.store_dir, 'links')
+        self.tmp_dir = os.path.join(self.store_dir, 'tmp')
+        for path in (self.tree_dir, self.link_dir, self.tmp_dir):
+            if not os.path.isdir(path):
+                os.makedirs(path)
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    def _key_dir(self, key):
+        return os.path.join(self.tree_dir, *[str(x) for x in key])
+
+    def _key_lock(self, key):
+        with self._lock:
+            return self._key_locks.setdefault(tuple(key), threading.Lock())
+
+    def tree(self, key):
+        """Return the path of the tree stored under `key`, or None."""
+        key_dir = self._key_dir(key)
+        try:
+            names = [x for x in os.listdir(key_dir) if x != 'digest']
+        except OSError:
+            return None
+        return os.path.join(key_dir, names[0]) if names else None
+
+    def digest(self, key):
+        """Return the digest recorded with the tree of `key`, or None."""
+        try:
+            with open(os.path.join(self._key_dir(key), 'digest')) as infile:
+                return infile.read().strip() or None
+        except IOError:
+            return None
+
+    def put(self, key, tree, digest=None):
+        """
+        Move the directory `tree` into the store under `key` and return
+        the path of the stored tree.  If another install stored the key
+        first, `tree` is removed and the stored one returned.
+        """
+        staging = tempfile.mkdtemp(dir=self.tmp_dir)
+        try:
+            os.rename(tree, os.path.join(staging,
+                                         os.path.basename(tree.rstrip('/'))))
+            # The digest file, empty if the digest is unknown, also
+            # marks the key directory for unused().
+            with open(os.path.join(staging, 'digest'), 'w') as output:
+                output.write(digest + '\n' if digest is not None else '')
+            key_dir = self._key_dir(key)
+            if not os.path.isdir(os.path.dirname(key_dir)):
+                try:
+                    os.makedirs(os.path.dirname(key_dir))
+                except OSError as eobj:
+                    if eobj.errno != errno.EEXIST:
+                        raise
+            try:
+                os.rename(staging, key_dir)
+            except OSError as eobj:
+                if eobj.errno not in (errno.EEXIST, errno.ENOTEMPTY):
+                    raise
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+        return self.tree(key)
+
+    def ensure(self, key, make):
+        """
+        Return the (path, digest) of the tree stored under `key`.  If
+        there is none, make(dest_dir) is called to make the tree as the
+        only entry of an empty directory and return its digest, and the
+        tree is stored.  Each key is made at most once at a time.
+        """
+        with self._key_lock(key):
+            tree = self.tree(key)
+            if tree is not None:
+                return tree, self.digest(key)
+            staging = tempfile.mkdtemp(dir=self.tmp_dir)
+            try:
+                digest = make(staging)
+                names = os.listdir(staging)
+                if len(names) != 1:
+                    raise RuntimeError('expected one tree for %s, found %s'
+                                       % ('/'.join(map(str, key)), names))
+                tree = self.put(key, os.path.join(staging, names[0]), digest)
+            finally:
+                shutil.rmtree(staging, ignore_errors=True)
+            return tree, digest
+
+    def link(self, tree, dest):
+        """Replace `dest` with a link to a stored tree."""
+        dest = os.path.abspath(dest)
+        if (self.link_mode == 'symlink' and os.path.islink(dest) and
+                os.readlink(dest) == tree):
+            return
+        self._record_link(tree, dest)
+        tmp_dest = '%s.tmp-%d' % (dest, os.getpid())
+        _remove(tmp_dest)
+        if self.link_mode == 'symlink':
+            os.symlink(tree, tmp_dest)
+        else:
+            shutil.copytree(tree, tmp_dest, symlinks=True,
+                            copy_function=_link_or_copy)
+        _remove(dest)
+        os.rename(tmp_dest, dest)
+
+    def adopt(self, key, tree, digest=None):
+        """
+        Move a tree made in an install directory, e.g., an EUPS build,
+        into the store and link it back in its place.  Returns the path
+        of the stored tree.
+        """
+        tree = os.path.abspath(tree)
+        stored = self.put(key, tree, digest)
+        self.link(stored, tree)
+        return stored
+
+    def _record_link(self, tree, dest):
+        record = os.path.join(self.link_dir,
+                              hashlib.sha1(dest.encode('utf-8')).hexdigest())
+        tmp_record = '%s.tmp-%d' % (record, os.getpid())
+        with open(tmp_record, 'w') as output:
+            output.write('%s\n%s\n' % (dest, tree))
+        os.rename(tmp_record, record)
+
+    def _links_to(self, dest, tree):
+        if os.path.islink(dest):
+            return os.readlink(dest) == tree
+        if not os.path.isdir(dest):
+            return False
+        # A tree of hard links: the files are the stored ones.
+        for root, dirs, files in os.walk(tree):
+            for name in files:
+                path = os.path.join(root, name)
+                if os.path.islink(path):
+                    continue
+                copy = os.path.join(dest, os.path.relpath(path, tree))
+                try:
+                    return os.path.samefile(path, copy)
+                except OSError:
+                    return False
+        return True
+
+    def unused(self, min_age=3600, removed=()):
+        """
+        Return the paths in the store that no install directory uses:
+        the key directories of trees that no recorded link still links
+        to, the records of links that are gone, and leftover staging
+        directories.  Links in `removed`, e.g., the garbage of an
+        install directory that a dry run only reports, count as gone.
+        Anything changed in the last `min_age` seconds is kept, since a
+        running install may be about to link to it.  The copy of the ups
+        tables of an EUPS package is kept while a build of the same
+        package version is used.
+        """
+        cutoff = time.time() - min_age
+        removed = set(os.path.realpath(x) for x in removed)
+        garbage = []
+        used = set()
+        for name in sorted(os.listdir(self.link_dir)):
+            record = os.path.join(self.link_dir, name)
+            try:
+                with open(record) as infile:
+                    dest, tree = infile.read().split('\n')[:2]
+            except (IOError, ValueError):
+                dest = tree = None
+            if os.lstat(record).st_mtime > cutoff:
+                used.add(tree)
+            elif (dest is not None and
+                  os.path.realpath(dest) not in removed and
+                  self._links_to(dest, tree)):
+                used.add(tree)
+            else:
+                garbage.append(record)
+
+        builds = set(os.path.basename(x) for x in used if x is not None)
+        for root, dirs, files in os.walk(self.tree_dir):
+            if 'digest' not in files:
+                continue
+            dirs[:] = []
+            names = [x for x in os.listdir(root) if x != 'digest']
+            trees = [os.path.join(root, x) for x in names]
+            key = os.path.relpath(root, self.tree_dir).split(os.path.sep)
+            if (os.lstat(root).st_mtime > cutoff or
+                    any(x in used for x in trees) or
+                    (key[0] == 'eups-tables' and len(key) > 2 and
+                     '%s-%s' % (key[1], key[2]) in builds)):
+                continue
+            garbage.append(root)
+
+        for name in sorted(os.listdir(self.tmp_dir)):
+            path = os.path.join(self.tmp_dir, name)
+            if os.lstat(path).st_mtime <= cutoff:
+                garbage.append(path)
+        return garbage
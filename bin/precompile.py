@@ -0,0 +1,70 @@
+"""
+Byte-compilation of the Python trees of an install, so that jobs start
+against up-to-date .pyc files.
+"""
+from __future__ import print_function, absolute_import
+import os
+import time
+import subprocess
+from fetch import run_parallel
+
+
+def tree_fingerprint(path):
+    """Return the number of .py files under `path` and the newest mtime."""
+    count = 0
+    newest = 0
+    for root, dirs, files in os.walk(path):
+        if '__pycache__' in dirs:
+            dirs.remove('__pycache__')
+        for name in files:
+            if name.endswith('.py'):
+                count += 1
+                newest = max(newest,
+                             os.lstat(os.path.join(root, name)).st_mtime)
+    return [count, newest]
+
+
+def compile_tree(path, python_exec='python'):
+    """
+    Byte-compile `path` with `python_exec`, which may differ from the
+    interpreter running the installer.  Returns the elapsed time and
+    whether all of the files compiled.
+    """
+    start = time.time()
+    with open(os.devnull, 'w') as devnull:
+        status = subprocess.call([python_exec, '-m', 'compileall', '-q',
+                                  path], stdout=devnull)
+    return time.time() - start, status == 0
+
+
+def compile_trees(trees, python_exec='python', state=None, jobs=1):
+    """
+    Byte-compile the directory `trees`, up to `jobs` at a time, each in
+    its own interpreter process.  With an InstallState, trees whose
+    sources are unchanged since they were last compiled with the same
+    interpreter are skipped.  Prints the time taken for each tree and
+    returns a list of (tree, seconds, ok), where seconds is None for
+    skipped trees.
+    """
+    trees = [x for x in dict.fromkeys(trees) if os.path.isdir(x)]
+
+    def compile_one(tree):
+        inputs = dict(python_exec=python_exec,
+                      sources=tree_fingerprint(tree))
+        name = 'compile:' + tree
+        if state is not None and state.is_current(name, inputs):
+            return tree, None, True
+        if state is None:
+            return (tree,) + compile_tree(tree, python_exec)
+        with state.step(name, inputs, outputs=[tree]) as entry:
+            seconds, entry['ok'] = compile_tree(tree, python_exec)
+        return tree, seconds, entry['ok']
+
+    results = run_parallel(compile_one, [(x,) for x in trees], jobs=jobs)
+    for tree, seconds, ok in results:
+        if seconds is None:
+            print('   current  %s' % tree)
+        else:
+            print('%8.2f s  %s%s' % (seconds, tree,
+                                     '' if ok else ' (some files failed)'))
+    return results
@@ -0,0 +1,95 @@
+"""
+Pre-flight checks of a package list: every archive and repository an
+install would fetch is probed concurrently, and the targets of the CCS
+symlink and executable entries are checked against what the list
+installs, before anything is downloaded.
+"""
+from __future__ import print_function, absolute_import
+import os
+import subprocess
+from urllib.error import HTTPError
+from fetch import run_parallel, open_url
+
+PROBE_JOBS = 16
+
+
+def probe_url(url, timeout=30):
+    """
+    Return None if `url` can be downloaded, or a description of the
+    problem.  A HEAD request is used, unless the server does not
+    support it.
+    """
+    for method in ('HEAD', 'GET'):
+        try:
+            with open_url(url, timeout=timeout, method=method):
+                return None
+        except HTTPError as eobj:
+            if method == 'HEAD' and eobj.code in (403, 405, 501):
+                continue
+            return 'HTTP %d %s' % (eobj.code, eobj.reason)
+        except (IOError, ValueError) as eobj:
+            return str(eobj)
+
+
+def probe_git(url, ref, timeout=30):
+    """
+    Return None if the git repository at `url` has a branch or tag
+    named `ref`, or a description of the problem.
+    """
+    env = dict(os.environ, GIT_TERMINAL_PROMPT='0')
+    command = ['git', 'ls-remote', '--exit-code', url,
+               'refs/heads/%s' % ref, 'refs/tags/%s' % ref]
+    try:
+        process = subprocess.run(command, stdout=subprocess.PIPE,
+                                 stderr=subprocess.PIPE, env=env,
+                                 timeout=timeout)
+    except subprocess.TimeoutExpired:
+        return 'git ls-remote timed out'
+    if process.returncode == 2:
+        return 'no branch or tag %s' % ref
+    if process.returncode != 0:
+        lines = process.stderr.decode('utf-8', 'replace').strip().splitlines()
+        return lines[-1] if lines else 'git ls-remote failed'
+    return None
+
+
+def link_problems(links, names):
+    """
+    Return a (link, problem) for each of the (link name, target) pairs
+    in `links` whose target does not start with one of the `names`
+    that the install makes, e.g., package links and <package>-<version>
+    directories.  Absolute targets must exist on this host.
+    """
+    problems = []
+    for link, target in links:
+        if os.path.isabs(target):
+            if not os.path.exists(target):
+                problems.append((link, 'target %s does not exist' % target))
+            continue
+        parts = os.path.normpath(target).split(os.path.sep)
+        while parts and parts[0] == '..':
+            parts.pop(0)
+        if not parts or parts[0] not in names:
+            problems.append((link, 'target %s is not installed by this '
+                             'package list' % target))
+    return problems
+
+
+def run_probes(probes, jobs=PROBE_JOBS):
+    """
+    Run the (description, probe, args) `probes` concurrently and return
+    a (description, problem) for each one that failed.
+    """
+    results = run_parallel(lambda description, probe, args:
+                           (description, probe(*args)), probes, jobs=jobs)
+    return [(description, problem) for description, problem in results
+            if problem is not None]
+
+
+def format_problems(problems):
+    if not problems:
+        return 'No problems found.'
+    lines = ['%s: %s' % problem for problem in problems]
+    lines.append('%d problem%s found.' % (len(problems),
+                                          '' if len(problems) == 1 else 's'))
+    return '\n'.join(lines)
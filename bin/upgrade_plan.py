@@ -0,0 +1,138 @@
+"""
+Compute the actions needed to upgrade an install from the package list
+recorded in its installed_versions.txt to a new package list.
+"""
+from __future__ import print_function, absolute_import
+from collections import namedtuple, OrderedDict
+from fetch import run_parallel, remote_size
+from version_file import read_version_file
+
+# Sections holding packages, in the order the installer handles them.
+PACKAGE_SECTIONS = ('jh', 'eups_packages', 'packages', 'ccs')
+
+# Sections holding settings; changing stack_dir means rebuilding the
+# EUPS packages.
+SETTINGS_SECTIONS = ('dmstack', 'datacat', 'third_party')
+
+LINK_TOKENS = ('symlink.', 'executable.')
+
+Action = namedtuple('Action', 'section package old new action nbytes')
+
+
+def read_versions(path):
+    """
+    Read a package list into an OrderedDict of sections, keeping the
+    version strings exactly as written.
+    """
+    return read_version_file(path).as_dict()
+
+
+def _is_link(section, package):
+    return section == 'ccs' and package.startswith(LINK_TOKENS)
+
+
+def plan_upgrade(installed, target, sections=PACKAGE_SECTIONS):
+    """
+    Compare two package lists, as returned by read_versions, section
+    by section and return the ordered list of Actions that turns the
+    installed one into the target.  The action is one of
+
+    'install'   package not installed yet
+    'upgrade'   package version changed
+    'rebuild'   EUPS package whose stack_dir changed
+    'refresh'   SNAPSHOT version, which may have changed upstream
+    'relink'    symlink or executable with a new or different target
+    'remove'    package or link no longer listed
+    'keep'      nothing to do
+    'update'    changed setting in the [dmstack], [datacat] or
+                [third_party] sections
+    """
+    old_stack = installed.get('dmstack', {}).get('stack_dir')
+    stack_changed = old_stack != target.get('dmstack', {}).get('stack_dir')
+    actions = []
+    links = []
+    for section in sections:
+        old_pars = installed.get(section, {})
+        new_pars = target.get(section, {})
+        for package, new in new_pars.items():
+            old = old_pars.get(package)
+            if _is_link(section, package):
+                links.append(Action(section, package, old, new,
+                                    'keep' if old == new else 'relink', 0))
+                continue
+            if old is None:
+                action = 'install'
+            elif old != new:
+                action = 'upgrade'
+            elif 'SNAPSHOT' in new or new == 'master':
+                action = 'refresh'
+            elif section == 'eups_packages' and stack_changed:
+                action = 'rebuild'
+            else:
+                action = 'keep'
+            actions.append(Action(section, package, old, new, action, None))
+        for package, old in old_pars.items():
+            if package not in new_pars:
+                entry = Action(section, package, old, None, 'remove', 0)
+                (links if _is_link(section, package)
+                 else actions).append(entry)
+    for section in SETTINGS_SECTIONS:
+        old_pars = installed.get(section, {})
+        new_pars = target.get(section, {})
+        for key in OrderedDict.fromkeys(list(new_pars) + list(old_pars)):
+            old, new = old_pars.get(key), new_pars.get(key)
+            if old != new:
+                actions.append(Action(section, key, old, new, 'update', 0))
+    # Links are made once all of the packages are in place.
+    return actions + links
+
+
+def changed(actions):
+    """Return the set of (section, package) pairs that need work."""
+    return set((x.section, x.package) for x in actions if x.action != 'keep')
+
+
+def estimate_sizes(actions, url_for, cache=None, jobs=1):
+    """
+    Fill in the download size of each install, upgrade, rebuild or
+    refresh action.  url_for(section, package, version) returns the
+    archive URL and cache key for a package, or None if it is not
+    downloaded as an archive.  Cached archives cost nothing; sizes the
+    server does not report are left as None.
+    """
+    def size(action):
+        if action.action not in ('install', 'upgrade', 'rebuild', 'refresh'):
+            return action.nbytes
+        target = url_for(action.section, action.package, action.new)
+        if target is None:
+            return None
+        url, key = target
+        if (cache is not None and action.action != 'refresh'
+                and cache.get(key) is not None):
+            return 0
+        return remote_size(url)
+    sizes = run_parallel(size, [(x,) for x in actions], jobs=jobs)
+    return [x._replace(nbytes=nbytes) for x, nbytes in zip(actions, sizes)]
+
+
+def format_plan(actions):
+    lines = ['%-14s %-42s %-16s %-16s %-8s %10s'
+             % ('section', 'package', 'installed', 'target', 'action',
+                'bytes')]
+    total = 0
+    unknown = 0
+    for x in actions:
+        if x.action == 'keep':
+            continue
+        if x.nbytes is None:
+            unknown += 1
+        else:
+            total += x.nbytes
+        lines.append('%-14s %-42s %-16s %-16s %-8s %10s'
+                     % (x.section, x.package, x.old, x.new, x.action,
+                        '?' if x.nbytes is None else x.nbytes))
+    nkeep = len([x for x in actions if x.action == 'keep'])
+    lines.append('%d actions, %d unchanged; estimated download %.1f MB%s'
+                 % (len(actions) - nkeep, nkeep, total/1024.**2,
+                    ' (+%d of unknown size)' % unknown if unknown else ''))
+    return '\n'.join(lines)
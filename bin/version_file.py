@@ -0,0 +1,194 @@
+"""
+Package lists parsed once.  A VersionFile holds every section of a
+version file with the version strings exactly as written, and gives
+typed views of its sections, whose values are converted to numbers on
+first access as Parfile did.  read_version_file keeps the parsed files
+of the process, so the installers, the lockfile and upgrade plan code
+and tools that scan all of packageLists share one parse of each file.
+"""
+from __future__ import print_function, absolute_import
+import os
+import time
+import threading
+from collections import OrderedDict
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+try:
+    import ConfigParser as configparser
+except ImportError:
+    import configparser
+from fetch import run_parallel
+
+
+class Section(Mapping):
+    """
+    Read-only view of a section of a version file.  Values are cast to
+    None, int or float where they look like one, except for the
+    `exact` keys, which keep their strings (e.g., locked versions).
+    """
+    def __init__(self, name, versions, exact=()):
+        self.name = name
+        self._versions = versions
+        self._exact = frozenset(exact)
+        self._values = {}
+
+    @staticmethod
+    def _cast(value):
+        if value == 'None':
+            return None
+        try:
+            if value.find('.') == -1 and value.find('e') == -1:
+                return int(value)
+            else:
+                return float(value)
+        except ValueError:
+            # Cannot cast as either int or float so just return the
+            # value as-is (presumably a string).
+            return value
+
+    def __getitem__(self, key):
+        try:
+            return self._values[key]
+        except KeyError:
+            value = self._versions[key]
+            if key not in self._exact:
+                value = self._cast(value)
+            self._values[key] = value
+            return value
+
+    def __iter__(self):
+        return iter(self._versions)
+
+    def __len__(self):
+        return len(self._versions)
+
+    def exact(self, key):
+        """Return the value of `key` as written in the version file."""
+        return self._versions[key]
+
+    def __repr__(self):
+        return 'Section(%r, %r)' % (self.name, dict(self.items()))
+
+
+class VersionFile(object):
+    """
+    A version file parsed once.  The sections are not modified after
+    parsing, so a VersionFile may be shared by several installers and
+    threads.
+    """
+    def __init__(self, path):
+        self.path = path
+        parser = configparser.ConfigParser()
+        parser.optionxform = str
+        if not parser.read(path):
+            raise RuntimeError("invalid or empty config file: {f}"
+                               .format(f=path))
+        self._sections = OrderedDict(
+            (section, OrderedDict(parser.items(section)))
+            for section in parser.sections())
+        self._views = {}
+
+    def sections(self):
+        return list(self._sections)
+
+    def __contains__(self, section):
+        return section in self._sections
+
+    def versions(self, section):
+        """
+        Return a copy of the {package: version string} of a section,
+        raising configparser.NoSectionError if there is none.
+        """
+        if section not in self._sections:
+            raise configparser.NoSectionError(section)
+        return OrderedDict(self._sections[section])
+
+    def section(self, section, exact=()):
+        """
+        Return the typed Section view of a section, raising
+        configparser.NoSectionError if there is none.  The values of
+        the `exact` keys are not cast.
+        """
+        if section not in self._sections:
+            raise configparser.NoSectionError(section)
+        key = (section, frozenset(exact))
+        view = self._views.get(key)
+        if view is None:
+            view = self._views.setdefault(
+                key, Section(section, self._sections[section], exact))
+        return view
+
+    __getitem__ = section
+
+    def as_dict(self):
+        """Return a copy of the sections, as upgrade_plan.read_versions."""
+        return OrderedDict((section, OrderedDict(versions)) for
+                           section, versions in self._sections.items())
+
+
+class Parfile(Section):
+    """A Section read from a version file, for compatibility."""
+    def __init__(self, infile, section):
+        super(Parfile, self).__init__(
+            section, read_version_file(infile).versions(section))
+
+
+# Parsed files by path, with the stat of the file and the time it was
+# read.  As in git's "racily clean" check, a file modified within
+# _RACY_SECONDS of being read is read again, since a later change
+# could leave its mtime and size the same.
+_RACY_SECONDS = 2
+_parsed = {}
+_parsed_lock = threading.Lock()
+
+
+def _stat_key(path):
+    stat = os.stat(path)
+    return (stat.st_ino, stat.st_size, stat.st_mtime)
+
+
+def read_version_file(path):
+    """
+    Return the VersionFile of `path`, parsing it only if it has not
+    been read before or has changed since.
+    """
+    path = os.path.abspath(path)
+    try:
+        stat_key = _stat_key(path)
+    except OSError:
+        # Let VersionFile raise its error for a missing file.
+        return VersionFile(path)
+    with _parsed_lock:
+        cached = _parsed.get(path)
+    if (cached is not None and cached[0] == stat_key and
+            cached[1] - stat_key[2] > _RACY_SECONDS):
+        return cached[2]
+    read_time = time.time()
+    version_file = VersionFile(path)
+    with _parsed_lock:
+        _parsed[path] = (stat_key, read_time, version_file)
+    return version_file
+
+
+def load_version_files(paths, jobs=8):
+    """
+    Read many package lists concurrently, e.g., all of packageLists.
+    Returns ({path: VersionFile}, {path: error}) for the lists that
+    could not be parsed.
+    """
+    def load(path):
+        try:
+            return read_version_file(path), None
+        except (configparser.Error, RuntimeError) as eobj:
+            return None, str(eobj).split('\n')[0]
+    version_files = OrderedDict()
+    errors = OrderedDict()
+    for path, (version_file, error) in zip(
+            paths, run_parallel(load, [(x,) for x in paths], jobs=jobs)):
+        if error is None:
+            version_files[path] = version_file
+        else:
+            errors[path] = error
+    return version_files, errors
@@ -0,0 +1,84 @@
+"""
+Cache of wheels built from the lcatr packages, so that they are built
+once per interpreter and then only unpacked into each install.
+"""
+from __future__ import print_function, absolute_import
+import os
+import glob
+import shutil
+import hashlib
+import tempfile
+import threading
+import subprocess
+
+
+class WheelCache(object):
+    """
+    Wheels built by `python_exec`, stored as
+    <cache_dir>/<interpreter id>/<package>/<version>/*.whl.  The
+    interpreter id is a hash of the interpreter's path and version, so
+    that each --python_exec gets its own wheels.
+    """
+    def __init__(self, cache_dir, python_exec='python'):
+        self.cache_dir = os.path.abspath(os.path.expanduser(cache_dir))
+        self.python_exec = python_exec
+        self._interpreter_id = None
+        self._lock = threading.Lock()
+
+    @property
+    def interpreter_id(self):
+        with self._lock:
+            if self._interpreter_id is None:
+                output = subprocess.check_output(
+                    [self.python_exec, '-c',
+                     'import sys; print(sys.executable); print(sys.version)'])
+                self._interpreter_id \
+                    = hashlib.sha256(output).hexdigest()[:16]
+        return self._interpreter_id
+
+    def wheel_dir(self, package, version):
+        return os.path.join(self.cache_dir, self.interpreter_id, package,
+                            str(version))
+
+    def get(self, package, version):
+        """Return the cached wheel of a package version, or None."""
+        wheels = glob.glob(os.path.join(self.wheel_dir(package, version),
+                                        '*.whl'))
+        return wheels[0] if wheels else None
+
+    def build(self, package, version, source_dir):
+        """
+        Build the wheel of the package in `source_dir`, store it in the
+        cache and return its path.  Versions that are branches, like
+        master, are rebuilt every time.
+        """
+        wheel_dir = self.wheel_dir(package, version)
+        if not os.path.isdir(os.path.dirname(wheel_dir)):
+            os.makedirs(os.path.dirname(wheel_dir))
+        staging = tempfile.mkdtemp(prefix='.partial-',
+                                   dir=os.path.dirname(wheel_dir))
+        try:
+            subprocess.check_call([self.python_exec, '-m', 'pip', 'wheel',
+                                   '--no-deps', '--no-build-isolation',
+                                   '--quiet', '--wheel-dir', staging,
+                                   os.path.abspath(source_dir)])
+            if os.path.isdir(wheel_dir):
+                shutil.rmtree(wheel_dir)
+            os.rename(staging, wheel_dir)
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+        return self.get(package, version)
+
+    def wheel(self, package, version, source_dir):
+        """Return the cached wheel of a package, building it if needed."""
+        wheel = None if version == 'master' else self.get(package, version)
+        if wheel is None:
+            wheel = self.build(package, version, source_dir)
+        return wheel
+
+    def install(self, wheel, prefix):
+        """Install `wheel` in `prefix` without touching other packages."""
+        subprocess.check_call([self.python_exec, '-m', 'pip', 'install',
+                               '--no-deps', '--no-index', '--quiet',
+                               '--ignore-installed', '--no-warn-script-location',
+                               '--prefix', prefix, wheel])
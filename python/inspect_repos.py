@@ -3,43 +3,266 @@ This script loops over the repositories in the lsst-camera-dh org and
 requests any repository tags and their creation times, printing the
 most recent tag and its time for each repo.
 
+The repositories are scanned concurrently.  With an access token, the
+newest tag of up to 100 repositories is read with each GitHub GraphQL
+query.  Otherwise the REST API is used, and its responses are cached
+on disk with their ETags: unchanged tag lists are revalidated with
+conditional requests, which do not count against the rate limit, and
+the commit date of a tag is only ever requested once.
+
 This script works better with an access token (obtained from the GITHUB*
 environment variables):
 
 https://help.github.com/articles/creating-an-access-token-for-command-line-use/
 """
+from __future__ import print_function, absolute_import
 import os
-import subprocess
-import datetime
-from github import Github
+import re
 import json
+import base64
+import datetime
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.request import Request, urlopen
+from urllib.error import HTTPError
+
+DEFAULT_API_URL = 'https://api.github.com'
+DEFAULT_CACHE_FILE = os.path.join('~', '.cache', 'lsst-release',
+                                  'inspect_repos.json')
+
+_next_pattern = re.compile(r'<([^>]+)>;\s*rel="next"')
+
+# Newest tag of each repository in an organization, by commit date.
+_latest_tags_query = '''
+query($org: String!, $cursor: String) {
+  organization(login: $org) {
+    repositories(first: 100, after: $cursor) {
+      nodes {
+        name
+        refs(refPrefix: "refs/tags/", first: 1,
+             orderBy: {field: TAG_COMMIT_DATE, direction: DESC}) {
+          nodes {
+            name
+            target {
+              ... on Commit { committedDate }
+              ... on Tag { target { ... on Commit { committedDate } } }
+            }
+          }
+        }
+      }
+      pageInfo { hasNextPage endCursor }
+    }
+  }
+}
+'''
+
+
+def parse_timestamp(timestamp):
+    return datetime.datetime.strptime(timestamp, '%Y-%m-%dT%H:%M:%SZ')
+
+
+class GitHubAPI(object):
+    """
+    Minimal GitHub API client.  GET responses are kept, with their
+    ETags, in `cache_file` and revalidated with If-None-Match; commit
+    dates, which never change for a given sha, are kept there as well.
+    """
+    def __init__(self, api_url=DEFAULT_API_URL, username=None, token=None,
+                 cache_file=None, timeout=60):
+        self.api_url = api_url.rstrip('/')
+        self.username = username
+        self.token = token
+        self.cache_file = cache_file
+        self.timeout = timeout
+        self.requests = 0
+        self.not_modified = 0
+        self._lock = threading.Lock()
+        self._cache = dict(responses={}, commits={})
+        if cache_file is not None:
+            try:
+                with open(os.path.expanduser(cache_file)) as infile:
+                    self._cache.update(json.load(infile))
+            except (IOError, ValueError):
+                pass
+
+    def _request(self, url, data=None, headers=None):
+        request = Request(url, data=data, headers=dict(headers or {}))
+        request.add_header('User-Agent', 'lsst-camera-dh-release')
+        request.add_header('Accept', 'application/vnd.github+json')
+        if self.token is not None:
+            if self.username is not None:
+                credentials = '%s:%s' % (self.username, self.token)
+                request.add_header('Authorization', 'Basic ' + base64.b64encode(
+                    credentials.encode()).decode())
+            else:
+                request.add_header('Authorization', 'token ' + self.token)
+        with self._lock:
+            self.requests += 1
+        return urlopen(request, timeout=self.timeout)
+
+    def get(self, path):
+        """
+        Return the decoded JSON at `path` (relative to the API URL, or
+        a full URL) and the URL of its next page, or None.
+        """
+        url = path if '://' in path else self.api_url + path
+        with self._lock:
+            cached = self._cache['responses'].get(url)
+        headers = {}
+        if cached is not None:
+            headers['If-None-Match'] = cached['etag']
+        try:
+            with self._request(url, headers=headers) as response:
+                data = json.loads(response.read().decode('utf-8'))
+                etag = response.headers.get('ETag')
+                link = response.headers.get('Link')
+        except HTTPError as eobj:
+            if eobj.code != 304 or cached is None:
+                raise
+            with self._lock:
+                self.not_modified += 1
+            return cached['data'], cached['next']
+        match = _next_pattern.search(link or '')
+        next_url = match.group(1) if match else None
+        if etag is not None:
+            with self._lock:
+                self._cache['responses'][url] = dict(etag=etag, data=data,
+                                                     next=next_url)
+        return data, next_url
+
+    def get_all(self, path):
+        """Return the items of all of the pages of a list at `path`."""
+        items = []
+        url = path + ('&' if '?' in path else '?') + 'per_page=100'
+        while url is not None:
+            data, url = self.get(url)
+            items.extend(data)
+        return items
+
+    def graphql(self, query, variables):
+        body = json.dumps(dict(query=query, variables=variables)).encode()
+        with self._request(self.api_url + '/graphql', data=body,
+                           headers={'Content-Type':
+                                    'application/json'}) as response:
+            result = json.loads(response.read().decode('utf-8'))
+        if result.get('errors'):
+            raise RuntimeError('GraphQL query failed: %s' % result['errors'])
+        return result['data']
+
+    def commit_date(self, owner, repo, sha):
+        """Return the commit date of `sha`, from the cache if possible."""
+        with self._lock:
+            date = self._cache['commits'].get(sha)
+        if date is None:
+            commit, _ = self.get('/repos/%s/%s/commits/%s' % (owner, repo,
+                                                               sha))
+            date = commit['commit']['committer']['date']
+            with self._lock:
+                self._cache['commits'][sha] = date
+        return date
+
+    def save(self):
+        """Write the response cache, replacing the old one atomically."""
+        if self.cache_file is None:
+            return
+        cache_file = os.path.expanduser(self.cache_file)
+        if not os.path.isdir(os.path.dirname(cache_file)):
+            os.makedirs(os.path.dirname(cache_file))
+        tmp_file = '%s.tmp-%d' % (cache_file, os.getpid())
+        with self._lock, open(tmp_file, 'w') as output:
+            json.dump(self._cache, output)
+        os.replace(tmp_file, cache_file)
+
+
+def latest_tags_rest(api, org, jobs=8):
+    """
+    Return {repo: (tag, timestamp) or None} using the REST API.  The
+    tag lists of all of the repositories are requested first, then the
+    dates of the tag commits not already cached, up to `jobs` requests
+    at a time.
+    """
+    repos = [x['name'] for x in api.get_all('/orgs/%s/repos' % org)]
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        tags = dict(zip(repos, executor.map(
+            lambda repo: api.get_all('/repos/%s/%s/tags' % (org, repo)),
+            repos)))
+        commits = sorted(set((repo, tag['commit']['sha'])
+                             for repo in repos for tag in tags[repo]))
+        dates = dict(zip(commits, executor.map(
+            lambda commit: api.commit_date(org, *commit), commits)))
+    latest = {}
+    for repo in repos:
+        timestamps = sorted((parse_timestamp(dates[(repo,
+                                                    tag['commit']['sha'])]),
+                             tag['name']) for tag in tags[repo])
+        latest[repo] = (timestamps[-1][1], timestamps[-1][0]) \
+            if timestamps else None
+    return latest
+
 
-def tag_timestamp(tag):
-    format = '%a, %d %b %Y %H:%M:%S GMT'
-    timestamp_string = tag.commit.stats.last_modified
-    return datetime.datetime.strptime(timestamp_string, format)
+def latest_tags_graphql(api, org):
+    """
+    Return {repo: (tag, timestamp) or None} with one GraphQL query for
+    each 100 repositories.  The GraphQL API needs an access token.
+    """
+    latest = {}
+    cursor = None
+    while True:
+        repositories = api.graphql(_latest_tags_query,
+                                   dict(org=org, cursor=cursor))[
+                                       'organization']['repositories']
+        for node in repositories['nodes']:
+            refs = node['refs']['nodes']
+            latest[node['name']] = None
+            if refs:
+                target = refs[0]['target']
+                date = (target.get('committedDate') or
+                        target.get('target', {}).get('committedDate'))
+                if date is not None:
+                    latest[node['name']] = (refs[0]['name'],
+                                            parse_timestamp(date))
+        if not repositories['pageInfo']['hasNextPage']:
+            return latest
+        cursor = repositories['pageInfo']['endCursor']
 
-def latest_tag(repo):
-    tags = dict([(tag_timestamp(x), x) for x in repo.get_tags()])
-    ts_latest = sorted(tags.keys())[-1]
-    return tags[ts_latest], ts_latest
 
-try:
-    username = os.environ['GITHUB_USERNAME']
-    access_token = os.environ['GITHUB_ACCESS_TOKEN']
-except KeyError:
-    username = None
-    access_token = None
+def latest_tags(api, org, jobs=8, graphql=None):
+    """
+    Return the newest tag and its commit time for each repository of
+    `org`.  GraphQL is used by default if the client has a token.
+    """
+    if graphql is None:
+        graphql = api.token is not None
+    if graphql:
+        return latest_tags_graphql(api, org)
+    return latest_tags_rest(api, org, jobs=jobs)
 
-org_name = 'lsst-camera-dh'
 
-g = Github(username, access_token)
-org = g.get_organization(org_name)
-repos = dict([(repo.name, repo) for repo in org.get_repos()])
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--org', type=str, default='lsst-camera-dh',
+                        help='GitHub organization')
+    parser.add_argument('--api_url', type=str, default=DEFAULT_API_URL,
+                        help='GitHub API URL, e.g., of a stand-in server')
+    parser.add_argument('--jobs', type=int, default=8,
+                        help='number of concurrent API requests')
+    parser.add_argument('--cache_file', type=str, default=DEFAULT_CACHE_FILE,
+                        help='file for cached API responses')
+    parser.add_argument('--rest', action='store_true',
+                        help='use the REST API even with an access token')
+    args = parser.parse_args()
 
-for name, repo in repos.items():
+    api = GitHubAPI(args.api_url, username=os.environ.get('GITHUB_USERNAME'),
+                    token=os.environ.get('GITHUB_ACCESS_TOKEN'),
+                    cache_file=args.cache_file)
     try:
-        tag, timestamp = latest_tag(repo)
-        print name, tag.name, timestamp
-    except IndexError:
-        print name
+        latest = latest_tags(api, args.org, jobs=args.jobs,
+                             graphql=False if args.rest else None)
+    finally:
+        api.save()
+    for name, tag in sorted(latest.items()):
+        if tag is None:
+            print(name)
+        else:
+            print(name, tag[0], tag[1])
@@ -0,0 +1,315 @@
+"""
+Report the package versions pinned in the packageLists files that lag
+the newest GitHub tags and Nexus releases.
+
+All of the package lists are read once into an index of package ->
+version -> lists that pin it.  The newest tag of every repository of
+the GitHub organizations is then read in one scan per organization (see
+inspect_repos.py), and the released versions of the CCS distributions
+with one paged Nexus component search.  The drift matrix shows each
+package and its pin in each list, e.g.,
+
+    python release_drift.py --diff > drift.patch
+
+also writes the edits that bring the lagging pins up to date as a
+patch that can be applied with `git apply`.
+"""
+from __future__ import print_function, absolute_import
+import os
+import re
+import sys
+import glob
+import json
+import difflib
+import argparse
+from urllib.parse import urlencode
+from urllib.request import Request, urlopen
+from inspect_repos import GitHubAPI, DEFAULT_API_URL, DEFAULT_CACHE_FILE, \
+    latest_tags
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'bin'))
+from version_file import load_version_files
+
+SECTIONS = ('jh', 'packages', 'eups_packages', 'ccs')
+GITHUB_ORG = 'lsst-camera-dh'
+GITHUB_ELEC_ORG = 'lsst-camera-electronics'
+DEFAULT_NEXUS_URL = 'http://repo-nexus.lsst.org/nexus'
+DEFAULT_NEXUS_REPOSITORY = 'ccs-maven2-public'
+
+# Matrix markers for pins that are not the newest release.
+MARKERS = {'behind': '*', 'ahead': '+', 'unpinned': '~', 'unknown': '?',
+           'current': ''}
+
+_section_pattern = re.compile(r'^\s*\[([^\]]+)\]')
+_option_pattern = re.compile(r'^(\s*)([^#;\s][^=:]*?)(\s*[=:]\s*)(\S+)(.*)$')
+
+
+def package_source(section, package):
+    """
+    Return where the installers get a package from, as ('github', org,
+    repo) or ('nexus', artifact), or None for the CCS symlink and
+    executable entries.  This follows Installer.github_url and
+    Installer._ccs_download.
+    """
+    if section == 'ccs':
+        if package.startswith(('symlink.', 'executable.')):
+            return None
+        if package.startswith('nexus.') or (
+                package.startswith('org-lsst') and
+                not package.startswith('github.')):
+            return ('nexus', package.replace('nexus.', ''))
+        package = package.replace('github.', '')
+    org = GITHUB_ELEC_ORG if package.startswith('REB_') else GITHUB_ORG
+    return ('github', org, package)
+
+
+def read_index(package_lists, sections=SECTIONS):
+    """
+    Read the package lists and return ({(section, package): {version:
+    [list names]}}, {list name: error}) for the lists that could not be
+    parsed.
+    """
+    index = {}
+    version_files, errors = load_version_files(package_lists)
+    for path, version_file in version_files.items():
+        name = os.path.basename(path)
+        for section in sections:
+            if section not in version_file:
+                continue
+            for package, version in version_file.versions(section).items():
+                if package_source(section, package) is None:
+                    continue
+                index.setdefault((section, package), {}).setdefault(
+                    version.strip(), []).append(name)
+    return index, dict((os.path.basename(path), error)
+                       for path, error in errors.items())
+
+
+def version_key(version):
+    """
+    Sort key for version strings: numbers compare numerically, and a
+    suffix such as -rc or -dev sorts before the plain release while a
+    number such as -3 sorts after it.
+    """
+    version = version.strip()
+    if version[:1] in 'vV' and version[1:2].isdigit():
+        version = version[1:]
+    key = []
+    for part in re.findall(r'\d+|[A-Za-z]+', version):
+        key.append((2, int(part), '') if part.isdigit() else (0, 0, part))
+    key.append((1, 0, ''))
+    return tuple(key)
+
+
+def is_unpinned(version):
+    """Return whether a pin is a branch or a SNAPSHOT, not a release."""
+    return (version.endswith('SNAPSHOT') or
+            re.match(r'^[vV]?\d', version) is None)
+
+
+def latest_releases(api, nexus_url=DEFAULT_NEXUS_URL,
+                    repository=DEFAULT_NEXUS_REPOSITORY, orgs=(GITHUB_ORG,),
+                    jobs=8, graphql=None, timeout=60):
+    """
+    Return {source: newest version} for the repositories of the GitHub
+    `orgs` and for the released CCS distributions in Nexus.
+    """
+    latest = {}
+    for org in orgs:
+        for repo, tag in latest_tags(api, org, jobs=jobs,
+                                     graphql=graphql).items():
+            if tag is not None:
+                latest[('github', org, repo)] = tag[0]
+    if nexus_url is not None:
+        for artifact, version in latest_artifacts(nexus_url, repository,
+                                                  timeout=timeout).items():
+            latest[('nexus', artifact)] = version
+    return latest
+
+
+def latest_artifacts(nexus_url, repository=DEFAULT_NEXUS_REPOSITORY,
+                     group='org.lsst', timeout=60):
+    """
+    Return the newest released (non-SNAPSHOT) version of each CCS
+    distribution in a Nexus repository, following the search's
+    continuation tokens.
+    """
+    query = {'repository': repository, 'group': group,
+             'maven.extension': 'zip', 'maven.classifier': 'dist'}
+    latest = {}
+    token = None
+    while True:
+        if token is not None:
+            query['continuationToken'] = token
+        url = '%s/service/rest/v1/search?%s' % (nexus_url.rstrip('/'),
+                                                urlencode(query))
+        request = Request(url, headers={'Accept': 'application/json'})
+        with urlopen(request, timeout=timeout) as response:
+            data = json.loads(response.read().decode('utf-8'))
+        for item in data['items']:
+            version = item['version']
+            if is_unpinned(version):
+                continue
+            if (item['name'] not in latest or version_key(version)
+                    > version_key(latest[item['name']])):
+                latest[item['name']] = version
+        token = data.get('continuationToken')
+        if token is None:
+            return latest
+
+
+def pin_status(version, latest):
+    """Compare a pinned version with the newest release, or None."""
+    if is_unpinned(version):
+        return 'unpinned'
+    if latest is None:
+        return 'unknown'
+    if version_key(version) < version_key(latest):
+        return 'behind'
+    if version_key(version) > version_key(latest):
+        return 'ahead'
+    return 'current'
+
+
+def drift(index, latest):
+    """
+    Return a row for each indexed package, with its section, name,
+    source, newest version, and the {list name: (version, status)} of
+    the lists that use it.
+    """
+    rows = []
+    for (section, package), versions in sorted(index.items()):
+        source = package_source(section, package)
+        newest = latest.get(source)
+        pins = {}
+        for version, names in versions.items():
+            for name in names:
+                pins[name] = (version, pin_status(version, newest))
+        rows.append(dict(section=section, package=package, source=source,
+                         latest=newest, pins=pins))
+    return rows
+
+
+def format_matrix(rows, list_names, errors=None, show_all=False):
+    """
+    Return the drift matrix: a line for each package, unless all of
+    its pins are current, and a column for each package list.
+    """
+    if not show_all:
+        rows = [x for x in rows if any(status != 'current' for _, status
+                                       in x['pins'].values())]
+    columns = ['%d' % (i + 1) for i in range(len(list_names))]
+    widths = [max([len(x)] + [len(row['pins'][name][0]) + 1 for row in rows
+                               if name in row['pins']])
+              for x, name in zip(columns, list_names)]
+    label_width = max([len('package')] +
+                      [len('[%s] %s' % (x['section'], x['package']))
+                       for x in rows])
+    latest_width = max([len('latest')] + [len(x['latest'] or '-')
+                                          for x in rows])
+    header = '%-*s  %-*s  %s' % (label_width, 'package', latest_width,
+                                 'latest', '  '.join(x.ljust(w) for x, w in
+                                                     zip(columns, widths)))
+    lines = [header.rstrip()]
+    for row in rows:
+        cells = []
+        for name, width in zip(list_names, widths):
+            if name in row['pins']:
+                version, status = row['pins'][name]
+                cells.append((version + MARKERS[status]).ljust(width))
+            else:
+                cells.append('.'.ljust(width))
+        line = '%-*s  %-*s  %s' % (
+            label_width, '[%s] %s' % (row['section'], row['package']),
+            latest_width, row['latest'] or '-', '  '.join(cells))
+        lines.append(line.rstrip())
+    lines.append('')
+    lines.extend('%*d: %s' % (len(columns[-1]) if columns else 1, i + 1, name)
+                 for i, name in enumerate(list_names))
+    lines.append('* behind the newest release, + newer than it, '
+                 '~ unpinned, ? no release found')
+    for name, error in sorted((errors or {}).items()):
+        lines.append('%s was not read: %s' % (name, error))
+    return '\n'.join(lines)
+
+
+def proposed_edits(package_lists, rows, root=None):
+    """
+    Return a unified diff of the package lists with each pin that is
+    behind the newest release replaced by that release.  Comments and
+    layout are kept.
+    """
+    updates = dict(((row['section'], row['package']), row['latest'])
+                   for row in rows)
+    diff = []
+    for path in package_lists:
+        name = os.path.basename(path)
+        with open(path) as infile:
+            lines = infile.readlines()
+        new_lines = []
+        section = None
+        for line in lines:
+            match = _section_pattern.match(line)
+            if match:
+                section = match.group(1)
+            match = _option_pattern.match(line)
+            if match and (section, match.group(2)) in updates:
+                row = [x for x in rows if x['section'] == section and
+                       x['package'] == match.group(2)][0]
+                if row['pins'].get(name, (None, None))[1] == 'behind':
+                    line = ''.join(match.group(1, 2, 3)
+                                   + (row['latest'], match.group(5))) + '\n'
+            new_lines.append(line)
+        relpath = os.path.relpath(path, root) if root is not None else path
+        diff.extend(difflib.unified_diff(lines, new_lines, 'a/' + relpath,
+                                         'b/' + relpath))
+    return ''.join(diff)
+
+
+if __name__ == '__main__':
+    root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('package_lists', nargs='*',
+                        default=sorted(glob.glob(os.path.join(
+                            root, 'packageLists', '*.txt'))),
+                        help='package lists to check (default: all)')
+    parser.add_argument('--api_url', type=str, default=DEFAULT_API_URL,
+                        help='GitHub API URL, e.g., of a stand-in server')
+    parser.add_argument('--nexus_url', type=str, default=DEFAULT_NEXUS_URL,
+                        help='Nexus URL')
+    parser.add_argument('--nexus_repository', type=str,
+                        default=DEFAULT_NEXUS_REPOSITORY)
+    parser.add_argument('--jobs', type=int, default=8,
+                        help='number of concurrent API requests')
+    parser.add_argument('--cache_file', type=str, default=DEFAULT_CACHE_FILE,
+                        help='file for cached GitHub API responses')
+    parser.add_argument('--rest', action='store_true',
+                        help='use the REST API even with an access token')
+    parser.add_argument('--all', action='store_true',
+                        help='also show the packages whose pins are current')
+    parser.add_argument('--diff', action='store_true',
+                        help='print the proposed edits as a patch instead '
+                        'of the matrix')
+    args = parser.parse_args()
+
+    package_lists = [os.path.abspath(x) for x in args.package_lists]
+    index, errors = read_index(package_lists)
+    orgs = sorted(set(source[1] for source in
+                      (package_source(*key) for key in index)
+                      if source[0] == 'github'))
+    api = GitHubAPI(args.api_url, username=os.environ.get('GITHUB_USERNAME'),
+                    token=os.environ.get('GITHUB_ACCESS_TOKEN'),
+                    cache_file=args.cache_file)
+    try:
+        latest = latest_releases(api, args.nexus_url, args.nexus_repository,
+                                 orgs=orgs, jobs=args.jobs,
+                                 graphql=False if args.rest else None)
+    finally:
+        api.save()
+    rows = drift(index, latest)
+    if args.diff:
+        print(proposed_edits(package_lists, rows, root=root), end='')
+    else:
+        print(format_matrix(rows, [os.path.basename(x) for x in package_lists
+                                   if os.path.basename(x) not in errors],
+                            errors, show_all=args.all))
@@ -0,0 +1,389 @@
+"""
+End-to-end benchmark of Installer.jh() and Installer.ccs() for the
+package lists in packageLists, run against a local stand-in for GitHub
+and Nexus (see standin_server.py) and a stub DM stack.  Each package
+list is installed twice, into new directories: 'cold' with an empty
+archive cache and 'warm' reusing it.  The results, with the time spent
+per phase, are written as JSON, e.g.,
+
+    python benchmark_install.py --files 20 --file_size 100000 \\
+        --report benchmark.json
+"""
+from __future__ import print_function, absolute_import
+import os
+import sys
+import glob
+import json
+import time
+import shutil
+import tarfile
+import argparse
+import platform
+import tempfile
+import threading
+import traceback
+import contextlib
+import configparser
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'bin'))
+from install import Installer, install_batch
+from fetch import ArchiveCache
+from package_store import PackageStore
+from standin_server import StandInServer
+
+# Installer methods timed as each phase of an install.  Downloads are
+# unpacked as they stream, so 'fetch' includes extraction.
+PHASES = {'fetch': ('_github_fetch', '_ccs_download', 'github_clone'),
+          'build': ('modules_install', '_lcatr_build', '_eups_build',
+                    'precompile_python'),
+          'link': ('_hj_link', '_package_link', 'ccs_symlink',
+                   '_switch_generation'),
+          'setup': ('write_setup',)}
+
+_loadLSST = '''export EUPS_DIR=%(stack_dir)s/eups
+export EUPS_PATH=%(stack_dir)s/stack
+export PATH=%(stack_dir)s/bin:${PATH}
+'''
+
+_stubs = {'eups/bin/setups.sh': 'setup() { :; }\n',
+          'bin/eups': '#!/bin/sh\n',
+          'bin/scons': '#!/bin/sh\nmkdir -p lib\n'}
+
+_modules_configure = '''#!/bin/sh
+prefix=${1#--prefix=}
+printf 'all:\\n\\ttrue\\ninstall:\\n\\tmkdir -p %s/Modules/3.2.10/init\\n\\ttouch %s/Modules/3.2.10/init/bash\\n' $prefix $prefix > Makefile
+'''
+
+
+def make_stack(stack_dir):
+    """Write a stub DM stack whose eups, setup and scons do nothing."""
+    for path, contents in _stubs.items():
+        path = os.path.join(stack_dir, path)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as output:
+            output.write(contents)
+        os.chmod(path, 0o755)
+    os.makedirs(os.path.join(stack_dir, 'stack', 'ups_db'))
+    with open(os.path.join(stack_dir, 'loadLSST.bash'), 'w') as output:
+        output.write(_loadLSST % locals())
+
+
+def seed_modules(cache, work_dir):
+    """Put a stub Modules 3.2.10 source tarball in the archive cache."""
+    src_dir = os.path.join(work_dir, 'modules-3.2.10')
+    os.makedirs(src_dir)
+    with open(os.path.join(src_dir, 'configure'), 'w') as output:
+        output.write(_modules_configure)
+    os.chmod(os.path.join(src_dir, 'configure'), 0o755)
+    archive = cache.tempfile()
+    with tarfile.open(archive, 'w:gz') as tar:
+        tar.add(src_dir, 'modules-3.2.10')
+    cache.put(('sourceforge', 'modules', '3.2.10'), archive)
+    shutil.rmtree(src_dir)
+
+
+def local_version_file(version_file, work_dir, stack_dir):
+    """
+    Copy a package list, pointing [dmstack] and [third_party] at local
+    directories.
+    """
+    parser = configparser.ConfigParser()
+    parser.optionxform = str
+    parser.read(version_file)
+    if parser.has_section('dmstack'):
+        parser.set('dmstack', 'stack_dir', stack_dir)
+    if parser.has_section('third_party'):
+        for key in parser.options('third_party'):
+            parser.set('third_party', key, os.path.join(work_dir, key))
+    local_file = os.path.join(work_dir, os.path.basename(version_file))
+    with open(local_file, 'w') as output:
+        parser.write(output)
+    return local_file, parser
+
+
+class PhaseTimer(object):
+    """Accumulates the time spent in the phases of an install."""
+    def __init__(self):
+        self.seconds = dict((phase, 0.) for phase in PHASES)
+        self.calls = dict((phase, 0) for phase in PHASES)
+        self._lock = threading.Lock()
+
+    def wrap(self, installer):
+        for phase, names in PHASES.items():
+            for name in names:
+                if hasattr(installer, name):
+                    setattr(installer, name,
+                            self._timed(phase, getattr(installer, name)))
+
+    def _timed(self, phase, func):
+        def timed(*args, **kwds):
+            start = time.time()
+            try:
+                return func(*args, **kwds)
+            finally:
+                with self._lock:
+                    self.seconds[phase] += time.time() - start
+                    self.calls[phase] += 1
+        return timed
+
+
+@contextlib.contextmanager
+def _quiet(verbose):
+    if verbose:
+        yield
+        return
+    # Silence the subprocesses as well as the installer.
+    with open(os.devnull, 'w') as devnull:
+        saved = [os.dup(1), os.dup(2)]
+        os.dup2(devnull.fileno(), 1)
+        os.dup2(devnull.fileno(), 2)
+        try:
+            with contextlib.redirect_stdout(devnull), \
+                 contextlib.redirect_stderr(devnull):
+                yield
+        finally:
+            for fd, saved_fd in zip((1, 2), saved):
+                os.dup2(saved_fd, fd)
+                os.close(saved_fd)
+
+
+def prepare_list(version_file, work_dir, server):
+    """
+    Copy a package list to use the stub DM stack in `work_dir`, and tag
+    the versions of its CCS packages cloned from GitHub on the server.
+    """
+    stack_dir = os.path.join(work_dir, 'stack')
+    if not os.path.isdir(stack_dir):
+        make_stack(stack_dir)
+    local_file, parser = local_version_file(version_file, work_dir,
+                                            stack_dir)
+    if parser.has_section('ccs'):
+        for package, version in parser.items('ccs'):
+            if not package.startswith(('org-lsst', 'nexus.', 'symlink.',
+                                       'executable.')):
+                server.add_git_version(package.replace('github.', ''),
+                                       version)
+    return local_file, parser
+
+
+def disk_usage(paths):
+    """Bytes used by the files under `paths`, counting hard links once."""
+    inodes = {}
+    for path in paths:
+        for dirpath, dirnames, filenames in os.walk(path):
+            for name in dirnames + filenames:
+                stat = os.lstat(os.path.join(dirpath, name))
+                inodes[(stat.st_dev, stat.st_ino)] = stat.st_blocks*512
+    return sum(inodes.values())
+
+
+def run_install(version_file, work_dir, cache, server, jobs=4,
+                hj_folders=('BNL_T03',), verbose=False):
+    """
+    Install one package list into new directories under `work_dir` and
+    return the timings of jh() and ccs().
+    """
+    local_file, parser = prepare_list(version_file, work_dir, server)
+    inst_dir = tempfile.mkdtemp(prefix='jh-', dir=work_dir)
+    ccs_inst_dir = tempfile.mkdtemp(prefix='ccs-', dir=work_dir)
+    results = {}
+    for step in ('jh', 'ccs'):
+        if not parser.has_section(step):
+            continue
+        installer = Installer(local_file, inst_dir=inst_dir,
+                              python_exec=sys.executable,
+                              hj_folders=hj_folders, site='BNL', jobs=jobs,
+                              cache=cache)
+        timer = PhaseTimer()
+        timer.wrap(installer)
+        requests, bytes_served = server.requests, server.bytes_served
+        start = time.time()
+        with _quiet(verbose):
+            if step == 'jh':
+                installer.jh()
+            else:
+                installer.ccs(argparse.Namespace(
+                    ccs_inst_dir=ccs_inst_dir, dev=False, generations=False,
+                    site='BNL'))
+        results[step] = dict(wall=time.time() - start,
+                             phases=timer.seconds, calls=timer.calls,
+                             requests=server.requests - requests,
+                             bytes_downloaded=server.bytes_served
+                             - bytes_served)
+    results['disk'] = disk_usage([inst_dir, ccs_inst_dir])
+    return results
+
+
+def run_batch(package_lists, work_dir, cache, server, jobs=4,
+              hj_folders=('BNL_T03',), link_mode='symlink', verbose=False):
+    """
+    Install all of the package lists with install_batch, sharing a
+    package store, and return the wall time, downloads and disk usage.
+    """
+    local_files = []
+    unread = {}
+    for version_file in package_lists:
+        try:
+            local_files.append(prepare_list(version_file, work_dir,
+                                            server)[0])
+        except configparser.Error as eobj:
+            unread[os.path.basename(version_file)] = str(eobj).split('\n')[0]
+    batch_dir = os.path.join(work_dir, 'batch')
+    store = PackageStore(os.path.join(batch_dir, '.store'), link_mode)
+    requests, bytes_served = server.requests, server.bytes_served
+    start = time.time()
+    with _quiet(verbose):
+        errors = install_batch(local_files, batch_dir,
+                               python_exec=sys.executable,
+                               hj_folders=hj_folders, site='BNL', jobs=jobs,
+                               cache=cache, store=store)
+    errors.update(unread)
+    return dict(wall=time.time() - start, errors=errors,
+                requests=server.requests - requests,
+                bytes_downloaded=server.bytes_served - bytes_served,
+                disk=disk_usage([batch_dir]))
+
+
+def benchmark(package_lists, files=3, file_size=4096, jobs=4,
+              hj_folders=('BNL_T03',), batch=None, verbose=False):
+    """
+    Run the cold and warm installs of each package list, then, if a
+    `batch` link mode is given, a batch install of all of them.
+    """
+    report = dict(created=time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+                  host=platform.node(), python=sys.version.split()[0],
+                  config=dict(files=files, file_size=file_size, jobs=jobs,
+                              hj_folders=list(hj_folders)),
+                  results=[])
+    orgs = (Installer._github_org, Installer._github_elec_org,
+            Installer._nexus_url)
+    curdir = os.path.abspath('.')
+    # Install the synthetic lcatr packages with the standard library's
+    # distutils, not with setuptools' easy_install.
+    os.environ.setdefault('SETUPTOOLS_USE_DISTUTILS', 'stdlib')
+    with StandInServer(files, file_size, hj_folders) as server:
+        Installer._github_org = server.github_org('lsst-camera-dh')
+        Installer._github_elec_org = server.github_org(
+            'lsst-camera-electronics')
+        Installer._nexus_url = server.nexus_url
+        try:
+            for version_file in package_lists:
+                work_dir = tempfile.mkdtemp(prefix='benchmark-')
+                cache = ArchiveCache(os.path.join(work_dir, 'cache'))
+                seed_modules(cache, work_dir)
+                for run in ('cold', 'warm'):
+                    entry = dict(package_list=os.path.basename(version_file),
+                                 run=run, status='ok')
+                    try:
+                        entry.update(run_install(version_file, work_dir,
+                                                 cache, server, jobs=jobs,
+                                                 hj_folders=hj_folders,
+                                                 verbose=verbose))
+                    except Exception as eobj:
+                        entry.update(status='error', error=repr(eobj))
+                        if verbose:
+                            traceback.print_exc()
+                    finally:
+                        os.chdir(curdir)
+                    if entry['status'] == 'ok' and not (
+                            'jh' in entry or 'ccs' in entry):
+                        entry['status'] = 'skipped'
+                    report['results'].append(entry)
+                    print(format_entry(entry))
+                    sys.stdout.flush()
+                shutil.rmtree(work_dir, ignore_errors=True)
+            if batch is not None:
+                work_dir = tempfile.mkdtemp(prefix='benchmark-')
+                cache = ArchiveCache(os.path.join(work_dir, 'cache'))
+                seed_modules(cache, work_dir)
+                try:
+                    report['batch'] = run_batch(
+                        package_lists, work_dir, cache, server, jobs=jobs,
+                        hj_folders=hj_folders, link_mode=batch,
+                        verbose=verbose)
+                    report['batch']['link_mode'] = batch
+                except Exception as eobj:
+                    report['batch'] = dict(link_mode=batch, error=repr(eobj))
+                    if verbose:
+                        traceback.print_exc()
+                finally:
+                    os.chdir(curdir)
+                print(format_batch(report))
+                shutil.rmtree(work_dir, ignore_errors=True)
+        finally:
+            (Installer._github_org, Installer._github_elec_org,
+             Installer._nexus_url) = orgs
+    return report
+
+
+def format_entry(entry):
+    line = '%-36s %-5s' % (entry['package_list'], entry['run'])
+    if entry['status'] == 'skipped':
+        return line + ' skipped: no [jh] or [ccs] section'
+    if entry['status'] != 'ok':
+        return line + ' error: ' + entry['error']
+    for step in ('jh', 'ccs'):
+        if step in entry:
+            result = entry[step]
+            line += ' %s %6.2fs (%s)' % (
+                step, result['wall'],
+                ', '.join('%s %.2f' % (phase, result['phases'][phase])
+                          for phase in sorted(PHASES)))
+    return line
+
+
+def format_batch(report):
+    """Compare the batch install with the cold installs of each list."""
+    batch = report['batch']
+    line = 'batch (%s)' % batch['link_mode']
+    if 'error' in batch:
+        return line + ' error: ' + batch['error']
+    cold = [x for x in report['results']
+            if x['run'] == 'cold' and x['status'] == 'ok']
+    separate = dict((name, sum(x[step][name] for x in cold
+                               for step in ('jh', 'ccs') if step in x))
+                    for name in ('wall', 'requests', 'bytes_downloaded'))
+    separate['disk'] = sum(x.get('disk', 0) for x in cold)
+    line += (' %.2fs vs %.2fs separately, %d vs %d requests, %.1f vs %.1f MB'
+             ' downloaded, %.1f vs %.1f MB on disk'
+             % (batch['wall'], separate['wall'], batch['requests'],
+                separate['requests'], batch['bytes_downloaded']/1024.**2,
+                separate['bytes_downloaded']/1024.**2,
+                batch['disk']/1024.**2, separate['disk']/1024.**2))
+    for stand, error in batch['errors'].items():
+        line += '\n  %s: %s' % (stand, error)
+    return line
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('package_lists', nargs='*',
+                        default=sorted(glob.glob(os.path.join(
+                            os.path.dirname(os.path.abspath(__file__)), '..',
+                            'packageLists', '*.txt'))),
+                        help='package lists to install (default: all)')
+    parser.add_argument('--files', type=int, default=3,
+                        help='number of data files in each package')
+    parser.add_argument('--file_size', type=int, default=4096,
+                        help='size in bytes of each data file')
+    parser.add_argument('--jobs', type=int, default=4,
+                        help='installer --jobs setting')
+    parser.add_argument('--hj_folders', type=str, default='BNL_T03')
+    parser.add_argument('--report', type=str, default='benchmark.json',
+                        help='output JSON report')
+    parser.add_argument('--batch', choices=('symlink', 'hardlink'),
+                        default=None,
+                        help='also install all of the lists with one batch '
+                        'install, linking to the package store this way')
+    parser.add_argument('--verbose', action='store_true',
+                        help='show the installer output')
+    args = parser.parse_args()
+
+    report = benchmark([os.path.abspath(x) for x in args.package_lists],
+                       files=args.files, file_size=args.file_size,
+                       jobs=args.jobs, hj_folders=args.hj_folders.split(),
+                       batch=args.batch, verbose=args.verbose)
+    with open(args.report, 'w') as output:
+        json.dump(report, output, indent=2, sort_keys=True)
+    print('Wrote', args.report)
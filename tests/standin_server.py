@@ -0,0 +1,453 @@
+"""
+Local HTTP stand-in for the GitHub archive, git, REST and GraphQL API
+and Nexus endpoints used by the installers and tools, serving synthetic
+packages.
+"""
+from __future__ import print_function, absolute_import
+import io
+import os
+import re
+import json
+import shutil
+import hashlib
+import tarfile
+import zipfile
+import tempfile
+import time
+import threading
+import subprocess
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+NEXUS_PATH = '/nexus/service/rest/v1/search/assets'
+NEXUS_SEARCH_PATH = '/nexus/service/rest/v1/search'
+API_PATH = '/api'
+
+_archive_pattern = re.compile(r'^/([^/]+)/([^/]+)/archive/(.+)\.tar\.gz$')
+_git_pattern = re.compile(r'^/([^/]+)/([^/]+?)(?:\.git)?(/.*)$')
+_api_patterns = (
+    ('repos', re.compile(r'^%s/orgs/([^/]+)/repos$' % API_PATH)),
+    ('tags', re.compile(r'^%s/repos/([^/]+)/([^/]+)/tags$' % API_PATH)),
+    ('commit', re.compile(r'^%s/repos/([^/]+)/([^/]+)/commits/([0-9a-f]+)$'
+                          % API_PATH)))
+
+_setup_py = '''from distutils.core import setup
+setup(name=%(name)r, version='0.0', packages=[%(package)r],
+      data_files=[('share/modulefiles', ['modulefile'])])
+'''
+
+
+def _contents(name, size):
+    """Deterministic, poorly compressible bytes for a synthetic file."""
+    chunks = []
+    digest = hashlib.sha256(name.encode()).digest()
+    while sum(len(x) for x in chunks) < size:
+        digest = hashlib.sha256(digest).digest()
+        chunks.append(digest)
+    return b''.join(chunks)[:size]
+
+
+class StandInServer(object):
+    """
+    Threaded HTTP server on localhost that serves
+
+    /<org>/<package>/archive/<version>.tar.gz  GitHub release tarballs
+    /<org>/<package>[.git]/...                 git repositories (dumb HTTP)
+    NEXUS_PATH?...                             Nexus search results
+    NEXUS_PATH/download?...                    CCS distribution zips
+    NEXUS_SEARCH_PATH?...                      Nexus component search
+    API_PATH/...                               GitHub REST and GraphQL API
+
+    Each package has `files` data files of `file_size` bytes, plus what
+    the installers expect of its kind: a setup.py for the lcatr
+    packages, the `hj_folders` for harnessed-jobs, a ups table and a
+    harnessed_jobs directory for the others, and bin/CCSbootstrap.sh
+    for CCS packages.  The API serves the repositories and tags added
+    with add_repo, with ETags, so that conditional requests get a 304,
+    and the component search lists the versions added with add_artifact.
+    Requests, 304 responses and bytes served are counted, and so is the
+    peak number of concurrent requests for each Host header, during
+    their `delay`.  Archives
+    of the packages named in `missing` are not found, and those of the
+    packages named in `truncated` are cut off halfway.  Each request is
+    answered after `delay` seconds.
+    """
+    def __init__(self, files=3, file_size=4096, hj_folders=('BNL_T03',)):
+        self.files = files
+        self.file_size = file_size
+        self.hj_folders = hj_folders
+        self.requests = 0
+        self.bytes_served = 0
+        self.not_modified = 0
+        self.peak_connections = {}
+        self._connections = {}
+        self.delay = 0
+        self.truncated = set()
+        self.api_requests = 0
+        self._repos = {}
+        self._artifacts = {}
+        self.missing = set()
+        self._archives = {}
+        self._git_versions = {}
+        self._lock = threading.Lock()
+        self._git_dir = tempfile.mkdtemp(prefix='standin-git-')
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0),
+                                           self._handler_class())
+        self._thread = None
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%d' % self._server.server_address[1]
+
+    def github_org(self, org='lsst-camera-dh'):
+        return '/'.join((self.url, org))
+
+    @property
+    def api_url(self):
+        return self.url + API_PATH
+
+    @property
+    def nexus_base(self):
+        return self.url + '/nexus'
+
+    @property
+    def nexus_url(self):
+        return (self.url + NEXUS_PATH + '/download?repository=ccs'
+                '&maven.extension=zip&sort=version')
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        shutil.rmtree(self._git_dir, ignore_errors=True)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def add_git_version(self, package, version):
+        """Tag `version` in the git repository of `package`."""
+        with self._lock:
+            self._git_versions.setdefault(package, set()).add(version)
+
+    def add_repo(self, org, repo, tags=()):
+        """
+        Add a repository to the API, with its (tag, ISO 8601 commit date)
+        pairs in the order the API lists them.
+        """
+        with self._lock:
+            self._repos.setdefault(org, {})[repo] = list(tags)
+
+    def add_artifact(self, name, versions):
+        """Add the versions of a CCS distribution to the Nexus search."""
+        with self._lock:
+            self._artifacts.setdefault(name, []).extend(versions)
+
+    def _components(self, query, page_size=50):
+        items = [dict(group=query.get('group', 'org.lsst'), name=name,
+                      version=version, repository=query.get('repository'))
+                 for name, versions in sorted(self._artifacts.items())
+                 for version in versions]
+        start = int(query.get('continuationToken') or 0)
+        end = start + page_size
+        return dict(items=items[start:end],
+                    continuationToken=str(end) if end < len(items) else None)
+
+    @staticmethod
+    def tag_sha(repo, tag):
+        return hashlib.sha1(('%s/%s' % (repo, tag)).encode()).hexdigest()
+
+    def _api(self, kind, groups):
+        """Return the JSON body for a REST API request, or None."""
+        repos = self._repos.get(groups[0])
+        if repos is None:
+            return None
+        if kind == 'repos':
+            return [dict(name=name, full_name='/'.join((groups[0], name)))
+                    for name in sorted(repos)]
+        tags = repos.get(groups[1])
+        if tags is None:
+            return None
+        if kind == 'tags':
+            return [dict(name=tag, commit=dict(sha=self.tag_sha(groups[1],
+                                                                tag)))
+                    for tag, _ in tags]
+        for tag, date in tags:
+            if self.tag_sha(groups[1], tag) == groups[2]:
+                return dict(sha=groups[2], commit=dict(
+                    committer=dict(date=date), author=dict(date=date)))
+        return None
+
+    def _graphql(self, variables):
+        """
+        Answer the organization query of inspect_repos with the newest
+        tag of each repository, 100 repositories per page.
+        """
+        repos = sorted(self._repos.get(variables['org'], {}).items())
+        start = int(variables.get('cursor') or 0)
+        nodes = []
+        for name, tags in repos[start:start + 100]:
+            tags = sorted(tags, key=lambda x: x[1], reverse=True)[:1]
+            nodes.append(dict(name=name, refs=dict(nodes=[
+                dict(name=tag, target=dict(committedDate=date))
+                for tag, date in tags])))
+        end = start + len(nodes)
+        return dict(data=dict(organization=dict(repositories=dict(
+            nodes=nodes, pageInfo=dict(hasNextPage=end < len(repos),
+                                       endCursor=str(end))))))
+
+    def _files(self, package, version):
+        """Return the {path: bytes} contents of a synthetic package."""
+        contents = {}
+        for i in range(self.files):
+            path = 'data/file%03d.dat' % i
+            contents[path] = _contents('/'.join((package, version, path)),
+                                       self.file_size)
+        if package.startswith('lcatr-'):
+            module = 'lcatr.' + package.split('-', 1)[1]
+            contents['setup.py'] = (_setup_py % dict(name=package,
+                                                     package=module)).encode()
+            contents['%s/__init__.py' % module.replace('.', '/')] = b''
+            contents['modulefile'] = b'#%Module1.0\n'
+        elif package == 'harnessed-jobs':
+            for folder in self.hj_folders:
+                contents['%s/%s_job/v0/producer.py' % (folder, package)] \
+                    = b'print("producer")\n'
+            contents['python/siteUtils.py'] = b'site = "standin"\n'
+            contents['schemas/standin.schema'] = b'{}\n'
+        elif package.startswith('org-lsst-ccs'):
+            contents['bin/CCSbootstrap.sh'] = b'#!/bin/sh\necho ccs\n'
+        else:
+            module = re.sub(r'\W', '_', package)
+            contents['ups/%s.table' % package] = b'setupRequired(afw)\n'
+            contents['python/%s.py' % module] = b'name = %r\n' % module.encode()
+            contents['harnessed_jobs/%s_job/v0/producer.py' % module] \
+                = b'print("producer")\n'
+        return contents
+
+    def _archive(self, kind, package, version):
+        if package in self.missing:
+            raise KeyError(package)
+        key = (kind, package, version)
+        with self._lock:
+            if key not in self._archives:
+                self._archives[key] = getattr(self, '_make_' + kind)(
+                    package, version)
+            return self._archives[key]
+
+    def _make_tar(self, package, version):
+        top = '%s-%s' % (package, version[1:] if version.startswith('v')
+                         else version)
+        output = io.BytesIO()
+        with tarfile.open(fileobj=output, mode='w:gz') as tar:
+            for path, data in sorted(self._files(package, version).items()):
+                info = tarfile.TarInfo('/'.join((top, path)))
+                info.size = len(data)
+                info.mode = 0o755 if path.endswith('.sh') else 0o644
+                tar.addfile(info, io.BytesIO(data))
+        return output.getvalue()
+
+    def _make_zip(self, package, version):
+        top = '%s-%s' % (package, version)
+        output = io.BytesIO()
+        with zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED) as zfile:
+            for path, data in sorted(self._files(package, version).items()):
+                info = zipfile.ZipInfo('/'.join((top, path)))
+                info.external_attr = (0o755 if path.endswith('.sh')
+                                      else 0o644) << 16
+                info.compress_type = zipfile.ZIP_DEFLATED
+                zfile.writestr(info, data)
+        return output.getvalue()
+
+    def _git_repo(self, org, package):
+        """
+        Create a bare repository with a master branch and the tags added
+        with add_git_version, on first use.
+        """
+        repo = os.path.join(self._git_dir, org, package)
+        with self._lock:
+            if not os.path.isdir(repo):
+                work = tempfile.mkdtemp(dir=self._git_dir)
+                for path, data in self._files(package, 'master').items():
+                    path = os.path.join(work, path)
+                    if not os.path.isdir(os.path.dirname(path)):
+                        os.makedirs(os.path.dirname(path))
+                    with open(path, 'wb') as output:
+                        output.write(data)
+                git = ['git', '-c', 'user.name=standin',
+                       '-c', 'user.email=standin@localhost']
+                commands = (git + ['init', '-q', '-b', 'master', work],
+                            git + ['-C', work, 'add', '-A'],
+                            git + ['-C', work, 'commit', '-q', '-m', 'init'],
+                            git + ['clone', '-q', '--bare', work, repo])
+                commands += tuple(git + ['-C', repo, 'tag', version, 'master']
+                                  for version in
+                                  sorted(self._git_versions.get(package, ()))
+                                  if version != 'master')
+                commands += (git + ['-C', repo, 'update-server-info'],)
+                for command in commands:
+                    subprocess.check_call(command)
+                shutil.rmtree(work)
+        return repo
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send(self, body, content_type='application/octet-stream',
+                      truncate=False):
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                # Counted before the client can have the response.
+                with server._lock:
+                    server.requests += 1
+                    server.bytes_served += len(body)
+                if self.command != 'HEAD':
+                    self.wfile.write(body[:len(body)//2] if truncate
+                                     else body)
+                if truncate:
+                    self.close_connection = True
+
+            def _send_json(self, data, link=None):
+                body = json.dumps(data).encode()
+                etag = '"%s"' % hashlib.sha1(body).hexdigest()
+                with server._lock:
+                    server.api_requests += 1
+                if self.headers.get('If-None-Match') == etag:
+                    with server._lock:
+                        server.requests += 1
+                        server.not_modified += 1
+                    self.send_response(304)
+                    self.send_header('ETag', etag)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.send_header('ETag', etag)
+                if link is not None:
+                    self.send_header('Link', link)
+                self.end_headers()
+                with server._lock:
+                    server.requests += 1
+                    server.bytes_served += len(body)
+                self.wfile.write(body)
+
+            def _send_page(self, url, query, items):
+                per_page = int(query.get('per_page', 30))
+                page = int(query.get('page', 1))
+                link = None
+                if page*per_page < len(items):
+                    link = '<%s%s?per_page=%d&page=%d>; rel="next"' % (
+                        server.url, url.path, per_page, page + 1)
+                self._send_json(items[(page - 1)*per_page:page*per_page],
+                                link)
+
+            def do_HEAD(self):
+                self.do_GET()
+
+            def do_POST(self):
+                if self.path != API_PATH + '/graphql':
+                    self.send_error(404)
+                    return
+                length = int(self.headers.get('Content-Length', 0))
+                request = json.loads(self.rfile.read(length).decode('utf-8'))
+                with server._lock:
+                    data = server._graphql(request.get('variables', {}))
+                self._send_json(data)
+
+            def do_GET(self):
+                host = self.headers.get('Host')
+                with server._lock:
+                    count = server._connections.get(host, 0) + 1
+                    server._connections[host] = count
+                    server.peak_connections[host] = max(
+                        count, server.peak_connections.get(host, 0))
+                # Only the delay is counted, since it ends before the
+                # client can see the end of the response.
+                try:
+                    time.sleep(server.delay)
+                finally:
+                    with server._lock:
+                        server._connections[host] -= 1
+                self._get()
+
+            def _get(self):
+                url = urlparse(self.path)
+                query = dict((k, v[0]) for k, v in parse_qs(url.query).items())
+                try:
+                    for kind, pattern in _api_patterns:
+                        match = pattern.match(url.path)
+                        if match:
+                            with server._lock:
+                                data = server._api(kind, match.groups())
+                            if data is None:
+                                break
+                            if kind == 'commit':
+                                self._send_json(data)
+                            else:
+                                self._send_page(url, query, data)
+                            return
+                    if url.path.startswith(API_PATH + '/'):
+                        self.send_error(404)
+                        return
+                    if url.path == NEXUS_SEARCH_PATH:
+                        with server._lock:
+                            data = server._components(query)
+                        self._send(json.dumps(data).encode(),
+                                   'application/json')
+                        return
+                    if url.path == NEXUS_PATH:
+                        self._send(json.dumps(self._search(query)).encode(),
+                                   'application/json')
+                        return
+                    if url.path in (NEXUS_PATH + '/download',
+                                    NEXUS_PATH + '/file'):
+                        package = query['maven.artifactId']
+                        self._send(server._archive(
+                            'zip', package, query['maven.baseVersion']),
+                                   truncate=package in server.truncated)
+                        return
+                    match = _archive_pattern.match(url.path)
+                    if match:
+                        self._send(server._archive('tar', match.group(2),
+                                                   match.group(3)),
+                                   truncate=match.group(2) in server.truncated)
+                        return
+                    match = _git_pattern.match(url.path)
+                    if match:
+                        repo = server._git_repo(match.group(1),
+                                                match.group(2))
+                        path = os.path.join(repo, match.group(3).lstrip('/'))
+                        if os.path.isfile(path):
+                            with open(path, 'rb') as infile:
+                                self._send(infile.read())
+                            return
+                except KeyError:
+                    pass
+                self.send_error(404)
+
+            def _search(self, query):
+                package = query['maven.artifactId']
+                version = query['maven.baseVersion']
+                data = server._archive('zip', package, version)
+                download = (server.url + NEXUS_PATH + '/file?'
+                            'maven.artifactId=%s&maven.baseVersion=%s'
+                            % (package, version))
+                return dict(items=[dict(
+                    downloadUrl=download,
+                    checksum=dict(sha1=hashlib.sha1(data).hexdigest()))])
+
+        return Handler
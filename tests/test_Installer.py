@@ -41,6 +41,7 @@ class InstallerTestCase(unittest.TestCase):
                          '''export HARNESSEDJOBSDIR=${INST_DIR}/harnessed-jobs-0.3.49-slac
 export VIRTUAL_ENV=${INST_DIR}
 source ${INST_DIR}/Modules/3.2.10/init/bash
+export MODULEPATH=${INST_DIR}/Modules/modulefiles
 export PATH=${INST_DIR}/bin:${PATH}
 export SITENAME=%s
 ''' % self.site)
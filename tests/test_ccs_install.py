@@ -0,0 +1,250 @@
+import os
+import sys
+import shutil
+import argparse
+import tempfile
+import multiprocessing
+import unittest
+import subprocess
+from unittest import mock
+sys.path.insert(0, '../bin')
+from install import Installer
+from lockfile import LockEntry, archive_digest
+from standin_server import StandInServer
+
+_versions = """[ccs]
+org-lsst-ccs-subsystem-ts8-main = 1.1.14
+org-lsst-ccs-subsystem-ts8-gui = 1.2.0-SNAPSHOT
+"""
+
+_released = """[ccs]
+org-lsst-ccs-subsystem-ts8-main = 1.1.14
+org-lsst-ccs-subsystem-ts8-gui = 1.2.0
+org-lsst-ccs-subsystem-rebps-main = 1.1.2
+org-lsst-ccs-subsystem-rebps-gui = 1.1.2
+org-lsst-ccs-subsystem-teststand-main = 2.0.1
+org-lsst-ccs-subsystem-console = 5.2.1
+"""
+
+_generations = """[ccs]
+org-lsst-ccs-subsystem-ts8-main = 1.1.14
+org-lsst-ccs-subsystem-ts8-gui = 1.2.0-SNAPSHOT
+github.config_files = 0.0.7
+executable.ts8-gui = org-lsst-ccs-subsystem-ts8-gui
+symlink.ts8 = org-lsst-ccs-subsystem-ts8-main
+symlink.etc = config_files-0.0.7/data
+"""
+
+def _watch(path, missing, done):
+    while not done.is_set():
+        if not os.path.isdir(path):
+            missing.value += 1
+
+
+class CcsInstallTestCase(unittest.TestCase):
+    "TestCase class for CCS installs from the stand-in server."
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.version_file = os.path.join(self.tmp_dir, 'versions.txt')
+        with open(self.version_file, 'w') as output:
+            output.write(_versions)
+        self.server = StandInServer().start()
+        self.orgs = (Installer._github_org, Installer._nexus_url)
+        Installer._github_org = self.server.github_org()
+        Installer._nexus_url = self.server.nexus_url
+        self.work_dir = os.path.join(self.tmp_dir, 'ccs')
+        os.mkdir(self.work_dir)
+        self.curdir = os.path.abspath('.')
+        os.chdir(self.work_dir)
+
+    def tearDown(self):
+        os.chdir(self.curdir)
+        Installer._github_org, Installer._nexus_url = self.orgs
+        self.server.stop()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_unchanged_snapshot(self):
+        "Test that an unchanged SNAPSHOT is not downloaded again."
+        installer = Installer(self.version_file, inst_dir=None)
+        package = 'org-lsst-ccs-subsystem-ts8-gui'
+        subdir = package + '-1.2.0-SNAPSHOT'
+        self.assertEqual(installer._ccs_download(package, '1.2.0-SNAPSHOT'),
+                         (package, subdir))
+        self.assertTrue(os.path.isdir(subdir))
+        # The search and the download.
+        self.assertEqual(self.server.requests, 2)
+        self.assertIn(subdir, installer._snapshot_checksums())
+
+        bytes_served = self.server.bytes_served
+        installer = Installer(self.version_file, inst_dir=None)
+        self.assertEqual(installer._ccs_download(package, '1.2.0-SNAPSHOT'),
+                         (package, subdir))
+        # Only the search, whose sha1 matches the recorded one.
+        self.assertEqual(self.server.requests, 3)
+        self.assertLess(self.server.bytes_served - bytes_served, 1000)
+
+    def test_locked_snapshot(self):
+        "Test that the sha256 of a locked SNAPSHOT is kept apart from sha1s."
+        installer = Installer(self.version_file, inst_dir=None)
+        package = 'org-lsst-ccs-subsystem-ts8-gui'
+        subdir = package + '-1.2.0-SNAPSHOT'
+        url, sha1 = installer.nexus_asset(package, '1.2.0-SNAPSHOT')
+        size, sha256 = archive_digest(url)
+        installer.lock = {('ccs', package): LockEntry('1.2.0-SNAPSHOT', url,
+                                                      size, sha256, None)}
+        installer._ccs_download(package, '1.2.0-SNAPSHOT')
+        self.assertEqual(installer._snapshot_checksums()[subdir],
+                         dict(sha256=sha256))
+        requests = self.server.requests
+        installer._ccs_download(package, '1.2.0-SNAPSHOT')
+        self.assertEqual(self.server.requests, requests)
+
+        # Without the lock, the sha1 from Nexus is not compared with the
+        # recorded sha256.
+        installer = Installer(self.version_file, inst_dir=None)
+        installer._ccs_download(package, '1.2.0-SNAPSHOT')
+        self.assertEqual(installer._snapshot_checksums()[subdir],
+                         dict(sha1=sha1))
+        requests = self.server.requests
+        installer._ccs_download(package, '1.2.0-SNAPSHOT')
+        self.assertEqual(self.server.requests, requests + 1)
+
+    def test_symlink_swap(self):
+        "Test that replacing a CCS link never leaves the name unresolved."
+        for name in ('pkg-1.0', 'pkg-1.1'):
+            os.mkdir(name)
+        Installer.ccs_symlink('pkg', 'pkg-1.0')
+        self.assertEqual(os.readlink('pkg'), 'pkg-1.0')
+
+        # Watch the link from another process, so that it sees the
+        # link between the steps of a swap.
+        missing = multiprocessing.Value('i', 0)
+        done = multiprocessing.Event()
+        watcher = multiprocessing.Process(target=_watch,
+                                          args=('pkg', missing, done))
+        watcher.start()
+        try:
+            for i in range(1000):
+                Installer.ccs_symlink('pkg', 'pkg-1.%d' % ((i + 1) % 2))
+        finally:
+            done.set()
+            watcher.join()
+        self.assertEqual(missing.value, 0)
+        self.assertEqual(os.readlink('pkg'), 'pkg-1.0')
+        self.assertEqual(sorted(os.listdir('.')),
+                         ['pkg', 'pkg-1.0', 'pkg-1.1'])
+
+    def test_host_connections(self):
+        "Test that concurrent CCS downloads respect host_connections."
+        with open(self.version_file, 'w') as output:
+            output.write(_released)
+        self.server.delay = 0.2
+        installer = Installer(self.version_file, inst_dir=None, jobs=6,
+                              host_connections=2)
+        installer.ccs(argparse.Namespace(ccs_inst_dir=self.work_dir,
+                                         dev=False, site='BNL',
+                                         generations=False))
+        self.assertEqual(self.server.requests, 6)
+        host = self.server.url.split('//')[1]
+        self.assertEqual(self.server.peak_connections, {host: 2})
+
+    def test_failed_download(self):
+        "Test that a failed download leaves no staging directory behind."
+        package = 'org-lsst-ccs-subsystem-ts8-main'
+        self.server.truncated.add(package)
+        installer = Installer(self.version_file, inst_dir=None)
+        self.assertRaises(RuntimeError, installer._ccs_download, package,
+                          '1.1.14')
+        self.assertEqual(os.listdir('.'), [])
+
+        self.server.truncated.clear()
+        self.server.missing.add(package)
+        self.assertRaises(IOError, installer._ccs_download, package,
+                          '1.1.14')
+        self.assertEqual(os.listdir('.'), [])
+
+    def test_generations(self):
+        "Test staging, switching and rolling back CCS generations."
+        with open(self.version_file, 'w') as output:
+            output.write(_generations)
+        self.server.add_git_version('config_files', '0.0.7')
+        args = argparse.Namespace(ccs_inst_dir=self.work_dir, dev=False,
+                                  site='BNL', generations=True)
+        tree = os.path.join(self.work_dir, 'config_files-0.0.7', 'data')
+        # Both installs get the same time stamp.
+        with mock.patch('install.time.strftime',
+                        return_value='20261018T120000'):
+            Installer(self.version_file, inst_dir=None).ccs(args)
+            self.assertEqual(os.readlink('current'),
+                             'generations/20261018T120000')
+            self.assertFalse(os.path.lexists('previous'))
+            self.assertEqual(os.readlink('etc'), 'current/etc')
+            self.assertEqual(os.readlink('generations/20261018T120000/etc'),
+                             '../../config_files-0.0.7/data')
+            self.assertEqual(os.path.realpath('etc'), os.path.realpath(tree))
+            self.assertEqual(os.path.realpath('ts8'), os.path.realpath(
+                'org-lsst-ccs-subsystem-ts8-main-1.1.14'))
+            self.assertTrue(os.access('bin/ts8-gui', os.X_OK))
+            snapshot = os.path.realpath('org-lsst-ccs-subsystem-ts8-gui')
+            self.assertTrue(snapshot.startswith(
+                os.path.realpath('snapshots') + os.path.sep))
+
+            Installer(self.version_file, inst_dir=None).ccs(args)
+        self.assertEqual(sorted(os.listdir('generations')),
+                         ['20261018T120000', '20261018T120000-1'])
+        self.assertEqual(os.readlink('current'),
+                         'generations/20261018T120000-1')
+        self.assertEqual(os.readlink('previous'),
+                         'generations/20261018T120000')
+        self.assertEqual(os.path.realpath('etc'), os.path.realpath(tree))
+        self.assertTrue(os.access('bin/ts8-gui', os.X_OK))
+
+        Installer(self.version_file, inst_dir=None).ccs_rollback(
+            self.work_dir)
+        self.assertEqual(os.readlink('current'), 'generations/20261018T120000')
+        self.assertEqual(os.readlink('previous'),
+                         'generations/20261018T120000-1')
+        self.assertEqual(os.path.realpath('etc'), os.path.realpath(tree))
+
+    def test_dropped_package(self):
+        "Test switching to a generation with one package fewer."
+        with open(self.version_file, 'w') as output:
+            output.write(_generations)
+        self.server.add_git_version('config_files', '0.0.7')
+        args = argparse.Namespace(ccs_inst_dir=self.work_dir, dev=False,
+                                  site='BNL', generations=True)
+        package = 'org-lsst-ccs-subsystem-ts8-main'
+        with mock.patch('install.time.strftime',
+                        return_value='20261018T120000'):
+            Installer(self.version_file, inst_dir=None).ccs(args)
+            self.assertEqual(os.readlink(package), 'current/' + package)
+            with open(self.version_file, 'w') as output:
+                output.write('\n'.join(x for x in _generations.split('\n')
+                                       if 'ts8-main' not in x))
+            Installer(self.version_file, inst_dir=None).ccs(args)
+        self.assertEqual(os.readlink('current'),
+                         'generations/20261018T120000-1')
+        self.assertFalse(os.path.lexists(package))
+        self.assertFalse(os.path.lexists('ts8'))
+        self.assertEqual(os.readlink('etc'), 'current/etc')
+
+        # Rolling back brings the links back.
+        Installer(self.version_file, inst_dir=None).ccs_rollback(
+            self.work_dir)
+        self.assertEqual(os.readlink(package), 'current/' + package)
+        self.assertEqual(os.path.realpath('ts8'), os.path.realpath(
+            package + '-1.1.14'))
+
+    def test_rollback_usage(self):
+        "Test that --rollback needs --ccs_inst_dir."
+        command = [sys.executable,
+                   os.path.join(self.curdir, '..', 'bin', 'install.py'),
+                   '--rollback', self.version_file]
+        process = subprocess.run(command, stdout=subprocess.PIPE,
+                                 stderr=subprocess.PIPE)
+        self.assertEqual(process.returncode, 2)
+        self.assertIn(b'--rollback needs --ccs_inst_dir', process.stderr)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,161 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+sys.path.insert(0, '../bin')
+from fetch import ArchiveCache
+from eups_build import read_table, build_in_order, build_key, store_build, \
+    restore_build, StackSession
+
+class EupsBuildTestCase(unittest.TestCase):
+    "TestCase class for the EUPS package build scheduler."
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        # obs_lsst sets up eotest, which is provided by the eotest_pkg
+        # repository; both need the stack's afw.
+        self.tables = {'eotest_pkg-0.1': ('eotest', ['afw']),
+                       'obs_lsst-19.0.0': ('obs_lsst', ['afw', 'eotest']),
+                       'other-1.0': ('other', [])}
+        for package_dir, (product, requires) in self.tables.items():
+            os.makedirs(os.path.join(self.tmp_dir, package_dir, 'ups'))
+            lines = ['setupRequired(%s)' % x for x in requires]
+            lines.append('setupOptional("scons")')
+            lines.append('envPrepend(PYTHONPATH, ${PRODUCT_DIR}/python)')
+            with open(os.path.join(self.tmp_dir, package_dir, 'ups',
+                                   product + '.table'), 'w') as output:
+                output.write('\n'.join(lines) + '\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_read_table(self):
+        "Test reading product names and dependencies from table files."
+        self.assertEqual(read_table(os.path.join(self.tmp_dir,
+                                                 'obs_lsst*')),
+                         ('obs_lsst', ['afw', 'eotest', 'scons']))
+        self.assertEqual(read_table(self.tmp_dir), (None, []))
+
+    def test_build_in_order(self):
+        "Test that packages are built after the ones they depend on."
+        events = []
+        lock = threading.Lock()
+
+        def log(*event):
+            with lock:
+                events.append(event)
+
+        def build(package):
+            log('start', package)
+            time.sleep(0.05)
+            log('end', package)
+
+        packages = sorted(self.tables)
+        build_in_order(packages, lambda package: log('fetch', package),
+                       build,
+                       lambda package: read_table(os.path.join(self.tmp_dir,
+                                                               package)),
+                       jobs=3)
+        self.assertEqual(sorted(x for x in events if x[0] == 'end'),
+                         [('end', x) for x in packages])
+        self.assertLess(events.index(('end', 'eotest_pkg-0.1')),
+                        events.index(('start', 'obs_lsst-19.0.0')))
+        # The independent package builds alongside eotest.
+        self.assertLess(events.index(('start', 'other-1.0')),
+                        events.index(('end', 'eotest_pkg-0.1')))
+
+    def test_slow_fetch(self):
+        "Test that builds start while other packages are still fetched."
+        events = []
+        lock = threading.Lock()
+        tables = {'a': ('a', []), 'b': ('b', ['a']), 'slow': ('slow', [])}
+
+        def log(*event):
+            with lock:
+                events.append(event)
+
+        def fetch(package):
+            if package == 'slow':
+                time.sleep(0.5)
+            log('fetched', package)
+
+        build_in_order(sorted(tables), fetch,
+                       lambda package: log('build', package), tables.get,
+                       jobs=3)
+        self.assertLess(events.index(('build', 'a')),
+                        events.index(('fetched', 'slow')))
+        self.assertLess(events.index(('build', 'a')),
+                        events.index(('build', 'b')))
+        self.assertLess(events.index(('build', 'b')),
+                        events.index(('fetched', 'slow')))
+
+    def test_errors(self):
+        "Test that build errors and dependency cycles are raised."
+        def build(package):
+            raise RuntimeError(package)
+        self.assertRaises(RuntimeError, build_in_order, ['a'],
+                          lambda package: None, build,
+                          lambda package: ('a', []))
+        tables = {'a': ('a', ['b']), 'b': ('b', ['a'])}
+        self.assertRaises(RuntimeError, build_in_order, ['a', 'b'],
+                          lambda package: None, lambda package: None,
+                          tables.get, jobs=2)
+
+    def test_build_cache(self):
+        "Test storing and restoring built trees."
+        cache = ArchiveCache(os.path.join(self.tmp_dir, 'cache'))
+        key = build_key('obs_lsst', '19.0.0', 'abc123', '/stack/', 'lib')
+        self.assertEqual(key, build_key('obs_lsst', '19.0.0', 'abc123',
+                                        '/stack', 'lib'))
+        self.assertNotEqual(key, build_key('obs_lsst', '19.0.0', 'abc123',
+                                           '/stack', 'lib python'))
+        self.assertIsNone(build_key('obs_lsst', 'master', None, '/stack', ''))
+        # The builds of the packages it requires are part of the key.
+        self.assertEqual(key, build_key('obs_lsst', '19.0.0', 'abc123',
+                                        '/stack', 'lib', requires={}))
+        self.assertNotEqual(key, build_key('obs_lsst', '19.0.0', 'abc123',
+                                           '/stack', 'lib',
+                                           requires=dict(afw='def456')))
+        self.assertIsNone(build_key('obs_lsst', '19.0.0', 'abc123', '/stack',
+                                    'lib', requires=dict(afw=None)))
+
+        package_dir = os.path.join(self.tmp_dir, 'obs_lsst-19.0.0')
+        self.assertFalse(restore_build(cache, key, self.tmp_dir))
+        os.mkdir(os.path.join(package_dir, 'lib'))
+        with open(os.path.join(package_dir, 'lib', 'libobs.so'), 'w') as output:
+            output.write('built')
+        store_build(cache, key, package_dir)
+        shutil.rmtree(os.path.join(package_dir, 'lib'))
+        self.assertTrue(restore_build(cache, key, self.tmp_dir))
+        self.assertTrue(os.path.isfile(os.path.join(package_dir, 'lib',
+                                                    'libobs.so')))
+        self.assertEqual(len(os.listdir(cache.tmp_dir)), 0)
+
+    def test_stack_session(self):
+        "Test that the stack is set up once for several commands."
+        stack_dir = os.path.join(self.tmp_dir, 'stack')
+        os.makedirs(os.path.join(stack_dir, 'eups', 'bin'))
+        log_file = os.path.join(self.tmp_dir, 'log')
+        with open(os.path.join(stack_dir, 'loadLSST.bash'), 'w') as output:
+            output.write('echo loadLSST >> %s\n' % log_file)
+            output.write('export EUPS_DIR=%s/eups\n' % stack_dir)
+            output.write('export EUPS_PATH=%s\n' % stack_dir)
+        with open(os.path.join(stack_dir, 'eups', 'bin', 'setups.sh'),
+                  'w') as output:
+            output.write('setup() { echo setup $1 $EUPS_PATH >> %s; }\n'
+                         % log_file)
+        session = StackSession(stack_dir + '/', '/inst/eups')
+        session.run('setup eotest')
+        session.run('setup obs_lsst')
+        with open(log_file) as infile:
+            self.assertEqual(infile.read().split('\n'),
+                             ['loadLSST',
+                              'setup eotest /inst/eups:%s' % stack_dir,
+                              'setup obs_lsst /inst/eups:%s' % stack_dir,
+                              ''])
+
+if __name__ == '__main__':
+    unittest.main()
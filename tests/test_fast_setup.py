@@ -0,0 +1,85 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+import subprocess
+import unittest
+sys.path.insert(0, '../bin')
+from fast_setup import write_fast_setup
+
+class FastSetupTestCase(unittest.TestCase):
+    "TestCase class for setup-fast.sh generation."
+
+    def setUp(self):
+        self.inst_dir = tempfile.mkdtemp()
+        self.stack_file = os.path.join(self.inst_dir, 'loadLSST.bash')
+        self.ups_db = os.path.join(self.inst_dir, 'eups', 'ups_db', 'eotest')
+        os.makedirs(self.ups_db)
+        self.eups_dir = os.path.join(self.inst_dir, 'eups_dir')
+        os.makedirs(os.path.join(self.eups_dir, 'bin'))
+        with open(os.path.join(self.eups_dir, 'bin', 'setups.sh'),
+                  'w') as output:
+            output.write('export EUPS_PATH=/nonexistent/eups\n')
+            output.write('export PATH=${EUPS_DIR}/bin:${PATH}\n')
+            output.write('setup() { echo "setup $@"; }\n')
+            output.write('unsetup() { echo "unsetup $@"; }\n')
+        with open(self.stack_file, 'w') as output:
+            output.write('export EUPS_DIR=%s\n' % self.eups_dir)
+            output.write('source ${EUPS_DIR}/bin/setups.sh\n')
+            output.write('export EUPS_PATH=%s/eups\n' % self.inst_dir)
+            output.write('export SETUP_EOTEST="eotest 0.0.31 -f Linux64"\n')
+        with open(os.path.join(self.inst_dir, 'setup.sh'), 'w') as output:
+            output.write('echo slow setup\n')
+            output.write('source %s\n' % self.stack_file)
+            output.write("export INST_DIR=%s\n" % self.inst_dir)
+            output.write("export PATH=${INST_DIR}/bin:${PATH}\n")
+            output.write("export PYTHONPATH=${INST_DIR}/python:${PYTHONPATH}\n")
+            output.write("export SITENAME='BNL lab'\n")
+            output.write('PS1="[jh]$ "\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.inst_dir)
+
+    def _source(self, script):
+        command = ('export PATH=/opt/bin:$PATH PYTHONPATH=/opt/python; '
+                   'source %s; echo "$PATH|$PYTHONPATH|$SITENAME"' % script)
+        return subprocess.run(command, shell=True, executable='/bin/bash',
+                              stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                              universal_newlines=True)
+
+    def test_write_fast_setup(self):
+        "Test that the frozen environment matches setup.sh."
+        fast_script = write_fast_setup(self.inst_dir, [self.stack_file])
+        with open(fast_script) as infile:
+            contents = infile.read()
+        self.assertNotIn('slow setup', contents)
+        self.assertIn(self.ups_db, contents)
+        fast = self._source(fast_script)
+        slow = self._source(os.path.join(self.inst_dir, 'setup.sh'))
+        self.assertEqual(fast.stdout, slow.stdout.split('\n', 1)[1])
+        self.assertEqual(fast.stderr, '')
+
+    def test_eups_functions(self):
+        "Test that the EUPS shell functions are defined again."
+        fast_script = write_fast_setup(self.inst_dir, [self.stack_file])
+        command = ('source %s > /dev/null; type setup > /dev/null && '
+                   'setup eotest && echo "$PATH|$EUPS_PATH"')
+        fast, slow = [subprocess.check_output(
+            command % x, shell=True, executable='/bin/bash',
+            universal_newlines=True) for x in
+            (fast_script, os.path.join(self.inst_dir, 'setup.sh'))]
+        self.assertTrue(fast.startswith('setup eotest\n'))
+        self.assertEqual(fast, slow)
+
+    def test_stale(self):
+        "Test the fall back to setup.sh when the stack changes."
+        fast_script = write_fast_setup(self.inst_dir, [self.stack_file])
+        later = time.time() + 10
+        os.utime(self.ups_db, (later, later))
+        fast = self._source(fast_script)
+        self.assertTrue(fast.stdout.startswith('slow setup\n'))
+        self.assertIn('out of date', fast.stderr)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+import os
+import sys
+import shutil
+import stat
+import tarfile
+import tempfile
+import unittest
+import zipfile
+sys.path.insert(0, '../bin')
+from fetch import ArchiveCache, run_parallel, sha256sum, download_and_extract
+
+class ArchiveCacheTestCase(unittest.TestCase):
+    "TestCase class for the ArchiveCache class."
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache = ArchiveCache(os.path.join(self.tmp_dir, 'cache'),
+                                  max_bytes=100, min_age=0)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _archive(self, contents):
+        filename = self.cache.tempfile()
+        with open(filename, 'wb') as output:
+            output.write(contents)
+        return filename
+
+    def test_put_get(self):
+        "Test storing and retrieving archives."
+        key = ('github', 'lsst-camera-dh', 'eotest', '0.0.31')
+        self.assertIsNone(self.cache.get(key))
+        path = self.cache.put(key, self._archive(b'eotest'))
+        self.assertEqual(self.cache.get(key), path)
+        self.assertEqual(os.path.basename(path), sha256sum(path))
+
+        # Identical archives under different keys share a blob.
+        other_key = ('nexus', 'eotest', '0.0.31')
+        self.assertEqual(self.cache.put(other_key, self._archive(b'eotest')),
+                         path)
+        self.assertEqual(len(os.listdir(self.cache.blob_dir)), 1)
+
+    def test_evict(self):
+        "Test that the least recently used archives are evicted."
+        keys = [('github', 'org', 'pkg', str(i)) for i in range(3)]
+        for i, key in enumerate(keys):
+            self.cache.put(key, self._archive(str(i).encode()*40))
+            os.utime(self.cache.get(key), (i, i))
+        self.assertIsNone(self.cache.get(keys[0]))
+        self.assertIsNotNone(self.cache.get(keys[1]))
+        self.assertIsNotNone(self.cache.get(keys[2]))
+
+class DownloadAndExtractTestCase(unittest.TestCase):
+    "TestCase class for the download_and_extract function."
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.src_dir = os.path.join(self.tmp_dir, 'src')
+        self.dest_dir = os.path.join(self.tmp_dir, 'dest')
+        os.makedirs(os.path.join(self.src_dir, 'pkg-1.0', 'bin'))
+        os.mkdir(self.dest_dir)
+        script = os.path.join(self.src_dir, 'pkg-1.0', 'bin', 'run.sh')
+        with open(script, 'w') as output:
+            output.write('#!/bin/sh\n' + 'echo hello\n'*1000)
+        os.chmod(script, 0o755)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _url(self, archive_format):
+        archive = os.path.join(self.tmp_dir, 'pkg-1.0.' + archive_format)
+        if archive_format == 'tar':
+            with tarfile.open(archive, 'w:gz') as tar:
+                tar.add(os.path.join(self.src_dir, 'pkg-1.0'), 'pkg-1.0')
+        else:
+            with zipfile.ZipFile(archive, 'w', zipfile.ZIP_DEFLATED) as zfile:
+                for root, dirs, files in os.walk(self.src_dir):
+                    for name in dirs + files:
+                        path = os.path.join(root, name)
+                        zfile.write(path, os.path.relpath(path, self.src_dir))
+        return 'file://' + archive
+
+    def _check(self):
+        script = os.path.join(self.dest_dir, 'pkg-1.0', 'bin', 'run.sh')
+        with open(script) as infile:
+            self.assertEqual(len(infile.readlines()), 1001)
+        self.assertTrue(os.stat(script).st_mode & stat.S_IXUSR)
+        self.assertEqual(os.listdir(self.dest_dir), ['pkg-1.0'])
+
+    def test_tar(self):
+        "Test streaming extraction of a tarball."
+        download_and_extract(self._url('tar'), self.dest_dir)
+        self._check()
+
+    def test_zip(self):
+        "Test streaming extraction of a zip file, replacing an old tree."
+        os.makedirs(os.path.join(self.dest_dir, 'pkg-1.0', 'stale'))
+        download_and_extract(self._url('zip'), self.dest_dir,
+                             archive_format='zip')
+        self._check()
+        self.assertFalse(os.path.exists(os.path.join(self.dest_dir,
+                                                     'pkg-1.0', 'stale')))
+
+    def test_cache(self):
+        "Test that archives are stored in and read from the cache."
+        cache = ArchiveCache(os.path.join(self.tmp_dir, 'cache'))
+        key = ('github', 'org', 'pkg', '1.0')
+        url = self._url('tar')
+        download_and_extract(url, self.dest_dir, cache=cache, key=key)
+        self.assertEqual(cache.digest(key), sha256sum(url[len('file://'):]))
+        os.remove(url[len('file://'):])
+        shutil.rmtree(os.path.join(self.dest_dir, 'pkg-1.0'))
+        download_and_extract(url, self.dest_dir, cache=cache, key=key)
+        self._check()
+
+class RunParallelTestCase(unittest.TestCase):
+    "TestCase class for the run_parallel function."
+
+    def test_run_parallel(self):
+        "Test that results are returned in order and errors propagate."
+        items = [(i, i) for i in range(10)]
+        self.assertEqual(run_parallel(pow, items, jobs=4),
+                         [pow(i, i) for i in range(10)])
+        self.assertRaises(ZeroDivisionError, run_parallel,
+                          lambda x: 1/x, [(1,), (0,)], jobs=2)
+
+if __name__ == '__main__':
+    unittest.main()
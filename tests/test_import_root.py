@@ -0,0 +1,56 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+sys.path.insert(0, '../bin')
+from import_root import build_import_root, format_collisions
+
+class ImportRootTestCase(unittest.TestCase):
+    "TestCase class for the consolidated import root."
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.dirs = [os.path.join(self.tmp_dir, x, 'python')
+                     for x in ('offline-jobs', 'harnessed-jobs', 'lib')]
+        files = {0: ['siteUtils.py', 'lsst/offline/__init__.py',
+                     'common/__init__.py', '__pycache__/siteUtils.pyc'],
+                 1: ['hjUtils.py', 'siteUtils.py', 'lsst/hj/__init__.py',
+                     'README.md'],
+                 2: ['lcatr/__init__.py', 'common/__init__.py', '_ext.so']}
+        for i, names in files.items():
+            for name in names:
+                path = os.path.join(self.dirs[i], name)
+                if not os.path.isdir(os.path.dirname(path)):
+                    os.makedirs(os.path.dirname(path))
+                open(path, 'w').close()
+        self.root = os.path.join(self.tmp_dir, 'python-root')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_build_import_root(self):
+        "Test the symlink farm and the collision report."
+        collisions = build_import_root(self.root, self.dirs)
+        self.assertEqual(sorted(os.listdir(self.root)),
+                         ['_ext.so', 'common', 'hjUtils.py', 'lcatr', 'lsst',
+                          'siteUtils.py'])
+        self.assertEqual(os.readlink(os.path.join(self.root, 'siteUtils.py')),
+                         os.path.join(self.dirs[0], 'siteUtils.py'))
+        # The lsst namespace package is merged.
+        self.assertFalse(os.path.islink(os.path.join(self.root, 'lsst')))
+        self.assertEqual(sorted(os.listdir(os.path.join(self.root, 'lsst'))),
+                         ['hj', 'offline'])
+        self.assertEqual(sorted(x[0] for x in collisions),
+                         ['common', 'siteUtils.py'])
+        self.assertIn('2 name collisions', format_collisions(collisions))
+
+        # Rebuilding replaces the old farm.
+        build_import_root(self.root, self.dirs[1:])
+        self.assertEqual(os.readlink(os.path.join(self.root, 'siteUtils.py')),
+                         os.path.join(self.dirs[1], 'siteUtils.py'))
+        self.assertFalse(os.path.exists(os.path.join(self.root, 'lsst',
+                                                     'offline')))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import os
+import sys
+import shutil
+import datetime
+import tempfile
+import unittest
+sys.path.insert(0, '../python')
+from inspect_repos import GitHubAPI, latest_tags
+from standin_server import StandInServer
+
+class InspectReposTestCase(unittest.TestCase):
+    "TestCase class for scanning the tags of an organization's repos."
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache_file = os.path.join(self.tmp_dir, 'inspect_repos.json')
+        self.server = StandInServer().start()
+        self.server.add_repo('lsst-camera-dh', 'eotest',
+                             [('0.0.31', '2019-03-01T10:00:00Z'),
+                              ('0.0.30', '2019-04-01T10:00:00Z'),
+                              ('0.0.29', '2019-02-01T10:00:00Z')])
+        for i in range(150):
+            self.server.add_repo('lsst-camera-dh', 'repo%03d' % i,
+                                 [('v%d' % i, '2020-01-01T00:00:%02dZ'
+                                   % (i % 60))])
+        self.server.add_repo('lsst-camera-dh', 'untagged')
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.tmp_dir)
+
+    def _api(self, **kwds):
+        return GitHubAPI(self.server.api_url, cache_file=self.cache_file,
+                         **kwds)
+
+    def test_rest(self):
+        "Test the REST scan and the conditional requests of a re-run."
+        api = self._api()
+        latest = latest_tags(api, 'lsst-camera-dh', jobs=4)
+        api.save()
+        self.assertEqual(len(latest), 152)
+        self.assertEqual(latest['eotest'],
+                         ('0.0.30', datetime.datetime(2019, 4, 1, 10)))
+        self.assertEqual(latest['repo007'][0], 'v7')
+        self.assertIsNone(latest['untagged'])
+        # 2 pages of repos, 152 tag lists and 153 commits.
+        self.assertEqual(api.requests, 307)
+
+        # Unchanged repos are revalidated and their commits not fetched.
+        self.server.add_repo('lsst-camera-dh', 'untagged',
+                             [('0.1.0', '2021-01-01T00:00:00Z')])
+        api = self._api()
+        self.assertEqual(latest_tags(api, 'lsst-camera-dh', jobs=4),
+                         dict(latest, untagged=(
+                             '0.1.0', datetime.datetime(2021, 1, 1))))
+        self.assertEqual(api.requests, 155)
+        self.assertEqual(api.not_modified, 153)
+
+    def test_graphql(self):
+        "Test the batched GraphQL scan."
+        api = self._api(token='token')
+        latest = latest_tags(api, 'lsst-camera-dh')
+        self.assertEqual(api.requests, 2)
+        self.assertEqual(latest['eotest'],
+                         ('0.0.30', datetime.datetime(2019, 4, 1, 10)))
+        self.assertIsNone(latest['untagged'])
+        self.assertEqual(latest, latest_tags(self._api(), 'lsst-camera-dh',
+                                             jobs=4))
+
+if __name__ == '__main__':
+    unittest.main()
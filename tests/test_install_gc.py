@@ -0,0 +1,122 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+import unittest
+sys.path.insert(0, '../bin')
+from install_gc import tree_names, find_garbage, collect_garbage, \
+    dropped_paths, remove_paths
+from upgrade_plan import Action, read_versions
+
+class InstallGcTestCase(unittest.TestCase):
+    "TestCase class for install directory garbage collection."
+
+    def setUp(self):
+        self.inst_dir = os.path.realpath(tempfile.mkdtemp())
+        for name in ('eotest-0.0.31', 'eotest-0.0.30', 'config_files-0.0.14',
+                     'harnessed-jobs-0.4.90', 'harnessed-jobs-0.4.89',
+                     'modules-3.2.10', 'share', 'lib', '.partial-abc',
+                     '.partial-new', 'store/eotest-0.0.29',
+                     'generations/g1', 'generations/g2', 'generations/g3',
+                     'snapshots/aaa/console-1.0-SNAPSHOT',
+                     'snapshots/bbb/console-1.0-SNAPSHOT'):
+            os.makedirs(self._path(name))
+        open(self._path('0.4.89.tar.gz'), 'w').close()
+        # Leftovers of an install that finished an hour ago.
+        old = time.time() - 7200
+        for name in ('.partial-abc', '0.4.89.tar.gz'):
+            os.utime(self._path(name), (old, old))
+        # A link to a package store tree that nothing uses.
+        os.symlink(self._path('store', 'eotest-0.0.29'),
+                   self._path('eotest-0.0.29'))
+        os.symlink(self._path('harnessed-jobs-0.4.89'),
+                   self._path('share', 'BNL_T03'))
+        os.symlink('../../snapshots/bbb/console-1.0-SNAPSHOT',
+                   self._path('generations', 'g3', 'console'))
+        os.symlink('generations/g3', self._path('current'))
+        os.symlink('current/console', self._path('console'))
+
+    def tearDown(self):
+        shutil.rmtree(self.inst_dir)
+
+    def _path(self, *names):
+        return os.path.join(self.inst_dir, *names)
+
+    def test_tree_names(self):
+        "Test the package tree names of a package list."
+        names = tree_names(read_versions('../packageLists/BNL_TS8_1_versions.txt'))
+        self.assertIn('eotest-0.0.31', names)
+        self.assertIn('org-lsst-ccs-subsystem-console-5.2.1-SNAPSHOT', names)
+        self.assertNotIn('symlink.ts-org-lsst-ccs-subsystem-teststand-main',
+                         names)
+
+    def test_find_garbage(self):
+        "Test which paths are found to be unused."
+        garbage = find_garbage(self.inst_dir,
+                               keep_names=set(['eotest-0.0.31']),
+                               keep_generations=1)
+        expected = ['generations/g1', 'generations/g2', '.partial-abc',
+                    '0.4.89.tar.gz', 'config_files-0.0.14',
+                    'eotest-0.0.29', 'eotest-0.0.30', 'harnessed-jobs-0.4.90',
+                    'modules-3.2.10', 'snapshots/aaa']
+        self.assertEqual(sorted(garbage),
+                         sorted(self._path(x) for x in expected))
+        # A staging directory of a running install is left alone.
+        self.assertIn(self._path('.partial-new'),
+                      find_garbage(self.inst_dir, min_age=0))
+
+    def test_collect_garbage(self):
+        "Test dry runs and removal."
+        collect_garbage(self.inst_dir, dry_run=True)
+        self.assertTrue(os.path.isdir(self._path('eotest-0.0.30')))
+        collect_garbage(self.inst_dir, keep_names=set(['eotest-0.0.31']),
+                        jobs=2)
+        self.assertFalse(os.path.exists(self._path('eotest-0.0.30')))
+        self.assertFalse(os.path.exists(self._path('0.4.89.tar.gz')))
+        self.assertTrue(os.path.isdir(self._path('eotest-0.0.31')))
+        self.assertTrue(os.path.isdir(self._path('harnessed-jobs-0.4.89')))
+        self.assertTrue(os.path.isdir(self._path('lib')))
+
+    def test_dropped_paths(self):
+        "Test that the packages an upgrade drops are removed."
+        os.makedirs(self._path('bin'))
+        os.makedirs(self._path('eups', 'ups_db', 'eotest'))
+        with open(self._path('eups', 'ups_db', 'eotest', '0.0.30.version'),
+                  'w') as output:
+            output.write('PROD_DIR = %s\n' % self._path('eotest-0.0.30'))
+        with open(self._path('eups', 'ups_db', 'eotest', 'current.chain'),
+                  'w') as output:
+            output.write('CHAIN = current\nVERSION = 0.0.30\n')
+        os.symlink('eotest-0.0.30', self._path('eotest'))
+        os.symlink('../config_files-0.0.14', self._path('bin', 'ccs-shell'))
+        os.symlink('config_files-0.0.14', self._path('config'))
+        plan = [Action('eups_packages', 'eotest', '0.0.30', None, 'remove', 0),
+                Action('jh', 'harnessed-jobs', '0.4.89', None, 'remove', 0),
+                Action('ccs', 'executable.ccs-shell', 'config_files-0.0.14',
+                       None, 'remove', 0),
+                Action('ccs', 'eotest', '0.0.31', '0.0.31', 'keep', 0)]
+        # harnessed-jobs-0.4.89 is still linked from share, but the
+        # generations do not use it.
+        expected = ['bin/ccs-shell', 'eotest', 'share/BNL_T03',
+                    'eups/ups_db/eotest/0.0.30.version',
+                    'eups/ups_db/eotest/current.chain',
+                    'eotest-0.0.30', 'harnessed-jobs-0.4.89']
+        paths = dropped_paths(self.inst_dir, plan)
+        self.assertEqual(paths, [self._path(x) for x in expected])
+        remove_paths(self.inst_dir, paths, dry_run=True)
+        self.assertTrue(os.path.isdir(self._path('eotest-0.0.30')))
+        remove_paths(self.inst_dir, paths)
+        for path in paths:
+            self.assertFalse(os.path.lexists(path))
+        self.assertTrue(os.path.islink(self._path('config')))
+        self.assertTrue(os.path.isdir(self._path('eotest-0.0.31')))
+
+        # A tree that a generation links to is kept for rollback.
+        os.symlink(self._path('eotest-0.0.31'),
+                   self._path('generations', 'g1', 'eotest'))
+        plan = [Action('packages', 'eotest', '0.0.31', None, 'remove', 0)]
+        self.assertEqual(dropped_paths(self.inst_dir, plan), [])
+
+if __name__ == '__main__':
+    unittest.main()
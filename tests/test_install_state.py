@@ -0,0 +1,96 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+sys.path.insert(0, '../bin')
+from install_state import InstallState
+from install import Installer
+
+class InstallStateTestCase(unittest.TestCase):
+    "TestCase class for the InstallState class."
+
+    def setUp(self):
+        self.inst_dir = tempfile.mkdtemp()
+        self.output = os.path.join(self.inst_dir, 'eotest-0.0.31')
+        os.mkdir(self.output)
+
+    def tearDown(self):
+        shutil.rmtree(self.inst_dir)
+
+    def test_steps(self):
+        "Test that completed steps are current until their inputs change."
+        inputs = dict(version='0.0.31', stack_dir='/stack')
+        state = InstallState(self.inst_dir)
+        self.assertFalse(state.is_current('eups:eotest', inputs))
+        with state.step('eups:eotest', inputs, [self.output]) as entry:
+            entry['digest'] = 'abc'
+
+        state = InstallState(self.inst_dir)
+        self.assertTrue(state.is_current('eups:eotest', inputs))
+        self.assertEqual(state.steps['eups:eotest']['digest'], 'abc')
+        self.assertFalse(state.is_current('eups:eotest',
+                                          dict(inputs, version='0.0.32')))
+        self.assertFalse(InstallState(self.inst_dir, reset=True)
+                         .is_current('eups:eotest', inputs))
+        # An archive re-tagged with the same version is not current.
+        self.assertTrue(state.is_current('eups:eotest', inputs, digest='abc'))
+        self.assertFalse(state.is_current('eups:eotest', inputs,
+                                          digest='def'))
+        os.rmdir(self.output)
+        self.assertFalse(state.is_current('eups:eotest', inputs))
+
+    def test_failed_step(self):
+        "Test that failed steps are recorded and not current."
+        state = InstallState(self.inst_dir)
+        with self.assertRaises(RuntimeError):
+            with state.step('lcatr:lcatr-harness', dict(version='0.13.0')):
+                raise RuntimeError()
+        state = InstallState(self.inst_dir)
+        self.assertEqual(state.steps['lcatr:lcatr-harness']['status'],
+                         'failed')
+        self.assertFalse(state.is_current('lcatr:lcatr-harness',
+                                          dict(version='0.13.0')))
+
+    def test_eups_requires(self):
+        "Test that rebuilding an EUPS package makes its dependents stale."
+        version_file = os.path.join(self.inst_dir, 'versions.txt')
+        with open(version_file, 'w') as output:
+            output.write('[jh]\nharnessed-jobs = 0.4.66\n\n'
+                         '[dmstack]\nstack_dir = /stack\n\n'
+                         '[eups_packages]\neotest = 0.0.31\n'
+                         'obs_lsst = 19.0.0\nafw = 19.0.1\n')
+        tables = (('eotest', 'setupRequired(obs_lsst)\n'),
+                  ('obs_lsst', 'setupRequired(afw)\n'), ('afw', ''))
+        installer = Installer(version_file, inst_dir=self.inst_dir)
+        pars = installer._section('eups_packages')
+        curdir = os.path.abspath('.')
+        os.chdir(self.inst_dir)
+        try:
+            for package, table in tables:
+                package_dir = '%s-%s' % (package, pars[package])
+                os.makedirs(os.path.join(package_dir, 'ups'))
+                with open(os.path.join(package_dir, 'ups',
+                                       package + '.table'), 'w') as output:
+                    output.write(table)
+            self.assertEqual(installer._eups_requires('eotest'),
+                             dict(obs_lsst=None, afw=None))
+            for package, _ in reversed(tables):
+                installer._fetched[(package, pars[package])] = package
+                installer._run_step('eups', package, pars[package],
+                                    lambda package, version: None)
+            installer = Installer(version_file, inst_dir=self.inst_dir)
+            self.assertTrue(installer._is_current('eups', 'eotest',
+                                                  '0.0.31'))
+            # A new afw archive also rebuilds obs_lsst and eotest.
+            installer._fetched[('afw', '19.0.1')] = 'afw-retagged'
+            self.assertEqual(installer._eups_requires('eotest'),
+                             dict(obs_lsst='obs_lsst', afw='afw-retagged'))
+            for package, _ in tables:
+                self.assertFalse(installer._is_current('eups', package,
+                                                       pars[package]))
+        finally:
+            os.chdir(curdir)
+
+if __name__ == '__main__':
+    unittest.main()
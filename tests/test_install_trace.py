@@ -0,0 +1,100 @@
+import os
+import sys
+import json
+import shutil
+import tarfile
+import tempfile
+import unittest
+import subprocess
+sys.path.insert(0, '../bin')
+from fetch import download_and_extract
+from install_trace import Tracer
+from standin_server import StandInServer
+
+class InstallTraceTestCase(unittest.TestCase):
+    "TestCase class for tracing install steps."
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.tracer = Tracer()
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def test_span(self):
+        "Test the bytes downloaded and written by a fetch step."
+        self.tracer.sizes = True
+        with StandInServer(files=2, file_size=1000) as server:
+            url = server.github_org() + '/eotest/archive/0.0.1.tar.gz'
+            with self.tracer.span('fetch', 'eotest', '0.0.1',
+                                  outputs=[os.path.join(self.work_dir,
+                                                        'eotest-0.0.1')]):
+                download_and_extract(url, self.work_dir)
+            bytes_served = server.bytes_served
+        event, = self.tracer.events
+        self.assertEqual(event['phase'], 'fetch')
+        self.assertEqual(event['exit_status'], 0)
+        self.assertEqual(event['bytes_downloaded'], bytes_served)
+        self.assertGreater(event['bytes_written'], 2000)
+
+        # Reading an archive from a file does not count as a download.
+        archive = os.path.join(self.work_dir, 'eotest.tar.gz')
+        with tarfile.open(archive, 'w:gz') as tar:
+            tar.add(os.path.join(self.work_dir, 'eotest-0.0.1'),
+                    'eotest-restored')
+        with self.tracer.span('build', 'eotest', '0.0.1'):
+            download_and_extract('file://' + archive, self.work_dir)
+        self.assertTrue(os.path.isdir(os.path.join(self.work_dir,
+                                                   'eotest-restored')))
+        self.assertEqual(self.tracer.events[1]['bytes_downloaded'], 0)
+        self.assertIsNone(self.tracer.events[1]['bytes_written'])
+
+        # Without sizes, the outputs are not walked.
+        tracer = Tracer()
+        with tracer.span('fetch', 'eotest', '0.0.1',
+                         outputs=[os.path.join(self.work_dir,
+                                               'eotest-0.0.1')]):
+            pass
+        self.assertIsNone(tracer.events[0]['bytes_written'])
+
+    def test_failed_step(self):
+        "Test that failed steps record their exit status and re-raise."
+        with self.assertRaises(subprocess.CalledProcessError):
+            with self.tracer.span('build', 'eotest', '0.0.1'):
+                subprocess.check_call('exit 3', shell=True)
+        with self.assertRaises(RuntimeError):
+            with self.tracer.span('link', 'eotest', '0.0.1'):
+                raise RuntimeError('no links')
+        self.assertEqual([x['exit_status'] for x in self.tracer.events],
+                         [3, 1])
+        self.assertIn('no links', self.tracer.events[1]['error'])
+        totals = self.tracer.phase_totals()
+        self.assertEqual(totals['build']['failed'], 1)
+
+    def test_chrome_trace(self):
+        "Test the Chrome trace export, phase totals and summary table."
+        for package in ('eotest', 'offline-jobs'):
+            with self.tracer.span('build', package, '0.0.1'):
+                pass
+        with self.tracer.span('setup', 'setup.sh'):
+            pass
+        filename = os.path.join(self.work_dir, 'trace.json')
+        self.tracer.write(filename)
+        with open(filename) as infile:
+            trace = json.load(infile)
+        spans = [x for x in trace['traceEvents'] if x['ph'] == 'X']
+        self.assertEqual([x['name'] for x in spans],
+                         ['eotest 0.0.1', 'offline-jobs 0.0.1', 'setup.sh'])
+        self.assertEqual(spans[0]['cat'], 'build')
+        self.assertEqual(spans[0]['args']['exit_status'], 0)
+        self.assertTrue(any(x['ph'] == 'M' for x in trace['traceEvents']))
+        self.assertEqual(trace['otherData']['phases']['build']['steps'], 2)
+        totals = self.tracer.phase_totals()
+        self.assertLessEqual(totals['build']['wall'],
+                             totals['build']['busy'] + 1e-6)
+        summary = self.tracer.summary()
+        self.assertIn('offline-jobs 0.0.1', summary)
+        self.assertIn('setup.sh', summary)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import sys
+import time
+import shutil
+import threading
+import argparse
+import tempfile
+import unittest
+import warnings
+import subprocess
+from unittest import mock
+sys.path.insert(0, '../bin')
+import install
+import jh_install
+from fetch import ArchiveCache, run_parallel
+from installer_base import InstallerBase, add_arguments, installer_args
+
+class InstallerBaseTestCase(unittest.TestCase):
+    "TestCase class for the code shared by install.py and jh_install.py."
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.parser = argparse.ArgumentParser()
+        add_arguments(self.parser)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_shared_methods(self):
+        "Test that both installers use one copy of the shared steps."
+        for module in (install, jh_install):
+            self.assertTrue(issubclass(module.Installer, InstallerBase))
+            for name in ('fetch_all', '_run_step', '_lcatr_build', 'jh',
+                         'eups_package_installer', 'precompile_python'):
+                self.assertNotIn(name, vars(module.Installer))
+        installer = jh_install.Installer('test_install_versions.txt',
+                                         inst_dir=None)
+        self.assertEqual(installer.pars['harnessed-jobs'], '0.3.49-slac')
+
+    def test_cache_options(self):
+        "Test the archive cache options."
+        args = self.parser.parse_args(['--cache_dir', self.tmp_dir,
+                                       'versions.txt'])
+        cache = installer_args(args)['cache']
+        self.assertIsInstance(cache, ArchiveCache)
+        self.assertEqual(cache.cache_dir, self.tmp_dir)
+        args = self.parser.parse_args(['--no_cache', 'versions.txt'])
+        self.assertIsNone(installer_args(args)['cache'])
+
+    def test_lcatr_fallback(self):
+        "Test that setup.py install fallbacks run one at a time."
+        installer = install.Installer('test_install_versions.txt',
+                                      inst_dir=self.tmp_dir)
+        installer.wheels = mock.Mock()
+        installer.wheels.wheel.side_effect \
+            = subprocess.CalledProcessError(1, 'pip wheel')
+        lock = threading.Lock()
+        running = []
+        peak = []
+
+        def check_call(*args, **kwds):
+            with lock:
+                running.append(args[0])
+                peak.append(len(running))
+            time.sleep(0.05)
+            with lock:
+                running.remove(args[0])
+
+        packages = [(x, '0.1') for x in ('lcatr-harness', 'lcatr-schema',
+                                         'lcatr-modulefiles')]
+        with mock.patch('installer_base.subprocess.check_call',
+                        side_effect=check_call), \
+             warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            run_parallel(installer._lcatr_build, packages, jobs=3)
+        self.assertEqual(len(peak), 3)
+        self.assertEqual(max(peak), 1)
+        self.assertEqual(len(caught), 3)
+        installer.wheels.install.assert_not_called()
+
+    def test_jh_usage(self):
+        "Test that jh_install.py --gc, --plan and --upgrade need --inst_dir."
+        for option in ('--gc', '--plan', '--upgrade'):
+            process = subprocess.run([sys.executable, '../bin/jh_install.py',
+                                      option, 'test_install_versions.txt'],
+                                     stdout=subprocess.PIPE,
+                                     stderr=subprocess.PIPE)
+            self.assertEqual(process.returncode, 2)
+            self.assertIn(('%s needs --inst_dir' % option).encode(),
+                          process.stderr)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+import os
+import sys
+import shutil
+import hashlib
+import tempfile
+import unittest
+import warnings
+import subprocess
+from urllib.request import urlopen
+sys.path.insert(0, '../bin')
+from install import Installer
+from fetch import ArchiveCache
+from lockfile import read_lock, lock_section
+from standin_server import StandInServer
+
+_versions = """[jh]
+harnessed-jobs = 0.4.66
+lcatr-harness = 0.18.2
+
+# Not the same version as 1.1.
+[eups_packages]
+eotest = 1.10
+
+[ccs]
+org-lsst-ccs-subsystem-ts8-main = 1.1.14
+org-lsst-ccs-subsystem-ts8-gui = 1.2.0-SNAPSHOT
+github.config_files = 0.0.7
+symlink.ts8 = org-lsst-ccs-subsystem-ts8-main
+"""
+
+class LockfileTestCase(unittest.TestCase):
+    "TestCase class for compiling and installing from lockfiles."
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.version_file = os.path.join(self.tmp_dir, 'versions.txt')
+        self.lockfile = os.path.join(self.tmp_dir, 'versions.lock')
+        with open(self.version_file, 'w') as output:
+            output.write(_versions)
+        self.server = StandInServer().start()
+        self.server.add_git_version('config_files', '0.0.7')
+        self.orgs = (Installer._github_org, Installer._nexus_url)
+        Installer._github_org = self.server.github_org()
+        Installer._nexus_url = self.server.nexus_url
+        self.cache = ArchiveCache(os.path.join(self.tmp_dir, 'cache'))
+        self.work_dir = os.path.join(self.tmp_dir, 'work')
+        os.mkdir(self.work_dir)
+        self.curdir = os.path.abspath('.')
+        os.chdir(self.work_dir)
+
+    def tearDown(self):
+        os.chdir(self.curdir)
+        Installer._github_org, Installer._nexus_url = self.orgs
+        self.server.stop()
+        shutil.rmtree(self.tmp_dir)
+
+    def _compile(self):
+        installer = Installer(self.version_file, inst_dir=None, jobs=4,
+                              cache=self.cache)
+        return installer.write_lock(self.lockfile)
+
+    def test_compile(self):
+        "Test compiling a package list into a lockfile."
+        lock = self._compile()
+        self.assertEqual(read_lock(self.lockfile), lock)
+        self.assertEqual(sorted(lock),
+                         [('ccs', 'github.config_files'),
+                          ('ccs', 'org-lsst-ccs-subsystem-ts8-gui'),
+                          ('ccs', 'org-lsst-ccs-subsystem-ts8-main'),
+                          ('eups_packages', 'eotest'),
+                          ('jh', 'harnessed-jobs'),
+                          ('jh', 'lcatr-harness')])
+        entry = lock[('eups_packages', 'eotest')]
+        self.assertEqual(entry.version, '1.10')
+        with urlopen(entry.url) as response:
+            data = response.read()
+        self.assertEqual(entry.size, len(data))
+        self.assertEqual(entry.sha256, hashlib.sha256(data).hexdigest())
+        self.assertEqual(self.cache.digest(('github', 'lsst-camera-dh',
+                                            'eotest', '1.10')), entry.sha256)
+        self.assertIn('/file?', lock[('ccs',
+                                      'org-lsst-ccs-subsystem-ts8-gui')].url)
+        entry = lock[('ccs', 'github.config_files')]
+        self.assertEqual(len(entry.commit), 40)
+        self.assertIsNone(entry.sha256)
+
+        with open(self.lockfile) as infile:
+            contents = infile.read()
+        self.assertTrue(contents.startswith(_versions))
+        self.assertIn('[%s]' % lock_section('jh', 'lcatr-harness'), contents)
+        # Recompiling replaces the lock sections.
+        Installer(self.lockfile, inst_dir=None).write_lock(self.lockfile)
+        with open(self.lockfile) as infile:
+            self.assertEqual(infile.read(), contents)
+
+    def test_install_from_lock(self):
+        "Test that installs from a lockfile use its versions and digests."
+        lock = self._compile()
+        self.assertEqual(Installer(self.version_file, inst_dir=None)
+                         ._section('eups_packages')['eotest'], 1.1)
+        installer = Installer(self.lockfile, inst_dir=None, cache=self.cache)
+        self.assertEqual(installer._section('eups_packages')['eotest'],
+                         '1.10')
+        self.assertEqual(installer.fetch('eotest', '1.10'),
+                         lock[('eups_packages', 'eotest')].sha256)
+        self.assertTrue(os.path.isdir('eotest-1.10'))
+
+        name, target = installer._ccs_download('github.config_files', '0.0.7')
+        self.assertEqual(subprocess.check_output(
+            ['git', '-C', target, 'rev-parse', 'HEAD']).decode().strip(),
+                         lock[('ccs', 'github.config_files')].commit)
+
+        # An archive that does not match its digest is not unpacked.
+        with open(self.lockfile) as infile:
+            contents = infile.read()
+        sha256 = lock[('jh', 'lcatr-harness')].sha256
+        with open(self.lockfile, 'w') as output:
+            output.write(contents.replace(sha256, '0'*64))
+        installer = Installer(self.lockfile, inst_dir=None)
+        self.assertRaises(RuntimeError, installer.fetch, 'lcatr-harness',
+                          '0.18.2')
+        self.assertFalse(os.path.exists('lcatr-harness-0.18.2'))
+
+    def test_stale_entries(self):
+        "Test that lock entries for edited versions are dropped."
+        self._compile()
+        with open(self.lockfile) as infile:
+            contents = infile.read()
+        with open(self.lockfile, 'w') as output:
+            output.write(contents.replace('eotest = 1.10', 'eotest = 1.11', 1))
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            lock = read_lock(self.lockfile)
+        self.assertNotIn(('eups_packages', 'eotest'), lock)
+        self.assertIn(('jh', 'lcatr-harness'), lock)
+        self.assertEqual(len(caught), 1)
+
+if __name__ == '__main__':
+    unittest.main()
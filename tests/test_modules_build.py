@@ -0,0 +1,84 @@
+import os
+import sys
+import shutil
+import subprocess
+import tarfile
+import tempfile
+import unittest
+sys.path.insert(0, '../bin')
+from fetch import ArchiveCache
+from modules_build import modules_prefix, build_modules, link_modules
+from install import Installer
+
+_configure = """#!/bin/sh
+prefix=${1#--prefix=}
+printf 'all:\\n\\ttouch built\\ninstall:\\n\\tmkdir -p %s/Modules/9.9/init\\n\\ttouch %s/Modules/9.9/init/bash\\n' $prefix $prefix > Makefile
+echo configured >> ../../configure.log
+"""
+
+# Like that of Modules 3.2, with the default MODULEPATH in its prefix.
+_init_bash = """MODULEPATH=${MODULEPATH:-%s/Modules/modulefiles}
+export MODULEPATH
+module() { [ "$1" = avail ] && ls ${MODULEPATH}; }
+"""
+
+class ModulesBuildTestCase(unittest.TestCase):
+    "TestCase class for the shared Modules build."
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache = ArchiveCache(os.path.join(self.tmp_dir, 'cache'))
+        src_dir = os.path.join(self.tmp_dir, 'modules-9.9')
+        os.mkdir(src_dir)
+        with open(os.path.join(src_dir, 'configure'), 'w') as output:
+            output.write(_configure)
+        os.chmod(os.path.join(src_dir, 'configure'), 0o755)
+        archive = self.cache.tempfile()
+        with tarfile.open(archive, 'w:gz') as tar:
+            tar.add(src_dir, 'modules-9.9')
+        self.cache.put(('sourceforge', 'modules', '9.9'), archive)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_build_modules(self):
+        "Test that Modules is built once and linked into installs."
+        prefix = modules_prefix(self.cache.cache_dir, '9.9')
+        self.assertTrue(prefix.startswith(self.cache.cache_dir))
+        for inst_dir in ('inst1', 'inst2'):
+            modules_home = build_modules(prefix, '9.9', cache=self.cache,
+                                         build_jobs=2)
+            inst_dir = os.path.join(self.tmp_dir, inst_dir)
+            link = link_modules(modules_home, inst_dir, '9.9')
+            self.assertTrue(os.path.isfile(os.path.join(link, 'init',
+                                                        'bash')))
+            self.assertFalse(os.path.islink(os.path.join(inst_dir,
+                                                         'Modules')))
+        with open(os.path.join(os.path.dirname(prefix), 'configure.log')) as log:
+            self.assertEqual(log.readlines(), ['configured\n'])
+
+    def test_modulepath(self):
+        "Test that the install's modulefiles are found with a shared build."
+        prefix = modules_prefix(self.cache.cache_dir, '9.9')
+        modules_home = build_modules(prefix, '9.9', cache=self.cache)
+        with open(os.path.join(modules_home, 'init', 'bash'), 'w') as output:
+            output.write(_init_bash % prefix)
+        inst_dir = os.path.join(self.tmp_dir, 'inst')
+        os.makedirs(os.path.join(inst_dir, 'share', 'modulefiles'))
+        open(os.path.join(inst_dir, 'share', 'modulefiles', 'lcatr'),
+             'w').close()
+        link_modules(modules_home, inst_dir, '3.2.10')
+        os.symlink(os.path.join(inst_dir, 'share', 'modulefiles'),
+                   os.path.join(inst_dir, 'Modules', 'modulefiles'))
+        installer = Installer('test_install_versions.txt', inst_dir=inst_dir)
+        setup_script = os.path.join(inst_dir, 'setup.sh')
+        with open(setup_script, 'w') as output:
+            output.write('export INST_DIR=%s\n' % inst_dir)
+            output.write(installer._jh_config())
+        output = subprocess.check_output(
+            'unset MODULEPATH; source %s; module avail' % setup_script,
+            shell=True, executable='/bin/bash', universal_newlines=True)
+        self.assertEqual(output, 'lcatr\n')
+
+if __name__ == '__main__':
+    unittest.main()
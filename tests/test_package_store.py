@@ -0,0 +1,276 @@
+import os
+import sys
+import shutil
+import hashlib
+import tempfile
+import unittest
+import argparse
+sys.path.insert(0, '../bin')
+from install import Installer, stand_name
+from fetch import ArchiveCache, run_parallel
+from package_store import PackageStore
+from standin_server import StandInServer
+
+_versions = """[jh]
+harnessed-jobs = 0.4.66
+lcatr-harness = 0.18.2
+lcatr-schema = 0.7.0
+lcatr-modulefiles = 0.4.0
+
+[packages]
+eTraveler-clientAPI = 1.7.1
+config_files = %s
+
+[ccs]
+org-lsst-ccs-subsystem-ts8-main = 1.1.14
+org-lsst-ccs-subsystem-ts8-gui = 1.2.0-SNAPSHOT
+github.jh-ccs-utils = 0.1.0
+symlink.ts8 = org-lsst-ccs-subsystem-ts8-main
+"""
+
+_eups_versions = _versions + """
+[eups_packages]
+eotest = 1.4.2
+
+[dmstack]
+stack_dir = /nonexistent/stack
+"""
+
+def _snapshot(top):
+    """Return the {path: (mtime, sha1)} of the files under `top`."""
+    files = {}
+    for root, dirs, names in os.walk(top):
+        for name in dirs + names:
+            path = os.path.join(root, name)
+            if os.path.isdir(path) and not os.path.islink(path):
+                files[path] = os.lstat(path).st_mtime
+            elif os.path.islink(path):
+                files[path] = os.readlink(path)
+            else:
+                with open(path, 'rb') as infile:
+                    files[path] = (os.lstat(path).st_mtime,
+                                   hashlib.sha1(infile.read()).hexdigest())
+    return files
+
+class PackageStoreTestCase(unittest.TestCase):
+    "TestCase class for the package trees shared by install directories."
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.store_dir = os.path.join(self.tmp_dir, 'store')
+        self.curdir = os.path.abspath('.')
+
+    def tearDown(self):
+        os.chdir(self.curdir)
+        shutil.rmtree(self.tmp_dir)
+
+    def _make(self, calls):
+        def make(dest_dir):
+            calls.append(dest_dir)
+            tree = os.path.join(dest_dir, 'pkg-1.0')
+            os.makedirs(os.path.join(tree, 'python'))
+            with open(os.path.join(tree, 'python', 'pkg.py'), 'w') as output:
+                output.write('x = 1\n')
+            return 'digest'
+        return make
+
+    def test_store(self):
+        "Test making, linking and adopting stored trees."
+        store = PackageStore(self.store_dir)
+        calls = []
+        results = run_parallel(store.ensure, [(('github', 'pkg', '1.0'),
+                                               self._make(calls))]*8, jobs=8)
+        self.assertEqual(len(calls), 1)
+        tree, digest = results[0]
+        self.assertEqual(set(results), set([(tree, 'digest')]))
+        self.assertEqual(os.path.basename(tree), 'pkg-1.0')
+        self.assertEqual(store.digest(('github', 'pkg', '1.0')), 'digest')
+        self.assertIsNone(store.tree(('github', 'pkg', '2.0')))
+
+        inst_dir = os.path.join(self.tmp_dir, 'inst')
+        os.makedirs(os.path.join(inst_dir, 'pkg-1.0'))
+        store.link(tree, os.path.join(inst_dir, 'pkg-1.0'))
+        self.assertEqual(os.readlink(os.path.join(inst_dir, 'pkg-1.0')), tree)
+
+        hard = PackageStore(self.store_dir, link_mode='hardlink')
+        hard.link(tree, os.path.join(inst_dir, 'pkg-1.0'))
+        linked = os.path.join(inst_dir, 'pkg-1.0', 'python', 'pkg.py')
+        self.assertFalse(os.path.islink(os.path.join(inst_dir, 'pkg-1.0')))
+        self.assertTrue(os.path.samefile(linked, os.path.join(
+            tree, 'python', 'pkg.py')))
+
+        # An install's own build is moved into the store.
+        build = os.path.join(inst_dir, 'eotest-1.0')
+        os.makedirs(os.path.join(build, 'lib'))
+        stored = store.adopt(('eups-build', 'eotest', '1.0'), build)
+        self.assertEqual(os.readlink(build), stored)
+        self.assertTrue(os.path.isdir(os.path.join(stored, 'lib')))
+        self.assertRaises(ValueError, PackageStore, self.store_dir, 'copy')
+
+    def test_unused(self):
+        "Test finding the stored trees that no install links to."
+        store = PackageStore(self.store_dir)
+        hard = PackageStore(self.store_dir, link_mode='hardlink')
+        trees = dict((version, store.ensure(('github', 'pkg', version),
+                                            self._make([]))[0])
+                     for version in ('1.0', '1.1', '1.2'))
+        store.ensure(('eups-tables', 'pkg', '1.0', 'digest'), self._make([]))
+        store.ensure(('eups-tables', 'pkg', '2.0', 'digest'), self._make([]))
+        os.mkdir(os.path.join(store.tmp_dir, 'leftover'))
+        inst_dir = os.path.join(self.tmp_dir, 'inst')
+        os.mkdir(inst_dir)
+        dests = dict((version, os.path.join(inst_dir, 'pkg-' + version))
+                     for version in trees)
+        store.link(trees['1.0'], dests['1.0'])
+        hard.link(trees['1.1'], dests['1.1'])
+        store.link(trees['1.2'], dests['1.2'])
+        os.remove(dests['1.2'])
+        # Everything was made just now.
+        self.assertEqual(store.unused(), [])
+
+        key_dirs = [os.path.join(store.tree_dir, 'github', 'pkg', '1.2'),
+                    os.path.join(store.tree_dir, 'eups-tables', 'pkg', '2.0',
+                                 'digest')]
+        leftover = os.path.join(store.tmp_dir, 'leftover')
+        unused = store.unused(min_age=-1)
+        self.assertEqual(sorted(x for x in unused
+                                if not x.startswith(store.link_dir)),
+                         sorted(key_dirs + [leftover]))
+        self.assertEqual(len([x for x in unused
+                              if x.startswith(store.link_dir)]), 1)
+        # Links that an install's garbage collection removes.
+        unused = store.unused(min_age=-1, removed=[dests['1.0'],
+                                                   dests['1.1']])
+        self.assertIn(os.path.join(store.tree_dir, 'github', 'pkg', '1.0'),
+                      unused)
+        self.assertIn(os.path.join(store.tree_dir, 'github', 'pkg', '1.1'),
+                      unused)
+        self.assertIn(os.path.join(store.tree_dir, 'eups-tables', 'pkg',
+                                   '1.0', 'digest'), unused)
+
+    def test_stand_name(self):
+        "Test the stand names of the package lists."
+        self.assertEqual(stand_name('../packageLists/BNL_TS8_1_versions.txt'),
+                         'BNL_TS8_1')
+        self.assertEqual(stand_name('SLAC_REB_testing.txt'),
+                         'SLAC_REB_testing')
+
+    def test_installers(self):
+        "Test that installers sharing a store fetch each package once."
+        server = StandInServer().start()
+        orgs = (Installer._github_org, Installer._nexus_url)
+        Installer._github_org = server.github_org()
+        Installer._nexus_url = server.nexus_url
+        try:
+            server.add_git_version('jh-ccs-utils', '0.1.0')
+            store = PackageStore(self.store_dir)
+            cache = ArchiveCache(os.path.join(self.tmp_dir, 'cache'))
+            installers = []
+            for stand, config_files in (('TS3', '0.0.14'), ('TS5', '0.0.15')):
+                version_file = os.path.join(self.tmp_dir, stand + '.txt')
+                with open(version_file, 'w') as output:
+                    output.write(_versions % config_files)
+                inst_dir = os.path.join(self.tmp_dir, stand, 'jh')
+                os.makedirs(inst_dir)
+                installers.append(Installer(version_file, inst_dir=inst_dir,
+                                            cache=cache, store=store))
+            packages = set()
+            for installer in installers:
+                packages.update(installer.packages())
+            self.assertEqual(len(packages), 10)
+            for package in packages:
+                installers[0].prefetch(*package)
+            requests = server.requests
+
+            for installer in installers:
+                installer.fetch_all([('eTraveler-clientAPI', '1.7.1'),
+                                     ('harnessed-jobs', '0.4.66')])
+                ccs_dir = os.path.join(os.path.dirname(installer.inst_dir),
+                                       'ccs')
+                installer.ccs(argparse.Namespace(
+                    ccs_inst_dir=ccs_dir, dev=False, site='BNL',
+                    generations=False))
+                os.chdir(self.curdir)
+            # Only the SNAPSHOT is downloaded again, by each stand.
+            self.assertEqual(server.requests - requests, 4)
+            trees = [os.path.realpath(os.path.join(
+                x.inst_dir, 'eTraveler-clientAPI-1.7.1')) for x in installers]
+            self.assertEqual(trees[0], trees[1])
+            self.assertTrue(trees[0].startswith(self.store_dir))
+            ccs_trees = [os.path.realpath(os.path.join(
+                self.tmp_dir, stand, 'ccs', package)) for stand in
+                ('TS3', 'TS5') for package in ('ts8', 'jh-ccs-utils-0.1.0')]
+            self.assertEqual(ccs_trees[0], ccs_trees[2])
+            self.assertEqual(ccs_trees[1], ccs_trees[3])
+            self.assertTrue(os.path.isdir(os.path.join(ccs_trees[1], '.git')))
+        finally:
+            Installer._github_org, Installer._nexus_url = orgs
+            server.stop()
+
+    def test_immutable_trees(self):
+        "Test that installs do not modify the trees they link to."
+        server = StandInServer().start()
+        orgs = (Installer._github_org, Installer._nexus_url)
+        Installer._github_org = server.github_org()
+        Installer._nexus_url = server.nexus_url
+        try:
+            store = PackageStore(self.store_dir)
+            cache = ArchiveCache(os.path.join(self.tmp_dir, 'cache'))
+            snapshots = []
+            for stand in ('TS3', 'TS5'):
+                version_file = os.path.join(self.tmp_dir, stand + '.txt')
+                with open(version_file, 'w') as output:
+                    output.write(_eups_versions % '0.0.14')
+                inst_dir = os.path.join(self.tmp_dir, stand, 'jh')
+                os.makedirs(inst_dir)
+                installer = Installer(version_file, inst_dir=inst_dir,
+                                      cache=cache, store=store)
+                os.chdir(inst_dir)
+                installer.fetch_all(installer._jh_archives(
+                    ('lcatr', 'harnessed-jobs', 'package')))
+                # Build in the source tree, as pip and setup.py do.
+                build_dirs = []
+
+                def build(package_name, version, source_dir):
+                    build_dirs.append(os.path.realpath(source_dir))
+                    for name in ('build', package_name + '.egg-info'):
+                        os.mkdir(os.path.join(source_dir, name))
+                installer._lcatr_install = build
+                for package in ('lcatr-harness', 'lcatr-schema',
+                                'lcatr-modulefiles'):
+                    installer.lcatr_install(package)
+                self.assertEqual(len(build_dirs), 3)
+                for build_dir in build_dirs:
+                    self.assertTrue(build_dir.startswith(inst_dir))
+                    self.assertFalse(os.path.exists(build_dir))
+                installer.precompile_python()
+
+                # What _eups_build does after building in the first
+                # stand; the second links the stored build instead of
+                # unpacking the sources.
+                requests = server.requests
+                digest = installer.fetch('eotest', '1.4.2')
+                key = installer._eups_build_key('eotest', '1.4.2', digest)
+                if stand == 'TS3':
+                    installer._store_build(key, 'eotest', '1.4.2', digest)
+                else:
+                    self.assertEqual(server.requests, requests)
+                self.assertEqual(os.path.realpath('eotest-1.4.2'),
+                                 store.tree(key))
+                os.chdir(self.curdir)
+                snapshots.append(_snapshot(store.tree_dir))
+
+            self.assertEqual(snapshots[0], snapshots[1])
+            hj_tree = os.path.realpath(os.path.join(inst_dir,
+                                                    'harnessed-jobs-0.4.66'))
+            self.assertTrue(hj_tree.startswith(self.store_dir))
+            self.assertTrue(os.path.isdir(os.path.join(hj_tree, 'python',
+                                                       '__pycache__')))
+            self.assertFalse([x for x in snapshots[0]
+                              if x.endswith(('/build', '.egg-info'))])
+        finally:
+            Installer._github_org, Installer._nexus_url = orgs
+            server.stop()
+
+if __name__ == '__main__':
+    unittest.main()
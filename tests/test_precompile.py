@@ -0,0 +1,54 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+sys.path.insert(0, '../bin')
+from install_state import InstallState
+from precompile import compile_trees
+
+class PrecompileTestCase(unittest.TestCase):
+    "TestCase class for byte-compiling installed Python trees."
+
+    def setUp(self):
+        self.inst_dir = tempfile.mkdtemp()
+        self.trees = [os.path.join(self.inst_dir, x, 'python')
+                      for x in ('eotest-0.0.31', 'offline-jobs-0.0.16')]
+        for tree in self.trees:
+            os.makedirs(os.path.join(tree, 'pkg'))
+            with open(os.path.join(tree, 'pkg', 'module.py'), 'w') as output:
+                output.write('x = 1\n')
+        with open(os.path.join(self.trees[1], 'py2.py'), 'w') as output:
+            output.write('print "hello"\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.inst_dir)
+
+    def test_compile_trees(self):
+        "Test compiling trees and skipping the ones already compiled."
+        state = InstallState(self.inst_dir)
+        results = compile_trees(self.trees + ['missing'], sys.executable,
+                                state=state, jobs=2)
+        self.assertEqual([x[0] for x in results], self.trees)
+        self.assertEqual([x[2] for x in results], [True, False])
+        self.assertTrue(os.listdir(os.path.join(self.trees[0], 'pkg',
+                                                '__pycache__')))
+
+        with open(os.path.join(self.trees[0], 'pkg', 'new.py'), 'w') as output:
+            output.write('y = 2\n')
+        results = compile_trees(self.trees, sys.executable,
+                                state=InstallState(self.inst_dir))
+        self.assertIsNotNone(results[0][1])
+        # The tree with a syntax error is compiled again.
+        self.assertIsNotNone(results[1][1])
+        self.assertFalse(results[1][2])
+
+        os.remove(os.path.join(self.trees[1], 'py2.py'))
+        compile_trees(self.trees, sys.executable,
+                      state=InstallState(self.inst_dir))
+        results = compile_trees(self.trees, sys.executable,
+                                state=InstallState(self.inst_dir))
+        self.assertEqual([x[1] for x in results], [None, None])
+
+if __name__ == '__main__':
+    unittest.main()
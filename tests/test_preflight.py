@@ -0,0 +1,135 @@
+import os
+import sys
+import io
+import shutil
+import runpy
+import tempfile
+import unittest
+from unittest import mock
+from contextlib import redirect_stdout
+sys.path.insert(0, '../bin')
+from install import Installer
+from installer_base import InstallerBase
+from preflight import probe_url, probe_git, link_problems
+from standin_server import StandInServer
+
+_versions = """[jh]
+harnessed-jobs = 0.4.66
+lcatr-harness = 0.18.2
+lcatr-schema = 0.7.0
+lcatr-modulefiles = 0.4.0
+
+[eups_packages]
+eotest = 1.4.2
+
+[ccs]
+org-lsst-ccs-subsystem-ts8-main = 1.1.14
+org-lsst-ccs-subsystem-ts8-gui = 1.1.14
+config_files = 0.0.7
+github.jh-ccs-utils = 0.3.0
+executable.ts8-gui = org-lsst-ccs-subsystem-ts8-gui
+executable.ts8-shell = org-lsst-ccs-shell
+symlink.ts8 = org-lsst-ccs-subsystem-ts8-main
+symlink.etc = config_files-0.0.7/BNL/etc
+symlink.ccs-shell = org-lsst-ccs-power-main
+"""
+
+# Only GitHub packages, which the stand-in server serves for any org.
+_cli_versions = """[jh]
+harnessed-jobs = 0.4.66
+lcatr-harness = 0.18.2
+lcatr-schema = 0.7.0
+lcatr-modulefiles = 0.4.0
+
+[eups_packages]
+eotest = 1.4.2
+
+[ccs]
+config_files = 0.0.7
+github.jh-ccs-utils = 0.3.0
+symlink.etc = config_files-0.0.7/BNL/etc
+"""
+
+class PreflightTestCase(unittest.TestCase):
+    "TestCase class for the pre-flight checks of a package list."
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.version_file = os.path.join(self.tmp_dir, 'versions.txt')
+        with open(self.version_file, 'w') as output:
+            output.write(_versions)
+        self.server = StandInServer().start()
+        self.server.add_git_version('config_files', '0.0.7')
+        self.server.missing.update(('eotest',
+                                    'org-lsst-ccs-subsystem-ts8-gui'))
+        self.orgs = (Installer._github_org, Installer._nexus_url)
+        Installer._github_org = self.server.github_org()
+        Installer._nexus_url = self.server.nexus_url
+
+    def tearDown(self):
+        Installer._github_org, Installer._nexus_url = self.orgs
+        self.server.stop()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_probes(self):
+        "Test the URL and git probes."
+        url = self.server.github_org() + '/eotest/archive/1.4.2.tar.gz'
+        self.assertIn('404', probe_url(url))
+        self.assertIsNone(probe_url(url.replace('eotest', 'camera-model')))
+        url = self.server.github_org() + '/config_files'
+        self.assertIsNone(probe_git(url, '0.0.7'))
+        self.assertIsNone(probe_git(url, 'master'))
+        self.assertEqual(probe_git(url, '0.0.8'), 'no branch or tag 0.0.8')
+
+    def test_link_problems(self):
+        "Test the checks of the link targets."
+        names = set(['pkg', 'pkg-1.0'])
+        self.assertEqual(link_problems([('a', 'pkg'), ('b', 'pkg-1.0/etc'),
+                                        ('c', '../pkg/bin/x'),
+                                        ('d', self.tmp_dir),
+                                        ('e', 'pkg-2.0'),
+                                        ('f', '/no/such/dir')], names),
+                         [('e', 'target pkg-2.0 is not installed by this '
+                           'package list'),
+                          ('f', 'target /no/such/dir does not exist')])
+
+    def test_check(self):
+        "Test checking a package list without installing it."
+        installer = Installer(self.version_file, inst_dir=None, jobs=4)
+        problems = dict(installer.check(('jh', 'ccs')))
+        self.assertEqual(sorted(problems),
+                         ['[ccs] executable.ts8-shell',
+                          '[ccs] github.jh-ccs-utils 0.3.0',
+                          '[ccs] org-lsst-ccs-subsystem-ts8-gui 1.1.14',
+                          '[ccs] symlink.ccs-shell',
+                          '[eups_packages] eotest 1.4.2'])
+        self.assertIn('org-lsst-ccs-power-main',
+                      problems['[ccs] symlink.ccs-shell'])
+        self.assertEqual(problems['[ccs] github.jh-ccs-utils 0.3.0'],
+                         'no branch or tag 0.3.0')
+        self.assertEqual(len(installer.check(('jh',))), 1)
+
+    def test_check_command(self):
+        "Test install.py --check without install directories."
+        with open(self.version_file, 'w') as output:
+            output.write(_cli_versions)
+        output = io.StringIO()
+        argv = ['install.py', '--check', self.version_file]
+        # install.py runs as a new module, but inherits the GitHub
+        # organization from InstallerBase.
+        with mock.patch.object(sys, 'argv', argv), \
+             mock.patch.object(InstallerBase, '_github_org',
+                               self.server.github_org()), \
+             redirect_stdout(output):
+            with self.assertRaises(SystemExit) as context:
+                runpy.run_path('../bin/install.py', run_name='__main__')
+        self.assertEqual(context.exception.code, 1)
+        lines = output.getvalue().splitlines()
+        self.assertEqual(lines[-3:],
+                         ['[eups_packages] eotest 1.4.2: HTTP 404 Not Found',
+                          '[ccs] github.jh-ccs-utils 0.3.0: no branch or '
+                          'tag 0.3.0',
+                          '2 problems found.'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+sys.path.insert(0, '../python')
+from inspect_repos import GitHubAPI
+from release_drift import read_index, version_key, pin_status, \
+    latest_releases, drift, format_matrix, proposed_edits
+from standin_server import StandInServer
+
+_site_a = """[jh]
+harnessed-jobs = 0.4.66
+lcatr-harness = 0.18.2
+
+[eups_packages]
+eotest = 1.4.2
+
+[ccs]
+org-lsst-ccs-subsystem-ts8-main = 1.1.5
+github.config_files = 0.0.7
+symlink.ts8 = org-lsst-ccs-subsystem-ts8-main
+"""
+
+_site_b = """[jh]
+harnessed-jobs = 0.4.94
+# Pinned for the REBs.
+lcatr-harness = 0.18.2
+
+[packages]
+REB_firmware = master
+
+[ccs]
+nexus.org-lsst-ccs-subsystem-ts8-main = 1.1.14
+"""
+
+class ReleaseDriftTestCase(unittest.TestCase):
+    "TestCase class for the package list drift report."
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.package_lists = []
+        for name, contents in (('site_a_versions.txt', _site_a),
+                               ('site_b_versions.txt', _site_b),
+                               ('typo_versions.txt', 'B' + _site_a)):
+            self.package_lists.append(os.path.join(self.tmp_dir, name))
+            with open(self.package_lists[-1], 'w') as output:
+                output.write(contents)
+        self.server = StandInServer().start()
+        for repo, tags in (('harnessed-jobs', ['0.4.94', '0.4.66']),
+                           ('lcatr-harness', ['0.18.2']),
+                           ('config_files', ['0.0.7', '0.0.15'])):
+            self.server.add_repo('lsst-camera-dh', repo, [
+                (tag, '2020-01-%02dT00:00:00Z' % (len(tags) - i))
+                for i, tag in enumerate(tags)])
+        self.server.add_artifact('org-lsst-ccs-subsystem-ts8-main',
+                                 ['1.1.5', '1.1.14', '1.2.0-SNAPSHOT'])
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_version_key(self):
+        "Test the ordering of version strings."
+        versions = ['0.0.9', 'v0.0.10', '1.1.0-rc', '1.1.0', '4.0.8-3',
+                    '4.0.10']
+        self.assertEqual(sorted(reversed(versions), key=version_key),
+                         versions)
+        self.assertEqual([pin_status(x, '0.4.94') for x in
+                          ('0.4.66', '0.4.94', '1.0', 'LSSTTD-992-test1',
+                           '1.2.0-SNAPSHOT')],
+                         ['behind', 'current', 'ahead', 'unpinned',
+                          'unpinned'])
+        self.assertEqual(pin_status('1.0', None), 'unknown')
+
+    def test_drift(self):
+        "Test the index, the drift matrix and the proposed edits."
+        index, errors = read_index(self.package_lists)
+        self.assertEqual(list(errors), ['typo_versions.txt'])
+        self.assertEqual(index[('jh', 'lcatr-harness')],
+                         {'0.18.2': ['site_a_versions.txt',
+                                     'site_b_versions.txt']})
+        self.assertNotIn(('ccs', 'symlink.ts8'), index)
+
+        api = GitHubAPI(self.server.api_url)
+        latest = latest_releases(api, self.server.nexus_base)
+        self.assertEqual(latest[('nexus', 'org-lsst-ccs-subsystem-ts8-main')],
+                         '1.1.14')
+        rows = dict(((x['section'], x['package']), x)
+                    for x in drift(index, latest))
+        self.assertEqual(rows[('jh', 'harnessed-jobs')]['pins'],
+                         {'site_a_versions.txt': ('0.4.66', 'behind'),
+                          'site_b_versions.txt': ('0.4.94', 'current')})
+        self.assertEqual(rows[('ccs', 'github.config_files')]['latest'],
+                         '0.0.7')
+        self.assertEqual(rows[('eups_packages', 'eotest')]['pins'],
+                         {'site_a_versions.txt': ('1.4.2', 'unknown')})
+        self.assertEqual(rows[('packages', 'REB_firmware')]['source'],
+                         ('github', 'lsst-camera-electronics',
+                          'REB_firmware'))
+
+        list_names = ['site_a_versions.txt', 'site_b_versions.txt']
+        matrix = format_matrix(list(rows.values()), list_names, errors)
+        self.assertIn('0.4.66*', matrix)
+        self.assertNotIn('[jh] lcatr-harness', matrix)
+        self.assertIn('typo_versions.txt was not read', matrix)
+        self.assertIn('[jh] lcatr-harness',
+                      format_matrix(list(rows.values()), list_names,
+                                    show_all=True))
+
+        diff = proposed_edits(self.package_lists, list(rows.values()),
+                              root=self.tmp_dir)
+        self.assertEqual([x for x in diff.splitlines()
+                          if x[:1] in '+-' and x[:3] not in ('+++', '---')],
+                         ['-harnessed-jobs = 0.4.66',
+                          '+harnessed-jobs = 0.4.94',
+                          '-org-lsst-ccs-subsystem-ts8-main = 1.1.5',
+                          '+org-lsst-ccs-subsystem-ts8-main = 1.1.14'])
+        self.assertIn('--- a/site_a_versions.txt', diff)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import os
+import sys
+import json
+import shutil
+import tempfile
+import subprocess
+import unittest
+sys.path.insert(0, '../bin')
+from fetch import download_and_extract, open_url
+from standin_server import StandInServer
+
+class StandInServerTestCase(unittest.TestCase):
+    "TestCase class for the GitHub and Nexus stand-in server."
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.server = StandInServer(files=2, file_size=1000,
+                                    hj_folders=('BNL_T03', 'SLAC')).start()
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_github_archive(self):
+        "Test the synthetic GitHub release tarballs."
+        url = '%s/eotest/archive/0.0.31.tar.gz' % self.server.github_org()
+        download_and_extract(url, self.tmp_dir)
+        package_dir = os.path.join(self.tmp_dir, 'eotest-0.0.31')
+        self.assertEqual(sorted(os.listdir(package_dir)),
+                         ['data', 'harnessed_jobs', 'python', 'ups'])
+        self.assertEqual(os.path.getsize(os.path.join(package_dir, 'data',
+                                                      'file000.dat')), 1000)
+        url = ('%s/harnessed-jobs/archive/0.4.90.tar.gz'
+               % self.server.github_org())
+        download_and_extract(url, self.tmp_dir)
+        self.assertTrue(os.path.isdir(os.path.join(
+            self.tmp_dir, 'harnessed-jobs-0.4.90', 'SLAC')))
+
+    def test_nexus(self):
+        "Test the Nexus search and download endpoints."
+        query = '&maven.artifactId=org-lsst-ccs-console&maven.baseVersion=1.0'
+        search_url = (self.server.nexus_url.replace(
+            '/search/assets/download?', '/search/assets?') + query)
+        with open_url(search_url) as response:
+            item = json.loads(response.read().decode())['items'][0]
+        for url in (self.server.nexus_url + query, item['downloadUrl']):
+            download_and_extract(url, self.tmp_dir, archive_format='zip')
+            script = os.path.join(self.tmp_dir, 'org-lsst-ccs-console-1.0',
+                                  'bin', 'CCSbootstrap.sh')
+            self.assertTrue(os.access(script, os.X_OK))
+        self.assertEqual(self.server.requests, 3)
+
+    def test_git_clone(self):
+        "Test cloning a repository over dumb HTTP."
+        dest = os.path.join(self.tmp_dir, 'config_files-master')
+        subprocess.check_call(['git', 'clone', '-q', '--branch', 'master',
+                               self.server.github_org() + '/config_files',
+                               dest])
+        self.assertTrue(os.path.isfile(os.path.join(dest, 'ups',
+                                                    'config_files.table')))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import sys
+import unittest
+sys.path.insert(0, '../bin')
+from upgrade_plan import read_versions, plan_upgrade, changed, format_plan
+
+class UpgradePlanTestCase(unittest.TestCase):
+    "TestCase class for the upgrade planner."
+
+    def setUp(self):
+        self.installed = read_versions('../packageLists/BNL_TS8_1_versions.txt')
+        self.target = read_versions(
+            '../packageLists/BNL_TS8_servers_versions.txt')
+
+    def test_read_versions(self):
+        "Test that version strings are kept exactly as written."
+        self.assertEqual(self.installed['jh']['lcatr-schema'], '0.5.2')
+        self.assertEqual(self.installed['ccs']['symlink.ts'],
+                         'org-lsst-ccs-subsystem-teststand-main')
+
+    def test_plan_upgrade(self):
+        "Test the actions needed to go from one package list to another."
+        plan = plan_upgrade(self.installed, self.target)
+        actions = dict(((x.section, x.package), x.action) for x in plan)
+        self.assertEqual(actions[('jh', 'harnessed-jobs')], 'upgrade')
+        self.assertEqual(actions[('jh', 'lcatr-harness')], 'keep')
+        self.assertEqual(actions[('packages', 'camera-model')], 'install')
+        self.assertEqual(actions[('ccs', 'org-lsst-ccs-localdb-main')], 'keep')
+        self.assertEqual(actions[('ccs', 'org-lsst-ccs-subsystem-power-main')],
+                         'remove')
+        self.assertEqual(actions[('ccs', 'symlink.ccs-console')], 'relink')
+        self.assertEqual(actions[('ccs', 'symlink.localdb')], 'keep')
+
+        # Links come after every package action.
+        sections = [x.package.startswith('symlink.') for x in plan]
+        self.assertEqual(sections, sorted(sections))
+
+        self.assertNotIn(('jh', 'lcatr-harness'), changed(plan))
+        self.assertIn(('jh', 'harnessed-jobs'), changed(plan))
+        self.assertNotIn('lcatr-harness', format_plan(plan))
+
+    def test_snapshot_and_stack(self):
+        "Test SNAPSHOT refreshes and EUPS rebuilds for a new stack."
+        plan = plan_upgrade(self.installed, self.installed)
+        self.assertEqual(changed(plan),
+                         set([('ccs', 'org-lsst-ccs-subsystem-console')]))
+        target = dict(self.installed, dmstack=dict(stack_dir='/new/stack'))
+        actions = dict(((x.section, x.package), x.action)
+                       for x in plan_upgrade(self.installed, target))
+        self.assertEqual(actions[('eups_packages', 'eotest')], 'rebuild')
+        self.assertEqual(actions[('dmstack', 'stack_dir')], 'update')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import os
+import sys
+import glob
+import time
+import shutil
+import operator
+import tempfile
+import unittest
+import configparser
+sys.path.insert(0, '../bin')
+from version_file import VersionFile, Parfile, read_version_file, \
+    load_version_files
+
+class VersionFileTestCase(unittest.TestCase):
+    "TestCase class for package lists parsed once."
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'versions.txt')
+        with open(self.path, 'w') as output:
+            output.write('[jh]\nharnessed-jobs = 0.4.66\n\n'
+                         '[eups_packages]\neotest = 1.10\ncount = 3\n'
+                         'stack = None\n')
+        # Make the file old enough to be cached.
+        mtime = time.time() - 10
+        os.utime(self.path, (mtime, mtime))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_sections(self):
+        "Test the typed, read-only section views."
+        versions = VersionFile(self.path)
+        self.assertEqual(versions.sections(), ['jh', 'eups_packages'])
+        pars = versions['eups_packages']
+        self.assertEqual(dict(pars), {'eotest': 1.1, 'count': 3,
+                                      'stack': None})
+        self.assertEqual(pars.exact('eotest'), '1.10')
+        self.assertIs(versions.section('eups_packages'), pars)
+        self.assertEqual(versions.section('eups_packages',
+                                          exact=['eotest'])['eotest'], '1.10')
+        self.assertRaises(TypeError, operator.setitem, pars, 'eotest', '1.11')
+        self.assertRaises(configparser.NoSectionError, versions.section,
+                          'packages')
+        self.assertEqual(versions.as_dict()['eups_packages']['count'], '3')
+        self.assertEqual(Parfile(self.path, 'jh')['harnessed-jobs'], '0.4.66')
+        self.assertRaises(RuntimeError, VersionFile,
+                          os.path.join(self.tmp_dir, 'missing.txt'))
+
+    def test_read_once(self):
+        "Test that a file is parsed again only when it changes."
+        versions = read_version_file(self.path)
+        self.assertIs(read_version_file(self.path), versions)
+        with open(self.path, 'a') as output:
+            output.write('[packages]\nREB_firmware = master\n')
+        changed = read_version_file(self.path)
+        self.assertIsNot(changed, versions)
+        self.assertIn('packages', changed)
+        # A file modified just now is not trusted to be unchanged.
+        self.assertIsNot(read_version_file(self.path), changed)
+
+    def test_load_package_lists(self):
+        "Test loading all of the package lists at once."
+        paths = sorted(glob.glob('../packageLists/*.txt'))
+        version_files, errors = load_version_files(paths, jobs=4)
+        self.assertEqual(len(version_files) + len(errors), len(paths))
+        self.assertEqual(list(version_files) + list(errors),
+                         [x for x in paths if x in version_files] +
+                         [x for x in paths if x in errors])
+        for versions in version_files.values():
+            self.assertTrue(versions.sections())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import os
+import sys
+import glob
+import shutil
+import tempfile
+import unittest
+sys.path.insert(0, '../bin')
+from wheel_cache import WheelCache
+
+try:
+    import wheel
+except ImportError:
+    wheel = None
+
+class WheelCacheTestCase(unittest.TestCase):
+    "TestCase class for the lcatr wheel cache."
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.source_dir = os.path.join(self.tmp_dir, 'lcatr-schema-0.1')
+        os.makedirs(os.path.join(self.source_dir, 'lcatr', 'schema'))
+        open(os.path.join(self.source_dir, 'lcatr', 'schema', '__init__.py'),
+             'w').close()
+        with open(os.path.join(self.source_dir, 'setup.py'), 'w') as output:
+            output.write('from setuptools import setup\n'
+                         'setup(name="lcatr-schema", version="0.1", '
+                         'packages=["lcatr.schema"])\n')
+        self.wheels = WheelCache(os.path.join(self.tmp_dir, 'wheels'),
+                                 sys.executable)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_interpreter_id(self):
+        "Test that each interpreter gets its own wheel directory."
+        wheel_dir = self.wheels.wheel_dir('lcatr-schema', '0.1')
+        self.assertEqual(len(self.wheels.interpreter_id), 16)
+        self.assertTrue(wheel_dir.endswith(os.path.join(
+            self.wheels.interpreter_id, 'lcatr-schema', '0.1')))
+        self.assertIsNone(self.wheels.get('lcatr-schema', '0.1'))
+
+    @unittest.skipIf(wheel is None, 'building wheels needs the wheel package')
+    def test_wheel_install(self):
+        "Test building, reusing and installing a wheel."
+        path = self.wheels.wheel('lcatr-schema', '0.1', self.source_dir)
+        mtime = os.stat(path).st_mtime
+        shutil.rmtree(self.source_dir)
+        self.assertEqual(self.wheels.wheel('lcatr-schema', '0.1',
+                                           self.source_dir), path)
+        self.assertEqual(os.stat(path).st_mtime, mtime)
+        prefix = os.path.join(self.tmp_dir, 'inst')
+        self.wheels.install(path, prefix)
+        self.assertTrue(glob.glob(os.path.join(
+            prefix, 'lib', 'python*', 'site-packages', 'lcatr', 'schema')))
+
+if __name__ == '__main__':
+    unittest.main()